@@ -36,6 +36,7 @@ APPS = [
 INSTALLED_APPS += APPS
 
 MIDDLEWARE = [
+    'project_tracking.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'project_tracking.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'project_tracker.urls'
@@ -76,6 +78,16 @@ DATABASES = {
     },
 }
 
+# the GET requests of the users, projects and tasks endpoints read from a random database of DATABASES, those are
+# aliases of DATABASES with read only copies of default. a user that changes its data reads from default during
+# PIN_SECONDS, which must be longer than the replication lag. the pins are kept in the cache, so with replicas
+# CACHES must be shared by all the processes (check project_tracking.E001)
+DATABASE_ROUTERS = ['project_tracking.replicas.ReadReplicaRouter']
+READ_REPLICAS = {
+    'DATABASES': [],
+    'PIN_SECONDS': 10,
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -111,10 +123,86 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+# the project summaries are cached by data version, with several worker processes use a cache shared between them,
+# e.g. django.core.cache.backends.filebased.FileBasedCache, so a change made by a process invalidates the others.
+# with the local memory cache each process keeps the summaries only for a few seconds (LOCAL_CACHE_TIMEOUT of
+# project_tracking.summaries), they may miss the changes made by the other processes meanwhile.
+# the users of the access tokens (JWT_USER_CACHE) are only cached with a shared cache, and a shared cache is required
+# to read from READ_REPLICAS. only memcached or redis save the user lookups: with LocMemCache or DummyCache the users
+# are never cached, and with DatabaseCache the auth stamp read on every request is itself one more query
+# (manage.py bench_auth shows the queries per request of the configured cache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
+# orjson and msgpack are optional, without them the json classes fall back to the rest framework ones
+# and application/msgpack is not offered
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'project_tracking.authentication.CachedJWTAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'project_tracking.renderers.ORJSONRenderer',
+        'project_tracking.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'project_tracking.renderers.ORJSONParser',
+        'project_tracking.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'project_tracking.renderers.AvailableContentNegotiation',
+}
+
+# every request is logged as json to REQUEST_METRICS['LOG_FILE'], with a warning when it passes a threshold.
+# manage.py request_metrics_summary aggregates the log by endpoint
+REQUEST_METRICS = {
+    'LOG_FILE': os.path.join(TEMP_PATH, 'project_tracker_metrics.log'),
+    'QUERY_THRESHOLD': 30,
+    'DUPLICATE_QUERY_THRESHOLD': 10,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+# staff users profile a request sending the X-Profile header, SAMPLE_RATE profiles a random fraction of all of them.
+# manage.py profile_report merges the dumps by endpoint
+REQUEST_PROFILING = {
+    'DIRECTORY': os.path.join(TEMP_PATH, 'project_tracker_profiles'),
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Profile',
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'request_metrics': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': REQUEST_METRICS['LOG_FILE'],
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'project_tracking.metrics': {
+            'handlers': ['request_metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# users resolved from the access tokens are kept in memory, the timeout is capped to ACCESS_TOKEN_LIFETIME.
+# they are invalidated through the cache, so nothing is kept unless CACHES is shared by the processes, and
+# every request still makes one cache round trip for the auth stamp of the user
+JWT_USER_CACHE = {
+    'MAX_SIZE': 1000,
+    'TIMEOUT': timedelta(minutes=5),
 }
 
 
@@ -143,4 +231,7 @@ SIMPLE_JWT = {
 try:
     exec(open(os.path.join(BASE_DIR, 'project_tracker/settings_local.py')).read())
 except IOError:
-    raise Exception('error reading local settings')
\ No newline at end of file
+    raise Exception('error reading local settings')
+
+# replica alias of the local settings, by default the default database itself, the tests use it as a mirror
+DATABASES.setdefault('replica', dict(DATABASES['default'], TEST={'MIRROR': 'default'}))
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ProjectTrackingConfig(AppConfig):
     name = 'project_tracking'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
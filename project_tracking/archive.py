@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import bump_data_version
+from .models import ArchivedTask, Project, Task, TimeRollup
+
+ARCHIVE_BATCH_SIZE = 200
+PARTITION_NAME = 'project_tracking_archivedtask_p{0:04d}{1:02d}'
+POSTGRESQL_PARTITION_SQL = """
+CREATE TABLE IF NOT EXISTS {name} PARTITION OF project_tracking_archivedtask FOR VALUES FROM (%s) TO (%s)
+"""
+
+
+def archivable_roots(cutoff):
+    """
+    :return: queryset with the ids of the root tasks whose whole continuation chain was closed before the cutoff,
+     ordered by id
+    """
+    unfinished = Task.objects.filter(Q(ended_at__isnull=True) | Q(ended_at__gte=cutoff), chain_root__isnull=False)
+    return Task.objects.filter(chain_root__isnull=True, project__isnull=False, ended_at__lt=cutoff).exclude(
+        id__in=unfinished.values('chain_root')).order_by('id').values_list('id', flat=True)
+
+
+def create_month_partitions(started_ats):
+    """
+    create the missing postgresql partitions of the archive for the months of the given datetimes
+    """
+    months = {(value.astimezone(timezone.utc).year, value.astimezone(timezone.utc).month) for value in started_ats}
+    with connection.cursor() as cursor:
+        for year, month in sorted(months):
+            starts_at = datetime(year, month, 1, tzinfo=timezone.utc)
+            ends_at = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+            cursor.execute(POSTGRESQL_PARTITION_SQL.format(name=PARTITION_NAME.format(year, month)),
+                           [starts_at, ends_at])
+
+
+def archive_chains(root_ids, cutoff, dry_run=False):
+    """
+    move the tasks of the continuation chains to the archive in a single transaction. the chains are checked again
+    with the roots locked, and the chains whose TimeRollup does not match their task rows are left out, because once
+    archived their seconds are only kept in the TimeRollup of the project.
+    :return: number of archived chains, number of archived tasks and list of the root ids left out because their
+     TimeRollup is out of sync
+    """
+    with transaction.atomic():
+        root_ids = list(Task.objects.select_for_update().filter(id__in=root_ids).values_list('id', flat=True))
+        root_ids = list(archivable_roots(cutoff).filter(id__in=root_ids))
+        chains = Task.objects.filter(Q(id__in=root_ids) | Q(chain_root__in=root_ids))
+        expected = {root_id: seconds for (project_id, root_id), seconds in chains.closed_seconds_by_chain().items()}
+        stored = dict(TimeRollup.objects.filter(chain_root__in=root_ids).values_list('chain_root_id', 'closed_seconds'))
+        out_of_sync = [root_id for root_id in root_ids if expected.get(root_id, 0) != stored.get(root_id, 0)]
+        if out_of_sync:
+            root_ids = sorted(set(root_ids) - set(out_of_sync))
+            chains = Task.objects.filter(Q(id__in=root_ids) | Q(chain_root__in=root_ids))
+
+        archived_at = timezone.now()
+        archived = [ArchivedTask(id=task.id, project_id=task.project_id, cloned_from_id=task.cloned_from_id,
+                                 chain_root_id=task.chain_root_id, name=task.name, started_at=task.started_at,
+                                 ended_at=task.ended_at, seconds_paused=task.seconds_paused,
+                                 seconds=task.elapsed_seconds, updated_at=task.updated_at, archived_at=archived_at)
+                    for task in chains.with_elapsed_seconds().order_by('id')]
+        if archived and not dry_run:
+            if connection.vendor == 'postgresql':
+                create_month_partitions(task.started_at for task in archived)
+            ArchivedTask.objects.bulk_create(archived)
+            chains.delete(archived=True)
+            # the totals do not change, but the cached summaries hold the ids of the root tasks
+            user_ids = Project.objects.filter(id__in={task.project_id for task in archived}).values_list(
+                'user_id', flat=True)
+            for user_id in set(user_ids) - {None}:
+                bump_data_version(user_id)
+    return len(root_ids), len(archived), out_of_sync
+
+
+def archive_tasks(cutoff, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """
+    move the continuation chains closed before the cutoff from the task table to the archive, batch_size chains
+    per transaction. the open and recent tasks stay in the task table, the reports read both tables
+    :param dry_run: True to count the tasks that would be archived without moving them
+    :return: dict with the archived chains and tasks, and the root ids of the chains left out because their
+     TimeRollup is out of sync
+    """
+    result = {'chains': 0, 'tasks': 0, 'out_of_sync': []}
+    last_id = 0
+    while True:
+        root_ids = list(archivable_roots(cutoff).filter(id__gt=last_id)[:batch_size])
+        if not root_ids:
+            return result
+        last_id = root_ids[-1]
+        chains, tasks, out_of_sync = archive_chains(root_ids, cutoff, dry_run=dry_run)
+        result['chains'] += chains
+        result['tasks'] += tasks
+        result['out_of_sync'].extend(out_of_sync)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import copy
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .cache import is_shared_cache
+
+AUTH_STAMP_KEY = 'project_tracking:auth_stamp:{}'
+
+
+def get_auth_stamp(user_id):
+    """
+    :return: the current auth stamp of the user, kept in the django cache. it is shared by all the processes only when
+     the cache is, see is_shared_cache
+    """
+    key = AUTH_STAMP_KEY.format(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, uuid4().hex, None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump_auth_stamp(user_id):
+    """
+    invalidate the cached authentication of the user in every process, now and again when the current transaction
+    is committed, so a user read before the commit is not kept with the new stamp
+    """
+    key = AUTH_STAMP_KEY.format(user_id)
+    cache.set(key, uuid4().hex, None)
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+
+class UserLRUCache(object):
+    """
+    thread safe LRU of user id -> (user, auth stamp, expiration time) with a bounded size
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, stamp):
+        """
+        :return: the cached user when it has not expired and the auth stamp is still the current one
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, user_stamp, expires_at = entry
+            if user_stamp != stamp or expires_at <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user, stamp):
+        with self.lock:
+            self.entries[user_id] = (user, stamp, time.monotonic() + self.timeout)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def get_cache_settings():
+    """
+    :return: max size and timeout in seconds of the user cache, the timeout is never longer than the access token
+     lifetime of SIMPLE_JWT
+    """
+    options = getattr(settings, 'JWT_USER_CACHE', {})
+    timeout = options.get('TIMEOUT', api_settings.ACCESS_TOKEN_LIFETIME).total_seconds()
+    return options.get('MAX_SIZE', 1000), min(timeout, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the users resolved from the validated tokens in a small LRU of the process,
+    so the requests of a user don't read auth_user every time. the entries are dropped when they expire or when the
+    auth stamp of the user changes, which happens on every save or delete of the user (password change,
+    deactivation). the users updated with QuerySet.update must call bump_auth_stamp.
+    the stamps must be seen by every process, so with a local memory cache the users are not cached and
+    it works like JWTAuthentication
+    """
+    user_cache = UserLRUCache(*get_cache_settings())
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or not is_shared_cache():
+            return super().get_user(validated_token)
+        stamp = get_auth_stamp(user_id)
+        user = self.user_cache.get(user_id, stamp)
+        if user is None:
+            user = super().get_user(validated_token)
+            self.user_cache.set(user_id, user, stamp)
+        # every request gets its own instance, so nothing set on request.user is shared
+        return copy.copy(user)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import math
+import platform
+import subprocess
+import django
+from django.db import connection
+from django.utils import timezone
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, fraction):
+    """
+    :return: nearest rank percentile of the sorted values
+    """
+    return values[max(int(math.ceil(fraction * len(values))) - 1, 0)]
+
+
+def summarize_samples(samples):
+    """
+    :param samples: list of (milliseconds, queries, ok) of the requests of a route
+    :return: dict with the count, errors, latency percentiles and queries of the samples
+    """
+    milliseconds = sorted(sample[0] for sample in samples)
+    queries = [sample[1] for sample in samples]
+    summary = {
+        'count': len(samples),
+        'errors': sum(1 for sample in samples if not sample[2]),
+        'mean_ms': round(sum(milliseconds) / len(samples), 3),
+        'max_ms': round(milliseconds[-1], 3),
+        'queries': round(sum(queries) / len(samples), 2),
+        'max_queries': max(queries),
+    }
+    for value in PERCENTILES:
+        summary['p{}_ms'.format(value)] = round(percentile(milliseconds, value / 100.0), 3)
+    return summary
+
+
+def git_revision():
+    """
+    :return: commit of the working tree, None when it is not a git checkout
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    :return: dict with what the results depend on besides the code, to tell apart the runs that can be compared
+    """
+    return {
+        'revision': git_revision(),
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+
+
+def compare_routes(routes, baseline_routes):
+    """
+    :return: list of (route, p50 ratio, p95 ratio, queries difference) of the routes present in both results,
+     the ratios are current / baseline
+    """
+    comparison = []
+    for route, summary in routes.items():
+        baseline = baseline_routes.get(route)
+        if baseline is None:
+            continue
+        comparison.append((
+            route,
+            summary['p50_ms'] / max(baseline['p50_ms'], 1e-6),
+            summary['p95_ms'] / max(baseline['p95_ms'], 1e-6),
+            summary['queries'] - baseline['queries'],
+        ))
+    return comparison
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from uuid import uuid4
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+DATA_VERSION_KEY = 'project_tracking:data_version:{}'
+SUMMARIES_KEY = 'project_tracking:summaries:{}:{}'
+
+
+def is_shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """
+    :return: False when the cache lives in the memory of each process, or keeps nothing, so what a process sets is not
+     seen by the others
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def data_version_key(user_id):
+    return DATA_VERSION_KEY.format(user_id)
+
+
+def get_data_versions(user_ids):
+    """
+    :return: dict of user id and current data version, the missing versions are created.
+     the versions are random so a version lost by the cache never matches the entries cached before
+    """
+    keys = {data_version_key(user_id): user_id for user_id in user_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for key, user_id in keys.items():
+        if user_id not in versions:
+            cache.add(key, uuid4().hex, None)
+            versions[user_id] = cache.get(key)
+    return versions
+
+
+def bump_data_version(user_id):
+    """
+    invalidate the cached data of the user. the version changes again when the current transaction is committed,
+    so the entries cached by other requests that read the data before the commit are not used
+    """
+    if user_id is None:
+        return
+    key = data_version_key(user_id)
+    cache.set(key, uuid4().hex, None)
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+
+def summaries_key(user_id, version):
+    return SUMMARIES_KEY.format(user_id, version)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from django.core.checks import Error, register
+from .cache import is_shared_cache
+from .replicas import get_replica_settings
+
+
+@register()
+def check_read_replicas_cache(app_configs, **kwargs):
+    """
+    the users pinned to the primary are kept in the django cache, every process must see the pins
+    """
+    if get_replica_settings()['DATABASES'] and not is_shared_cache():
+        return [Error(
+            'READ_REPLICAS needs a cache shared by all the processes',
+            hint='a pin set by one process is not seen by the others with a local memory cache, '
+                 'configure CACHES with memcached, redis, the database or the file based backend',
+            id='project_tracking.E001',
+        )]
+    return []
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin(object):
+    """
+    answer the GET requests with 304 Not Modified, before anything is serialized, when the ETag or Last-Modified
+    sent by the client match the watermarks of the data. the watermarks are the dicts returned by the watermark method
+    of the querysets, the ETag changes when any updated_at or count changes, and it is different for every media type.
+    Last-Modified is the last updated_at, it misses the deletes and the changes made in the same second, so
+    If-Modified-Since is ignored when If-None-Match is sent.
+    the responses with a running task have the X-Running-Task and X-Running-Since headers, the spend time of that
+    task keeps growing after the response date without changing the ETag.
+    """
+
+    def get_etag(self, request, watermarks):
+        renderer = getattr(request, 'accepted_renderer', None)
+        state = [request.user.pk, request.get_full_path(), renderer.media_type if renderer else None]
+        state += [sorted(watermark.items()) for watermark in watermarks]
+        return '"{}"'.format(hashlib.md5(repr(state).encode()).hexdigest())
+
+    def conditional_get(self, request, watermarks, get_response):
+        """
+        :param get_response: callable that builds the response when the client data is not current
+        :return: 304 response or the response of get_response, with the ETag, Last-Modified and running task headers
+        """
+        headers = {'ETag': self.get_etag(request, watermarks)}
+        last_modified = max((watermark['updated_at'] for watermark in watermarks if watermark['updated_at']),
+                            default=None)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        if timestamp is not None:
+            headers['Last-Modified'] = http_date(timestamp)
+        for watermark in watermarks:
+            if watermark.get('running_task'):
+                headers['X-Running-Task'] = str(watermark['running_task'])
+                headers['X-Running-Since'] = watermark['running_since'].isoformat()
+
+        response = get_conditional_response(request, etag=headers['ETag'], last_modified=timestamp)
+        if response is None:
+            response = get_response()
+        for header, value in headers.items():
+            response[header] = value
+        patch_vary_headers(response, ('Accept',))
+        return response
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import csv
+import heapq
+import json
+from .models import ArchivedTask, Task
+
+EXPORT_FIELDS = ('id', 'project', 'name', 'started_at', 'ended_at', 'paused_at', 'seconds_paused', 'elapsed_seconds')
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo(object):
+    """
+    file like object for csv.writer, write returns the line instead of buffering it
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    :return: generator of tuples with the EXPORT_FIELDS of the user tasks, archived or not, ordered by id.
+     the rows are fetched in chunks (with a server side cursor on postgresql), so the tasks are never
+     loaded in memory all at once
+    """
+    query_set = Task.objects.filter(project__user=user).with_elapsed_seconds().order_by('id').values_list(
+        'id', 'project__name', 'name', 'started_at', 'ended_at', 'paused_at', 'seconds_paused', 'elapsed_seconds')
+    archived = ArchivedTask.objects.filter(project__user=user).order_by('id').values_list(
+        'id', 'project__name', 'name', 'started_at', 'ended_at', 'seconds_paused', 'seconds')
+    archived_rows = ((task_id, project, name, started_at, ended_at, None, seconds_paused, seconds)
+                     for task_id, project, name, started_at, ended_at, seconds_paused, seconds
+                     in archived.iterator(chunk_size=chunk_size))
+    return heapq.merge(query_set.iterator(chunk_size=chunk_size), archived_rows)
+
+
+def format_export_value(value):
+    """
+    :return: the value in iso format for the datetimes, unchanged otherwise
+    """
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def write_csv_rows(rows):
+    """
+    :return: generator of csv lines, the first one is the header
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([format_export_value(value) for value in row])
+
+
+def write_ndjson_rows(rows):
+    """
+    :return: generator of json objects, one per line
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, map(format_export_value, row)))) + '\n'
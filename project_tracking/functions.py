@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Func, IntegerField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class DurationSeconds(Func):
+    """
+    Whole seconds of a duration expression, truncated like int(timedelta.total_seconds())
+    """
+    output_field = IntegerField()
+    template = 'CAST(TRUNC(EXTRACT(EPOCH FROM %(expressions)s)) AS BIGINT)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # sqlite stores durations as integer microseconds
+        return self.as_sql(compiler, connection, template='(%(expressions)s / 1000000)', **extra_context)
+
+
+def elapsed_seconds(prefix='', now=None):
+    """
+    database version of Task.get_total_task_seconds, the task ends at ended_at,
+    paused_at or the current datetime, in that order.
+    :param prefix: lookup prefix to reach the task fields from another model, e.g. 'task__'
+    :param now: datetime used for the tasks that are still running
+    """
+    if now is None:
+        now = timezone.now()
+    end = Coalesce(F(prefix + 'ended_at'), F(prefix + 'paused_at'), Value(now, output_field=DateTimeField()))
+    return DurationSeconds(ExpressionWrapper(end - F(prefix + 'started_at'), output_field=DurationField()))
+
+
+class Now(Func):
+    """
+    current database datetime, with fractional seconds on sqlite
+    """
+    template = 'CURRENT_TIMESTAMP'
+    output_field = DateTimeField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='STATEMENT_TIMESTAMP()', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="STRFTIME('%%%%Y-%%%%m-%%%%d %%%%H:%%%%M:%%%%f', 'NOW')",
+                           **extra_context)
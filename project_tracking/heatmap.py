@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+import numpy as np
+from django.db.models import DateTimeField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import ArchivedTask, Task
+from .reports import local_midnight
+
+HOURS = 24
+MAX_HEATMAP_DAYS = 731
+
+
+def day_starts(start, end, time_zone=None):
+    """
+    :return: array with the epoch seconds of the local midnight of every date from start to the day after end
+    """
+    time_zone = time_zone or timezone.get_current_timezone()
+    days = (end - start).days + 2
+    return np.array([local_midnight(start + timedelta(days=day), time_zone).timestamp() for day in range(days)])
+
+
+def hour_buckets(midnights):
+    """
+    :return: arrays of shape (days, 24) with the start and end epoch seconds of every hour,
+     the hours are clipped to the end of their day for the days shorter than 24 hours
+    """
+    day_ends = midnights[1:, None]
+    starts = np.minimum(midnights[:-1, None] + np.arange(HOURS) * 3600.0, day_ends)
+    ends = np.minimum(starts + 3600.0, day_ends)
+    return starts, ends
+
+
+def task_intervals(user, start, end, now=None):
+    """
+    load the user tasks that overlap the dates, archived or not, each task runs from started_at to ended_at,
+    paused_at or now like Task.get_total_task_seconds
+    :return: arrays with the start and end epoch seconds and the seconds paused of the tasks
+    """
+    now = now or timezone.now()
+    time_zone = timezone.get_current_timezone()
+    starts_at = local_midnight(start, time_zone)
+    ends_at = local_midnight(end + timedelta(days=1), time_zone)
+    rows = Task.objects.filter(
+        project__user=user, started_at__lt=ends_at
+    ).annotate(
+        task_end=Coalesce('ended_at', 'paused_at', Value(now, output_field=DateTimeField()))
+    ).filter(task_end__gt=starts_at).values_list('started_at', 'task_end', 'seconds_paused')
+    rows = list(rows) + list(ArchivedTask.objects.filter(
+        project__user=user, started_at__lt=ends_at, ended_at__gt=starts_at
+    ).values_list('started_at', 'ended_at', 'seconds_paused'))
+    starts = np.fromiter((row[0].timestamp() for row in rows), dtype=float, count=len(rows))
+    ends = np.fromiter((row[1].timestamp() for row in rows), dtype=float, count=len(rows))
+    seconds_paused = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+    return starts, np.maximum(ends, starts), seconds_paused
+
+
+def step_integral(points, levels, times):
+    """
+    :param points: sorted times where the step function changes
+    :param levels: value of the step function from each point to the next one, the last one must be 0
+    :return: integral of the step function from the first point up to each of the times
+    """
+    if not len(points):
+        return np.zeros(np.shape(times))
+    cumulative = np.concatenate(([0.0], np.cumsum(levels[:-1] * np.diff(points))))
+    index = np.searchsorted(points, times, side='right') - 1
+    position = np.clip(index, 0, len(points) - 1)
+    return np.where(index >= 0, cumulative[position] + levels[position] * (times - points[position]), 0.0)
+
+
+def interval_heatmap(starts, ends, bucket_starts, bucket_ends):
+    """
+    vectorized occupancy of the intervals in every bucket. the intervals are turned into a step function with the
+    number of intervals running at each time, the occupancy of a bucket is its integral between the bucket edges and
+    the busy time is the integral of the time with at least one interval running.
+    :return: dict of arrays with the shape of the buckets, occupancy (seconds of all the intervals),
+     busy (seconds with at least one interval) and overlap (seconds spent on more than one interval at once)
+    """
+    points = np.concatenate((starts, ends))
+    order = np.argsort(points, kind='mergesort')
+    points = points[order]
+    levels = np.cumsum(np.concatenate((np.ones(len(starts)), -np.ones(len(ends))))[order])
+    occupancy = step_integral(points, levels, bucket_ends) - step_integral(points, levels, bucket_starts)
+    busy_levels = (levels > 0).astype(float)
+    busy = step_integral(points, busy_levels, bucket_ends) - step_integral(points, busy_levels, bucket_starts)
+    return {'occupancy': occupancy, 'busy': busy, 'overlap': occupancy - busy}
+
+
+def reference_heatmap(starts, ends, bucket_starts, bucket_ends):
+    """
+    pure python version of interval_heatmap, one bucket and one interval at a time.
+    it is only used to check and benchmark the vectorized version
+    :return: dict of nested lists with the shape of the buckets
+    """
+    intervals = sorted(zip(starts.tolist(), ends.tolist()))
+    result = {'occupancy': [], 'busy': [], 'overlap': []}
+    for row_starts, row_ends in zip(bucket_starts.tolist(), bucket_ends.tolist()):
+        for key in result:
+            result[key].append([])
+        for bucket_start, bucket_end in zip(row_starts, row_ends):
+            occupancy = busy = 0.0
+            union_start = union_end = None
+            for start, end in intervals:
+                start, end = max(start, bucket_start), min(end, bucket_end)
+                if end <= start:
+                    continue
+                occupancy += end - start
+                if union_end is None or start > union_end:
+                    if union_end is not None:
+                        busy += union_end - union_start
+                    union_start, union_end = start, end
+                else:
+                    union_end = max(union_end, end)
+            if union_end is not None:
+                busy += union_end - union_start
+            result['occupancy'][-1].append(occupancy)
+            result['busy'][-1].append(busy)
+            result['overlap'][-1].append(occupancy - busy)
+    return result
+
+
+def user_heatmap(user, start, end, now=None):
+    """
+    :return: per day and per hour occupancy and overlap seconds of the user tasks between the dates
+     (both included) in the current time zone, with the daily and total utilization
+    """
+    midnights = day_starts(start, end)
+    bucket_starts, bucket_ends = hour_buckets(midnights)
+    starts, ends, seconds_paused = task_intervals(user, start, end, now=now)
+    heatmap = interval_heatmap(starts, ends, bucket_starts, bucket_ends)
+    day_seconds = np.diff(midnights)
+    daily_busy = heatmap['busy'].sum(axis=1)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': [(start + timedelta(days=day)).isoformat() for day in range(len(day_seconds))],
+        'occupancy': np.rint(heatmap['occupancy']).astype(np.int64).tolist(),
+        'overlap': np.rint(heatmap['overlap']).astype(np.int64).tolist(),
+        'daily_utilization': np.round(daily_busy / day_seconds, 4).tolist(),
+        'busy_seconds': int(round(daily_busy.sum())),
+        'occupied_seconds': int(round(heatmap['occupancy'].sum())),
+        'overlap_seconds': int(round(heatmap['overlap'].sum())),
+        'seconds_paused': int(seconds_paused.sum()),
+        'utilization': round(float(daily_busy.sum() / day_seconds.sum()), 4),
+    }
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+from itertools import islice
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ActiveTask, Project, Task, TimeRollup, track_changes
+
+IMPORT_FIELDS = ('project', 'name', 'started_at', 'ended_at', 'seconds_paused')
+DEFAULT_BATCH_SIZE = 1000
+
+
+def decode_lines(lines, encoding='utf-8'):
+    """
+    decode the byte lines of a stream one at a time, the lines that can not be decoded are None
+    """
+    for line in lines:
+        if not isinstance(line, bytes):
+            yield line
+            continue
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            yield None
+
+
+def read_ndjson_rows(lines):
+    """
+    :return: generator of (line number, row) with one json object per line, blank lines are skipped
+    """
+    for line_number, line in enumerate(decode_lines(lines), start=1):
+        if line is None:
+            yield line_number, None
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def read_csv_rows(lines):
+    """
+    :return: generator of (line number, row) for a csv with a header line, the row is None for the lines that can
+     not be decoded
+    """
+    invalid_lines = []
+
+    def csv_lines():
+        for line_number, line in enumerate(decode_lines(lines), start=1):
+            if line is None:
+                # a blank line is skipped by the reader and keeps its line_num in step
+                invalid_lines.append(line_number)
+                line = '\n'
+            yield line
+
+    reader = csv.DictReader(csv_lines())
+    for row in reader:
+        while invalid_lines:
+            yield invalid_lines.pop(0), None
+        yield reader.line_num, row
+    for line_number in invalid_lines:
+        yield line_number, None
+
+
+def parse_task_datetime(value):
+    """
+    :return: aware datetime, naive values are taken in the current time zone
+    """
+    value = parse_datetime(value or '')
+    if value is None:
+        raise ValueError
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def build_task(row, projects):
+    """
+    :return: unsaved closed Task for the given row
+    :raise ValueError: with the reason when the row is not valid
+    """
+    if row is None:
+        raise ValueError('Invalid row')
+    project_name = row.get('project')
+    project_id = projects.get(project_name) if isinstance(project_name, str) else None
+    if project_id is None:
+        raise ValueError('Invalid Project')
+    try:
+        started_at = parse_task_datetime(row.get('started_at'))
+    except ValueError:
+        raise ValueError('Invalid started_at')
+    try:
+        ended_at = parse_task_datetime(row.get('ended_at'))
+    except ValueError:
+        raise ValueError('Invalid ended_at')
+    if ended_at < started_at:
+        raise ValueError('ended_at must be after started_at')
+    try:
+        seconds_paused = int(row.get('seconds_paused') or 0)
+        if seconds_paused < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError('Invalid seconds_paused')
+    task = Task(project_id=project_id, started_at=started_at, ended_at=ended_at, seconds_paused=seconds_paused)
+    if row.get('name'):
+        task.name = str(row.get('name'))[:250]
+    return task
+
+
+def import_batch(user, batch):
+    """
+    insert the valid rows of the batch with a single bulk_create and add them to the time rollups
+    :return: created tasks count and list of (line number, error)
+    """
+    names = {row.get('project') for line_number, row in batch
+             if row is not None and isinstance(row.get('project'), str)}
+    projects = dict(Project.objects.filter(user=user, name__in=names).values_list('name', 'id'))
+    tasks = []
+    errors = []
+    for line_number, row in batch:
+        try:
+            tasks.append(build_task(row, projects))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+    if not tasks:
+        return 0, errors
+
+    with transaction.atomic():
+        # the lock keeps the other task inserts of the user out of the id range read back below
+        ActiveTask.lock(user)
+        last_id = Task.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        Task.objects.bulk_create(tasks)
+        if not connection.features.can_return_ids_from_bulk_insert:
+            tasks = Task.objects.filter(id__gt=last_id, project__user=user)
+        TimeRollup.add_tasks_closed_seconds([(task, task.closed_seconds) for task in tasks])
+        track_changes(user.id, tasks=[task.id for task in tasks])
+    return len(tasks), errors
+
+
+def import_tasks(user, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    import the closed tasks of the rows in batches, the rows are consumed incrementally
+    :param rows: iterable of (line number, row) with the IMPORT_FIELDS, project is the project name
+    :return: generator of created tasks count and list of (line number, error) for each batch
+    """
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        yield import_batch(user, batch)
+        batch = list(islice(rows, batch_size))
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import base64
+import http.client
+import json
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+from .benchmark import percentile
+
+ACCESS_TOKEN_PATH = '/api/v1/access_token/'
+REFRESH_TOKEN_PATH = '/api/v1/refresh_token/'
+# client flow of the postman collection, the steps are (method, route) of the collection requests
+FLOW = (
+    ('GET', '/api/v1/tasks/'),
+    ('POST', '/api/v1/projects/'),
+    ('POST', '/api/v1/tasks/'),
+    ('PUT', '/api/v1/tasks/pause_resume/{id}/'),
+    ('PUT', '/api/v1/tasks/pause_resume/{id}/'),
+    ('PUT', '/api/v1/tasks/close/{id}/'),
+    ('POST', '/api/v1/tasks/continue/'),
+    ('PUT', '/api/v1/tasks/close/{id}/'),
+    ('GET', '/api/v1/projects/'),
+    ('GET', '/api/v1/users/'),
+)
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+REFRESH_MARGIN_SECONDS = 5
+
+
+def request_route(url):
+    """
+    :return: path of the url with the ids replaced by {id}
+    """
+    return re.sub(r'/\d+(?=/)', '/{id}', urlparse(url).path)
+
+
+def collection_requests(path):
+    """
+    :return: dict of (method, route) and json body of the requests of a postman collection
+    """
+    with open(path) as collection_file:
+        collection = json.load(collection_file)
+    requests = {}
+    items = list(collection.get('item', []))
+    while items:
+        item = items.pop(0)
+        if 'item' in item:
+            items.extend(item['item'])
+            continue
+        request = item['request']
+        url = request['url'] if isinstance(request['url'], str) else request['url'].get('raw', '')
+        raw_body = (request.get('body') or {}).get('raw') or ''
+        try:
+            body = json.loads(raw_body) if raw_body.strip() else None
+        except ValueError:
+            body = None
+        requests[(request['method'], request_route(url))] = body
+    return requests
+
+
+def build_flow(requests):
+    """
+    :return: list of (method, route, body) of the FLOW steps with the bodies of the collection requests
+    """
+    missing = [step for step in FLOW if step not in requests]
+    if missing:
+        raise ValueError('the collection has no request for {}'.format(', '.join(' '.join(step) for step in missing)))
+    return [(method, route, requests[(method, route)]) for method, route in FLOW]
+
+
+def token_expiration(token):
+    """
+    :return: exp claim of the jwt, read without verifying the signature
+    """
+    payload = token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp']
+
+
+def histogram(milliseconds):
+    """
+    :return: list of request counts of each HISTOGRAM_BUCKETS_MS upper bound, the last count is the slower requests
+    """
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for value in milliseconds:
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS_MS) and value > HISTOGRAM_BUCKETS_MS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    return counts
+
+
+class VirtualUser(object):
+    """
+    client of the api with its own keep-alive connection, logs in, refreshes the access token before it expires
+    and runs the flow again and again. every request is recorded as (step, status, milliseconds), status 0 is a
+    connection error
+    """
+
+    def __init__(self, base_url, username, password, flow, timeout=30):
+        url = urlparse(base_url)
+        self.host, self.port, self.timeout = url.hostname, url.port or 80, timeout
+        self.username, self.password, self.flow = username, password, flow
+        self.connection = None
+        self.access = self.refresh = None
+        self.expires_at = 0
+        self.iterations = 0
+        self.samples = []
+
+    def send(self, step, method, path, body=None, authenticated=True, record=True):
+        """
+        :param record: False to leave the request out of the samples
+        :return: status and json data of the response, status 0 on connection errors
+        """
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if authenticated:
+            self.ensure_token()
+            headers['Authorization'] = 'Bearer {}'.format(self.access)
+        started_at = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            status = response.status
+        except (OSError, socket.timeout, http.client.HTTPException):
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            content, status = b'', 0
+        if record:
+            self.samples.append((step, status, (time.perf_counter() - started_at) * 1000))
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    def login(self):
+        status, data = self.send('POST ' + ACCESS_TOKEN_PATH, 'POST', ACCESS_TOKEN_PATH,
+                                 {'username': self.username, 'password': self.password}, authenticated=False)
+        if status != 200:
+            raise RuntimeError('{} can not log in, status {}'.format(self.username, status))
+        self.access, self.refresh = data['access'], data['refresh']
+        self.expires_at = token_expiration(self.access)
+
+    def ensure_token(self):
+        """
+        get a new access token with the refresh token when it is about to expire, log in again when that fails
+        """
+        if self.access is not None and time.time() < self.expires_at - REFRESH_MARGIN_SECONDS:
+            return
+        if self.refresh is not None:
+            status, data = self.send('POST ' + REFRESH_TOKEN_PATH, 'POST', REFRESH_TOKEN_PATH,
+                                     {'refresh': self.refresh}, authenticated=False)
+            if status == 200:
+                self.access = data['access']
+                self.expires_at = token_expiration(self.access)
+                return
+        self.login()
+
+    def run_flow(self, sequence):
+        """
+        run the steps of the flow with the ids created by the previous steps, stops at the first failed step
+        """
+        variables = {'name': 'load {} {} {}'.format(self.username, sequence, time.time()), 'project_id': None,
+                     'id': None}
+        for method, route, body in self.flow:
+            if body is not None:
+                body = {key: variables.get(key, value) for key, value in body.items()}
+            status, data = self.send('{} {}'.format(method, route), method,
+                                     route.replace('{id}', str(variables['id'])), body)
+            if status >= 400 or status == 0:
+                if variables['id'] is not None:
+                    # a task left running would make the next flows fail
+                    self.send('cleanup', 'PUT', '/api/v1/tasks/close/{}/'.format(variables['id']), record=False)
+                return
+            if (method, route) == ('POST', '/api/v1/projects/'):
+                variables['project_id'] = data['id']
+            elif method == 'POST' and route in ('/api/v1/tasks/', '/api/v1/tasks/continue/'):
+                variables['id'] = data['id']
+        self.iterations += 1
+
+    def run(self, deadline):
+        sequence = 0
+        while time.monotonic() < deadline:
+            try:
+                self.run_flow(sequence)
+            except RuntimeError:
+                # the failed log in is already recorded, the user stops until the next stage
+                return
+            sequence += 1
+
+    def take_samples(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def run_stage(virtual_users, duration):
+    """
+    run the flows of the virtual users in parallel threads for the given seconds
+    :return: list of (step, status, milliseconds) of all the requests and the elapsed seconds
+    """
+    deadline = time.monotonic() + duration
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user.run, args=(deadline,)) for virtual_user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+    return [sample for virtual_user in virtual_users for sample in virtual_user.take_samples()], elapsed
+
+
+def summarize_stage(concurrency, samples, elapsed):
+    """
+    :return: dict with the throughput, error rate, latency percentiles and histogram of the stage and of each step
+    """
+    def summarize(step_samples):
+        milliseconds = sorted(sample[2] for sample in step_samples)
+        errors = sum(1 for sample in step_samples if sample[1] == 0 or sample[1] >= 400)
+        return {
+            'requests': len(step_samples),
+            'error_rate': errors / len(step_samples),
+            'p50_ms': round(percentile(milliseconds, 0.5), 3),
+            'p95_ms': round(percentile(milliseconds, 0.95), 3),
+            'p99_ms': round(percentile(milliseconds, 0.99), 3),
+            'max_ms': round(milliseconds[-1], 3),
+        }
+
+    steps = {}
+    for sample in samples:
+        steps.setdefault(sample[0], []).append(sample)
+    summary = summarize(samples) if samples else {'requests': 0, 'error_rate': 0.0}
+    summary.update(concurrency=concurrency, seconds=round(elapsed, 3), throughput=len(samples) / elapsed,
+                   histogram=histogram(sample[2] for sample in samples),
+                   steps={step: summarize(step_samples) for step, step_samples in steps.items()})
+    return summary
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from project_tracking.archive import ARCHIVE_BATCH_SIZE, archive_tasks
+
+
+class Command(BaseCommand):
+    help = 'Move the continuation chains closed before a cutoff from the task table to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='archive the chains closed more than these days ago')
+        parser.add_argument('--before', help='archive the chains closed before this date (YYYY-MM-DD), '
+                                             'in the current time zone, instead of --days')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help='chains moved in each transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only count the tasks that would be archived')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be greater than 0')
+        if options['before']:
+            try:
+                cutoff = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--before must be a date in YYYY-MM-DD format')
+        else:
+            if options['days'] < 0:
+                raise CommandError('--days can not be negative')
+            cutoff = timezone.now() - timedelta(days=options['days'])
+
+        result = archive_tasks(cutoff, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        message = '{tasks} tasks of {chains} chains closed before {cutoff} {action}'.format(
+            cutoff=cutoff.isoformat(), action='would be archived' if options['dry_run'] else 'archived', **result)
+        self.stdout.write(self.style.SUCCESS(message))
+        if result['out_of_sync']:
+            for root_id in result['out_of_sync']:
+                self.stdout.write('chain {}: time rollup out of sync'.format(root_id))
+            self.stdout.write(self.style.WARNING(
+                '{} chains left out, run rebuild_time_rollups and archive again'.format(len(result['out_of_sync']))))
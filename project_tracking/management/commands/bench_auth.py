@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from project_tracking.authentication import CachedJWTAuthentication
+from project_tracking.cache import is_shared_cache
+
+
+class Command(BaseCommand):
+    help = 'Measure the authentication overhead per request of JWTAuthentication and CachedJWTAuthentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='authenticated requests of each class')
+
+    def measure(self, authentication, request, requests):
+        """
+        :return: microseconds and queries per request, once the first request has filled the caches
+        """
+        authentication.authenticate(request)
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            for _ in range(requests):
+                authentication.authenticate(request)
+            elapsed = time.perf_counter() - started_at
+        return elapsed * 1000000 / requests, len(queries) / requests
+
+    def handle(self, *args, **options):
+        if not is_shared_cache():
+            self.stdout.write(self.style.WARNING('the cache is not shared by the processes, '
+                                                 'CachedJWTAuthentication does not cache the users'))
+        with transaction.atomic():
+            user = User.objects.create_user('bench-auth-{}'.format(time.time()), password=None)
+            request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer {}'.format(AccessToken.for_user(user)))
+            for name, authentication in (('JWTAuthentication', JWTAuthentication()),
+                                         ('CachedJWTAuthentication', CachedJWTAuthentication())):
+                microseconds, queries = self.measure(authentication, request, options['requests'])
+                self.stdout.write('{0}: {1:.1f}us and {2:.2f} queries per request'.format(
+                    name, microseconds, queries))
+            transaction.set_rollback(True)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from project_tracking.benchmark import compare_routes, environment, summarize_samples
+from project_tracking.models import Task
+from project_tracking.synthetic import generate_dataset
+
+IMPORT_ROWS = 100
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset and measure the latency and queries of every route of the api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--projects', type=int, default=10, help='projects of each user')
+        parser.add_argument('--tasks', type=int, default=50, help='tasks of each project')
+        parser.add_argument('--requests', type=int, default=20, help='measured requests of each route')
+        parser.add_argument('--warmup', type=int, default=2, help='requests of each route done before measuring')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the results as json to this file')
+        parser.add_argument('--compare', help='json results of an earlier run to compare with')
+        parser.add_argument('--keep', action='store_true', help='keep the dataset, it is rolled back by default')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['projects'] < 1 or options['requests'] < 1:
+            raise CommandError('at least one user, project and request are needed')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (IOError, ValueError) as e:
+                raise CommandError('the results to compare can not be read: {}'.format(e))
+
+        self.samples = {}
+        started_at = time.perf_counter()
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']), transaction.atomic():
+            users = generate_dataset(options['users'], options['projects'], options['tasks'], seed=options['seed'])
+            self.stdout.write('dataset generated in {:.1f}s'.format(time.perf_counter() - started_at))
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(AccessToken.for_user(users[0])))
+            for sample in range(options['warmup'] + options['requests']):
+                self.measured = sample >= options['warmup']
+                self.run_reads(client, users[0])
+                self.run_writes(client, users[0], sample)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        results = dict(environment(), dataset={key: options[key] for key in ('users', 'projects', 'tasks', 'seed')},
+                       requests=options['requests'],
+                       routes={route: summarize_samples(samples) for route, samples in self.samples.items()})
+        self.write_results(results['routes'])
+        if baseline is not None:
+            self.write_comparison(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+    def request(self, client, route, expected_status, method, path, *args, **kwargs):
+        """
+        do the request and keep its time and queries under the route when the sample is measured
+        :return: the response
+        """
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            response = getattr(client, method)(path, *args, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started_at
+        if self.measured:
+            self.samples.setdefault(route, []).append(
+                (elapsed * 1000, len(queries), response.status_code == expected_status))
+        return response
+
+    def run_reads(self, client, user):
+        project_id = user.project_set.order_by('id').values_list('id', flat=True).first()
+        task_id = Task.objects.filter(project__user=user).order_by('-id').values_list('id', flat=True).first()
+        today = timezone.localdate()
+        self.request(client, 'GET /users/', 200, 'get', '/api/v1/users/')
+        self.request(client, 'GET /users/{id}/', 200, 'get', '/api/v1/users/{}/'.format(user.id))
+        self.request(client, 'GET /projects/', 200, 'get', '/api/v1/projects/')
+        self.request(client, 'GET /projects/{id}/', 200, 'get', '/api/v1/projects/{}/'.format(project_id))
+        self.request(client, 'GET /tasks/', 200, 'get', '/api/v1/tasks/')
+        self.request(client, 'GET /tasks/{id}/', 200, 'get', '/api/v1/tasks/{}/'.format(task_id))
+        self.request(client, 'GET /tasks/export/', 200, 'get', '/api/v1/tasks/export/?export_format=ndjson')
+        self.request(client, 'GET /reports/', 200, 'get', '/api/v1/reports/', {
+            'start': (today - timedelta(days=30)).isoformat(), 'end': today.isoformat(), 'granularity': 'day'})
+        self.request(client, 'GET /reports/heatmap/', 200, 'get', '/api/v1/reports/heatmap/')
+        self.request(client, 'GET /sync/', 200, 'get', '/api/v1/sync/')
+
+    def run_writes(self, client, user, sample):
+        """
+        the task routes are measured along the flow of a client: create, pause, resume, restart, close, continue
+        """
+        for task_id in Task.objects.filter(project__user=user, ended_at__isnull=True,
+                                           paused_at__isnull=True).values_list('id', flat=True):
+            client.put('/api/v1/tasks/close/{}/'.format(task_id))
+
+        name = 'bench project {}-{}'.format(user.id, sample)
+        project_id = self.request(client, 'POST /projects/', 201, 'post', '/api/v1/projects/',
+                                  {'name': name}, format='json').data['id']
+        started_at = timezone.now() - timedelta(days=sample + 1)
+        rows = [json.dumps({'project': name, 'name': 'imported {}'.format(row),
+                            'started_at': (started_at + timedelta(minutes=row)).isoformat(),
+                            'ended_at': (started_at + timedelta(minutes=row + 1)).isoformat()})
+                for row in range(IMPORT_ROWS)]
+        self.request(client, 'POST /tasks/import/', 200, 'post', '/api/v1/tasks/import/', '\n'.join(rows),
+                     content_type='application/x-ndjson')
+
+        task_id = self.request(client, 'POST /tasks/', 201, 'post', '/api/v1/tasks/',
+                               {'project_id': project_id, 'name': 'bench task'}, format='json').data['id']
+        pause_resume = '/api/v1/tasks/pause_resume/{}/'.format(task_id)
+        self.request(client, 'PUT /tasks/pause_resume/{id}/', 200, 'put', pause_resume)
+        self.request(client, 'PUT /tasks/pause_resume/{id}/', 200, 'put', pause_resume)
+        self.request(client, 'PUT /tasks/restart/{id}/', 200, 'put', '/api/v1/tasks/restart/{}/'.format(task_id))
+        self.request(client, 'PUT /tasks/close/{id}/', 200, 'put', '/api/v1/tasks/close/{}/'.format(task_id))
+        continued_id = self.request(client, 'POST /tasks/continue/', 201, 'post', '/api/v1/tasks/continue/',
+                                    {'id': task_id}, format='json').data['id']
+        self.request(client, 'POST /tasks/bulk_transition/', 200, 'post', '/api/v1/tasks/bulk_transition/',
+                     {'operation': 'close', 'ids': [continued_id]}, format='json')
+
+    def write_results(self, routes):
+        self.stdout.write('{:<32} {:>6} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+            'route', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'queries', 'errors'))
+        for route, summary in routes.items():
+            self.stdout.write('{route:<32} {count:>6} {p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f} '
+                              '{queries:>8.1f} {errors:>7}'.format(route=route, **summary))
+
+    def write_comparison(self, results, baseline):
+        self.stdout.write('compared with {} ({})'.format(baseline.get('revision'), baseline.get('created_at')))
+        if baseline.get('dataset') != results['dataset'] or baseline.get('database') != results['database']:
+            self.stdout.write(self.style.WARNING('the runs do not use the same dataset and database'))
+        for route, p50_ratio, p95_ratio, queries in compare_routes(results['routes'], baseline.get('routes', {})):
+            self.stdout.write('{:<32} p50 {:>6.2f}x  p95 {:>6.2f}x  queries {:+.1f}'.format(
+                route, p50_ratio, p95_ratio, queries))
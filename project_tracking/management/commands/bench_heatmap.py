@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from project_tracking.heatmap import hour_buckets, interval_heatmap, reference_heatmap
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized heatmap engine with the pure python reference on random intervals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervals', type=int, default=1000, help='number of random task intervals')
+        parser.add_argument('--days', type=int, default=365, help='number of days of the heatmap')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of each engine, the best one is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def time_engine(self, engine, repeat, *args):
+        """
+        :return: best time in seconds and the result of the last run
+        """
+        best = None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            result = engine(*args)
+            elapsed = time.perf_counter() - started_at
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        random = np.random.default_rng(options['seed'])
+        seconds = options['days'] * 86400.0
+        starts = random.uniform(0, seconds, options['intervals'])
+        ends = starts + random.exponential(3600, options['intervals'])
+        midnights = np.arange(options['days'] + 1) * 86400.0
+        bucket_starts, bucket_ends = hour_buckets(midnights)
+
+        numpy_time, numpy_result = self.time_engine(interval_heatmap, options['repeat'],
+                                                    starts, ends, bucket_starts, bucket_ends)
+        python_time, python_result = self.time_engine(reference_heatmap, options['repeat'],
+                                                      starts, ends, bucket_starts, bucket_ends)
+        for key, values in numpy_result.items():
+            if not np.allclose(values, python_result[key], atol=1e-3):
+                raise CommandError('the {} of the engines do not match'.format(key))
+
+        self.stdout.write('{} intervals, {} hourly buckets'.format(options['intervals'], bucket_starts.size))
+        self.stdout.write('numpy:  {:.4f}s'.format(numpy_time))
+        self.stdout.write('python: {:.4f}s'.format(python_time))
+        self.stdout.write(self.style.SUCCESS('speedup: {:.1f}x'.format(python_time / max(numpy_time, 1e-9))))
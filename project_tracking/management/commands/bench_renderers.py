@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from project_tracking.models import Project, Task
+from project_tracking.renderers import MessagePackRenderer, ORJSONRenderer
+from project_tracking.serializers import TASK_ROW_FIELDS, task_rows_data
+
+
+class Command(BaseCommand):
+    help = 'Compare the encode time and payload size of the api renderers on a task listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=5000, help='tasks of the listing')
+        parser.add_argument('--repeat', type=int, default=5, help='runs of each renderer, the best one is reported')
+
+    def time_renderer(self, renderer, data, repeat):
+        """
+        :return: best time in seconds and the rendered payload
+        """
+        best = None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            payload = renderer.render(data, renderer.media_type, {})
+            elapsed = time.perf_counter() - started_at
+            best = elapsed if best is None else min(best, elapsed)
+        return best, payload
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user('bench-renderers-{}'.format(time.time()), password=None)
+            project = Project.objects.create(user=user, name='bench')
+            now = timezone.now()
+            Task.objects.bulk_create(
+                Task(project=project, name='task {}'.format(i), started_at=now - timedelta(hours=i + 2),
+                     ended_at=now - timedelta(hours=i + 1) if i % 3 else None,
+                     paused_at=now - timedelta(minutes=i % 60) if not i % 3 else None, seconds_paused=i % 600)
+                for i in range(options['tasks']))
+            rows = Task.objects.filter(project=project).with_elapsed_seconds().order_by('-started_at', '-id')
+            data = task_rows_data(rows.values(*TASK_ROW_FIELDS))
+            transaction.set_rollback(True)
+
+        self.stdout.write('{} tasks'.format(len(data)))
+        json_time = None
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer()),
+                               ('MessagePackRenderer', MessagePackRenderer())):
+            if not getattr(renderer, 'available', True):
+                self.stdout.write('{}: not installed'.format(name))
+                continue
+            elapsed, payload = self.time_renderer(renderer, data, options['repeat'])
+            json_time = json_time or elapsed
+            self.stdout.write('{0}: {1:.2f}ms, {2} bytes, {3:.1f}x'.format(
+                name, elapsed * 1000, len(payload), json_time / max(elapsed, 1e-9)))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from project_tracking.importers import DEFAULT_BATCH_SIZE, import_tasks, read_csv_rows, read_ndjson_rows
+
+
+class Command(BaseCommand):
+    help = 'Import closed tasks for a user from a csv or ndjson file, see TasksViewSet.import_tasks for the fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='csv or ndjson file, use - to read from stdin')
+        parser.add_argument('--user', required=True, help='username of the projects owner')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='file format, taken from the file extension when not given')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='rows inserted with each bulk_create')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('User "{}" does not exist'.format(options['user']))
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be greater than 0')
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+
+        created = 0
+        error_count = 0
+        stream = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        try:
+            rows = read_csv_rows(stream) if file_format == 'csv' else read_ndjson_rows(stream)
+            for batch_created, batch_errors in import_tasks(user, rows, batch_size=options['batch_size']):
+                created += batch_created
+                error_count += len(batch_errors)
+                for line_number, error in batch_errors:
+                    self.stderr.write('line {0}: {1}'.format(line_number, error))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS('{0} tasks imported, {1} errors'.format(created, error_count)))
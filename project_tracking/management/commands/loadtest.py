@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from project_tracking.benchmark import environment
+from project_tracking.loadtest import HISTOGRAM_BUCKETS_MS, VirtualUser, build_flow, collection_requests, run_stage, \
+    summarize_stage
+from project_tracking.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Replay the client flow of the postman collection with concurrent virtual users against a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help='base url of the runserver or gunicorn')
+        parser.add_argument('--collection', default=os.path.join(settings.BASE_DIR,
+                                                                 'project_tracker.postman_collection.json'))
+        parser.add_argument('--concurrency', default='1,2,4,8,16',
+                            help='comma separated virtual users of each stage, one stage after the other')
+        parser.add_argument('--duration', type=float, default=10, help='seconds of each stage')
+        parser.add_argument('--projects', type=int, default=3, help='projects of each generated user')
+        parser.add_argument('--tasks', type=int, default=20, help='tasks of each generated project')
+        parser.add_argument('--password', default='load-test-password', help='password of the generated users')
+        parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for each response')
+        parser.add_argument('--output', help='write the results as json to this file')
+        parser.add_argument('--keep', action='store_true', help='keep the generated users, deleted by default')
+
+    def handle(self, *args, **options):
+        try:
+            stages = [int(concurrency) for concurrency in options['concurrency'].split(',')]
+            flow = build_flow(collection_requests(options['collection']))
+        except (IOError, ValueError) as e:
+            raise CommandError(str(e))
+        if not stages or min(stages) < 1:
+            raise CommandError('the concurrency of every stage must be at least 1')
+
+        # the server must see the users, so they are committed and deleted at the end
+        users = generate_dataset(max(stages), options['projects'], options['tasks'], seed=int(time.time()),
+                                 password=options['password'], running_fraction=0, prefix='load')
+        try:
+            virtual_users = [VirtualUser(options['url'], user.username, options['password'], flow,
+                                         timeout=options['timeout']) for user in users]
+            results = []
+            for concurrency in stages:
+                samples, elapsed = run_stage(virtual_users[:concurrency], options['duration'])
+                results.append(summarize_stage(concurrency, samples, elapsed))
+                self.write_stage(results[-1])
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(dict(environment(), url=options['url'], duration=options['duration'],
+                               histogram_buckets_ms=HISTOGRAM_BUCKETS_MS, stages=results),
+                          output, indent=2, sort_keys=True)
+
+    def write_stage(self, stage):
+        if not stage['requests']:
+            self.stdout.write(self.style.ERROR('{concurrency} users: no requests done'.format(**stage)))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            '{concurrency} users: {requests} requests in {seconds:.1f}s, {throughput:.1f} req/s, '
+            '{error_rate:.1%} errors, p50 {p50_ms:.1f}ms p95 {p95_ms:.1f}ms p99 {p99_ms:.1f}ms'.format(**stage)))
+        bounds = ['<={}ms'.format(bound) for bound in HISTOGRAM_BUCKETS_MS] + ['>{}ms'.format(HISTOGRAM_BUCKETS_MS[-1])]
+        self.stdout.write('  ' + '  '.join('{} {}'.format(bound, count)
+                                           for bound, count in zip(bounds, stage['histogram']) if count))
+        for step, summary in stage['steps'].items():
+            self.stdout.write('  {:<40} {requests:>7} {error_rate:>7.1%} {p50_ms:>9.1f} {p95_ms:>9.1f}'.format(
+                step, **summary))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import pstats
+from collections import OrderedDict
+from django.core.management.base import BaseCommand, CommandError
+from project_tracking.middleware import get_profiling_settings
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+
+def group_dumps(directory, endpoint=None):
+    """
+    :return: dict of endpoint and paths of its profile dumps, the name of each dump starts with the endpoint
+    """
+    groups = OrderedDict()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.prof'):
+            continue
+        name_endpoint = name.split('.', 1)[0]
+        if endpoint is None or name_endpoint == endpoint:
+            groups.setdefault(name_endpoint, []).append(os.path.join(directory, name))
+    return groups
+
+
+class Command(BaseCommand):
+    help = 'Merge the request profile dumps by endpoint and print the hot functions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="directory of the dumps, REQUEST_PROFILING['DIRECTORY'] by default")
+        parser.add_argument('--endpoint', help='only the dumps of this endpoint, e.g. user-list')
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative')
+        parser.add_argument('--limit', type=int, default=20, help='functions shown by endpoint')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or get_profiling_settings()['DIRECTORY']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError('there is no profile directory {}'.format(directory))
+
+        groups = group_dumps(directory, options['endpoint'])
+        if not groups:
+            self.stdout.write('there are no profile dumps in {}'.format(directory))
+        for endpoint, paths in groups.items():
+            output = io.StringIO()
+            stats = pstats.Stats(*paths, stream=output)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write('{}: {} requests'.format(endpoint, len(paths)))
+            self.stdout.write(output.getvalue())
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from project_tracking.models import ArchivedTask, Task, TimeRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the project and continuation chain time rollups from the task and archived task rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='only compare the stored rollups with the task rows and report the differences')
+
+    def handle(self, *args, **options):
+        expected = {}
+        for project_id, seconds in Task.objects.closed_seconds_by_project().items():
+            expected[(project_id, None)] = seconds
+        # the archived chains have no chain rollup, their seconds are only kept in the project rollup
+        for project_id, seconds in ArchivedTask.objects.closed_seconds_by_project().items():
+            expected[(project_id, None)] = expected.get((project_id, None), 0) + seconds
+        expected.update(Task.objects.closed_seconds_by_chain())
+
+        if options['verify']:
+            stored = {(project_id, root_id): seconds for project_id, root_id, seconds
+                      in TimeRollup.objects.values_list('project_id', 'chain_root_id', 'closed_seconds')}
+            mismatches = 0
+            for key in sorted(set(expected) | set(stored), key=str):
+                if expected.get(key, 0) != stored.get(key, 0):
+                    mismatches += 1
+                    self.stdout.write('project {0} chain {1}: stored {2} expected {3}'.format(
+                        key[0], key[1], stored.get(key, 0), expected.get(key, 0)))
+            if mismatches:
+                raise CommandError('{} time rollups are out of sync'.format(mismatches))
+            self.stdout.write(self.style.SUCCESS('{} time rollups verified'.format(len(expected))))
+            return
+
+        with transaction.atomic():
+            TimeRollup.objects.all().delete()
+            TimeRollup.objects.bulk_create([
+                TimeRollup(project_id=project_id, chain_root_id=root_id, closed_seconds=seconds)
+                for (project_id, root_id), seconds in expected.items()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS('{} time rollups rebuilt'.format(len(expected))))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+from collections import OrderedDict
+from django.core.management.base import BaseCommand, CommandError
+from project_tracking.benchmark import percentile
+from project_tracking.middleware import get_metrics_settings
+
+SORT_KEYS = ('total_ms', 'queries', 'db_ms', 'requests')
+
+
+def read_records(lines):
+    """
+    :return: generator of the request records of the metrics log, the lines that are not a record are skipped
+    """
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and 'endpoint' in record:
+            yield record
+
+
+def summarize(records):
+    """
+    :return: list of dicts with the requests, times and queries of each method and endpoint
+    """
+    endpoints = OrderedDict()
+    for record in records:
+        endpoints.setdefault('{} {}'.format(record['method'], record['endpoint']), []).append(record)
+
+    summary = []
+    for endpoint, records in endpoints.items():
+        total_ms = sorted(record['total_ms'] for record in records)
+        queries = [record['queries'] for record in records]
+        summary.append({
+            'endpoint': endpoint,
+            'requests': len(records),
+            'total_ms': sum(total_ms) / len(records),
+            'p95_ms': percentile(total_ms, 0.95),
+            'max_ms': total_ms[-1],
+            'queries': sum(queries) / len(records),
+            'max_queries': max(queries),
+            'db_ms': sum(record['db_ms'] for record in records) / len(records),
+            'serialize_ms': sum(record['serialize_ms'] for record in records) / len(records),
+            'flagged': sum(1 for record in records if record['flags']),
+        })
+    return summary
+
+
+class Command(BaseCommand):
+    help = 'Aggregate the request metrics log by endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help="metrics logs, REQUEST_METRICS['LOG_FILE'] by default")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total_ms',
+                            help='the endpoints are sorted by this average, descending')
+        parser.add_argument('--limit', type=int, default=None, help='number of endpoints shown')
+
+    def handle(self, *args, **options):
+        files = options['files'] or [get_metrics_settings().get('LOG_FILE')]
+        if None in files:
+            raise CommandError("there is no REQUEST_METRICS['LOG_FILE'] in the settings, pass the metrics logs")
+        records = []
+        for name in files:
+            try:
+                with open(name) as lines:
+                    records.extend(read_records(lines))
+            except IOError:
+                raise CommandError('the metrics log {} can not be read'.format(name))
+        summary = summarize(records)
+        summary.sort(key=lambda endpoint: endpoint[options['sort']], reverse=True)
+
+        self.stdout.write('{:<40} {:>8} {:>9} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9} {:>8}'.format(
+            'endpoint', 'requests', 'avg ms', 'p95 ms', 'max ms', 'queries', 'max q', 'db ms', 'ser ms', 'flagged'))
+        for endpoint in summary[:options['limit']]:
+            self.stdout.write(
+                '{endpoint:<40} {requests:>8} {total_ms:>9.1f} {p95_ms:>9.1f} {max_ms:>9.1f} {queries:>8.1f} '
+                '{max_queries:>8} {db_ms:>9.1f} {serialize_ms:>9.1f} {flagged:>8}'.format(**endpoint))
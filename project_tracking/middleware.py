@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter, OrderedDict
+from contextlib import ExitStack
+from uuid import uuid4
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger('project_tracking.metrics')
+
+DEFAULT_REQUEST_METRICS = {
+    'QUERY_THRESHOLD': 30,
+    'DUPLICATE_QUERY_THRESHOLD': 10,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+DEFAULT_REQUEST_PROFILING = {
+    'DIRECTORY': None,
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Profile',
+}
+
+
+def get_metrics_settings():
+    """
+    :return: REQUEST_METRICS of the settings with the missing thresholds taken from DEFAULT_REQUEST_METRICS
+    """
+    return dict(DEFAULT_REQUEST_METRICS, **getattr(settings, 'REQUEST_METRICS', {}))
+
+
+def get_profiling_settings():
+    """
+    :return: REQUEST_PROFILING of the settings with the missing options taken from DEFAULT_REQUEST_PROFILING
+    """
+    return dict(DEFAULT_REQUEST_PROFILING, **getattr(settings, 'REQUEST_PROFILING', {}))
+
+
+def profile_file_name(endpoint):
+    """
+    :return: unique name of a profile dump, it starts with the endpoint so profile_report can group the dumps
+    """
+    return '{}.{}.{}.prof'.format(re.sub(r'[^\w-]', '_', endpoint), int(time.time() * 1000), uuid4().hex[:8])
+
+
+class QueryMetrics(object):
+    """
+    database execute wrapper that counts the queries, their time and how many times each statement is repeated
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started_at
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def max_repeats(self):
+        return max(self.statements.values()) if self.statements else 0
+
+
+class RequestMetricsMiddleware(object):
+    """
+    measure the queries, database time, serialize time (rendering of the rest framework response) and total time of
+    each request. they are sent in the Server-Timing header and logged as json to the project_tracking.metrics logger,
+    with a warning when a threshold of REQUEST_METRICS is passed, the repeated statements usually are a N+1.
+    the queries run while a streaming response is consumed are not counted
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryMetrics()
+        request.metrics_render_started_at = None
+        started_at = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        ended_at = time.perf_counter()
+
+        render_started_at = request.metrics_render_started_at
+        total_ms = (ended_at - started_at) * 1000
+        serialize_ms = (ended_at - render_started_at) * 1000 if render_started_at is not None else 0.0
+        db_ms = queries.seconds * 1000
+        response['Server-Timing'] = 'db;dur={:.1f};desc="{} queries", serialize;dur={:.1f}, total;dur={:.1f}'.format(
+            db_ms, queries.count, serialize_ms, total_ms)
+        self.log(request, response, queries, db_ms, serialize_ms, total_ms)
+        return response
+
+    def process_template_response(self, request, response):
+        # called by the handler right before the response is rendered
+        request.metrics_render_started_at = time.perf_counter()
+        return response
+
+    def log(self, request, response, queries, db_ms, serialize_ms, total_ms):
+        options = get_metrics_settings()
+        flags = []
+        if queries.count > options['QUERY_THRESHOLD']:
+            flags.append('queries')
+        if queries.max_repeats > options['DUPLICATE_QUERY_THRESHOLD']:
+            flags.append('duplicate_queries')
+        if total_ms > options['SLOW_REQUEST_MS']:
+            flags.append('slow')
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        record = OrderedDict((
+            ('endpoint', resolver_match.view_name if resolver_match else 'unresolved'),
+            ('method', request.method),
+            ('path', request.path),
+            ('status', response.status_code),
+            ('queries', queries.count),
+            ('max_repeats', queries.max_repeats),
+            ('db_ms', round(db_ms, 2)),
+            ('serialize_ms', round(serialize_ms, 2)),
+            ('total_ms', round(total_ms, 2)),
+            ('flags', flags),
+        ))
+        logger.log(logging.WARNING if flags else logging.INFO, json.dumps(record))
+
+
+class ProfilingMiddleware(object):
+    """
+    run the request under cProfile and write the stats to REQUEST_PROFILING['DIRECTORY'], for the requests of staff
+    users with the profiling header or for a random sample of SAMPLE_RATE of all the requests. nothing is profiled
+    without a directory. the name of the dump is returned in the X-Profile-Id header,
+    manage.py profile_report merges the dumps by endpoint
+    """
+    authentication = CachedJWTAuthentication()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_profiling_settings()
+        if not options['DIRECTORY'] or not self.should_profile(request, options):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # other profiler is already running in this thread
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        file_name = profile_file_name(resolver_match.view_name if resolver_match else 'unresolved')
+        os.makedirs(options['DIRECTORY'], exist_ok=True)
+        profiler.dump_stats(os.path.join(options['DIRECTORY'], file_name))
+        response['X-Profile-Id'] = file_name
+        return response
+
+    def should_profile(self, request, options):
+        if options['SAMPLE_RATE'] and random.random() < options['SAMPLE_RATE']:
+            return True
+        if not request.META.get('HTTP_' + options['HEADER'].upper().replace('-', '_')):
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        # the api users are authenticated by the views, the token is checked here only for the profiling header
+        try:
+            authenticated = self.authentication.authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='chain_root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chain_tasks', to='project_tracking.Task'),
+        ),
+    ]
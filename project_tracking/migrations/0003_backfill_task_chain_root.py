@@ -0,0 +1,42 @@
+import sqlite3
+from django.db import migrations
+
+
+CHAIN_CTE = """
+WITH RECURSIVE chain (id, root_id) AS (
+    SELECT id, id FROM project_tracking_task WHERE cloned_from_id IS NULL
+    UNION ALL
+    SELECT task.id, chain.root_id FROM project_tracking_task task
+    INNER JOIN chain ON task.cloned_from_id = chain.id
+)
+"""
+# the chain is computed once and joined to the tasks
+BACKFILL_CHAIN_ROOT = CHAIN_CTE + """
+UPDATE project_tracking_task SET chain_root_id = chain.root_id FROM chain
+WHERE chain.id = project_tracking_task.id AND project_tracking_task.cloned_from_id IS NOT NULL
+"""
+# sqlite before 3.33 has no UPDATE ... FROM, the subquery reads the chain again for every continued task
+SUBQUERY_BACKFILL_CHAIN_ROOT = CHAIN_CTE + """
+UPDATE project_tracking_task SET chain_root_id = (
+    SELECT chain.root_id FROM chain WHERE chain.id = project_tracking_task.id
+)
+WHERE cloned_from_id IS NOT NULL
+"""
+
+
+def backfill_chain_root(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite' and sqlite3.sqlite_version_info < (3, 33):
+        schema_editor.execute(SUBQUERY_BACKFILL_CHAIN_ROOT)
+    else:
+        schema_editor.execute(BACKFILL_CHAIN_ROOT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0002_task_chain_root'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_chain_root, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:45
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+from project_tracking.functions import elapsed_seconds
+
+
+def build_time_rollups(apps, schema_editor):
+    Task = apps.get_model('project_tracking', 'Task')
+    TimeRollup = apps.get_model('project_tracking', 'TimeRollup')
+    closed = Task.objects.filter(ended_at__isnull=False, project__isnull=False).order_by()
+    rollups = [TimeRollup(project_id=project_id, closed_seconds=seconds)
+               for project_id, seconds in closed.values_list('project_id').annotate(seconds=Sum(elapsed_seconds()))]
+    chains = closed.values_list('project_id', Coalesce('chain_root', 'id'))
+    rollups += [TimeRollup(project_id=project_id, chain_root_id=root_id, closed_seconds=seconds)
+                for project_id, root_id, seconds in chains.annotate(seconds=Sum(elapsed_seconds()))]
+    TimeRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0003_backfill_task_chain_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('closed_seconds', models.BigIntegerField(default=0)),
+                ('chain_root', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='time_rollup', to='project_tracking.Task')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='project_tracking.Project')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='timerollup',
+            constraint=models.UniqueConstraint(condition=models.Q(chain_root__isnull=True), fields=('project',), name='unique_project_time_rollup'),
+        ),
+        migrations.RunPython(build_time_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('project_tracking', '0004_timerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveTask',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='active_task', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='project_tracking.Task')),
+            ],
+        ),
+    ]
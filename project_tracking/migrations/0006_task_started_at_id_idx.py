@@ -0,0 +1,17 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0005_activetask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['started_at', 'id'], name='task_started_at_id_idx'),
+        ),
+    ]
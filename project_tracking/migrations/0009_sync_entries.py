@@ -0,0 +1,59 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_sync_entries(apps, schema_editor):
+    Project = apps.get_model('project_tracking', 'Project')
+    Task = apps.get_model('project_tracking', 'Task')
+    SyncEntry = apps.get_model('project_tracking', 'SyncEntry')
+    SyncCounter = apps.get_model('project_tracking', 'SyncCounter')
+    entries = [SyncEntry(user_id=user_id, kind='project', object_id=project_id, seq=1)
+               for project_id, user_id in Project.objects.filter(user__isnull=False).values_list('id', 'user_id')]
+    entries += [SyncEntry(user_id=user_id, kind='task', object_id=task_id, seq=1)
+                for task_id, user_id in Task.objects.filter(project__user__isnull=False).values_list(
+                    'id', 'project__user_id')]
+    SyncEntry.objects.bulk_create(entries, batch_size=1000)
+    SyncCounter.objects.bulk_create([SyncCounter(user_id=user_id, seq=1)
+                                     for user_id in {entry.user_id for entry in entries}], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0011_update_proxy_permissions'),
+        ('project_tracking', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('task', 'Task'), ('project', 'Project')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='syncentry',
+            index=models.Index(fields=['user', 'seq'], name='sync_entry_user_seq_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='syncentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_sync_entry'),
+        ),
+        migrations.RunPython(build_sync_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 2.2.10 on 2026-10-18 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# the archive is range partitioned by started_at on postgresql, the primary key of a partitioned table must include
+# the partition key. the month partitions are created by archive_tasks, the default one takes anything else
+POSTGRESQL_ARCHIVE_SQL = """
+CREATE TABLE project_tracking_archivedtask (
+    id integer NOT NULL,
+    project_id integer NOT NULL REFERENCES project_tracking_project (id) DEFERRABLE INITIALLY DEFERRED,
+    cloned_from_id integer NULL,
+    chain_root_id integer NULL,
+    name varchar(250) NOT NULL,
+    started_at timestamp with time zone NOT NULL,
+    ended_at timestamp with time zone NOT NULL,
+    seconds_paused integer NOT NULL CHECK (seconds_paused >= 0),
+    seconds bigint NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, started_at)
+) PARTITION BY RANGE (started_at);
+CREATE TABLE project_tracking_archivedtask_default PARTITION OF project_tracking_archivedtask DEFAULT;
+CREATE INDEX archived_task_project_idx ON project_tracking_archivedtask (project_id, started_at);
+CREATE INDEX archived_task_chain_root_idx ON project_tracking_archivedtask (chain_root_id);
+"""
+
+
+def create_archive_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_ARCHIVE_SQL)
+    else:
+        schema_editor.create_model(apps.get_model('project_tracking', 'ArchivedTask'))
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('project_tracking', 'ArchivedTask'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0009_sync_entries'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='ArchivedTask',
+                fields=[
+                    ('id', models.IntegerField(primary_key=True, serialize=False)),
+                    ('cloned_from_id', models.IntegerField(blank=True, null=True)),
+                    ('chain_root_id', models.IntegerField(blank=True, null=True)),
+                    ('name', models.CharField(max_length=250)),
+                    ('started_at', models.DateTimeField()),
+                    ('ended_at', models.DateTimeField()),
+                    ('seconds_paused', models.PositiveIntegerField(default=0)),
+                    ('seconds', models.BigIntegerField(help_text='seconds the task added to the TimeRollup of its project')),
+                    ('updated_at', models.DateTimeField()),
+                    ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                    ('project', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='project_tracking.Project')),
+                ],
+                options={
+                    'indexes': [
+                        models.Index(fields=['project', 'started_at'], name='archived_task_project_idx'),
+                        models.Index(fields=['chain_root_id'], name='archived_task_chain_root_idx'),
+                    ],
+                },
+            ),
+        ]),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.10 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project_tracking', '0010_archivedtask'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_started_at_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_project_started_at_idx',
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'started_at', 'id'], name='task_project_started_at_id_idx'),
+        ),
+    ]
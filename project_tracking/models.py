@@ -1,60 +1,444 @@
-from django.db import models
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager
+from django.db import connections, models, router, transaction
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, IntegerField, Max, OuterRef, \
+    Prefetch, Q, Subquery, Sum, Value, When, sql
+from django.db.models.deletion import Collector
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .cache import bump_data_version
+from .functions import DurationSeconds, Now, elapsed_seconds
+from .replicas import pin_primary
+
+SYNC_COUNTER_SQL = """
+INSERT INTO {table} (user_id, seq) VALUES (%s, 1)
+ON CONFLICT (user_id) DO UPDATE SET seq = {table}.seq + 1 RETURNING seq
+"""
+SYNC_ENTRY_SQL = """
+INSERT INTO {table} (user_id, kind, object_id, seq, deleted) VALUES {values}
+ON CONFLICT (kind, object_id) DO UPDATE SET user_id = excluded.user_id, seq = excluded.seq, deleted = excluded.deleted
+"""
+SYNC_ENTRY_FIELDS = ('user_id', 'kind', 'object_id', 'seq', 'deleted')
+
+
+def format_seconds(total_seconds):
+    """
+    :return: given seconds formated as hours, minutes and seconds
+    """
+    hours, remainder = divmod(int(total_seconds), 60 * 60)
+    minutes, seconds = divmod(remainder, 60)
+    return '{} hrs {} mins {} secs'.format(hours, minutes, seconds)
+
+
+def can_return_rows_from_update(connection):
+    """
+    Determine whether the database supports UPDATE ... RETURNING
+    """
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return connection.vendor == 'postgresql'
+
+
+def can_upsert(connection):
+    """
+    Determine whether the database supports INSERT ... ON CONFLICT DO UPDATE
+    """
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 24)
+    return connection.vendor == 'postgresql'
+
+
+def paused_seconds():
+    """
+    :return: expression with the seconds_paused of a task once the current pause is finished
+    """
+    pause_seconds = DurationSeconds(ExpressionWrapper(Now() - F('paused_at'), output_field=DurationField()))
+    return Case(When(paused_at__isnull=False, then=F('seconds_paused') + pause_seconds),
+                default=F('seconds_paused'))
+
+
+def open_tasks_seconds(*args, **lookups):
+    """
+    :return: subquery with the seconds of the open tasks (running or paused) matching the given lookups
+    """
+    tasks = Task.objects.filter(*args, ended_at__isnull=True, **lookups).order_by().values('project')
+    return Subquery(tasks.annotate(seconds=Sum(elapsed_seconds())).values('seconds'), output_field=IntegerField())
+
+
+def track_changes(user_id, tasks=(), projects=(), deleted=False):
+    """
+    record the changed tasks and projects of the user for the delta sync, invalidate the cached summaries and pin the
+    reads of the user to the primary database
+    :param tasks: ids of the changed tasks
+    :param projects: ids of the changed projects
+    :param deleted: True when the tasks and projects have been deleted
+    """
+    if user_id is None:
+        return
+    with transaction.atomic(savepoint=False):
+        SyncEntry.record(user_id, tasks=tasks, projects=projects, deleted=deleted)
+        bump_data_version(user_id)
+        pin_primary(user_id)
+
+
+def delete_tasks(objs, using, archived=False):
+    """
+    delete the tasks or the archived tasks with the objects cascaded by their foreign keys, e.g. the continued tasks.
+    the tombstones of the deleted tasks and their closed seconds taken out of the TimeRollup are recorded in bulk,
+    so no per task signal is sent
+    :param objs: list of Task or ArchivedTask instances
+    :param archived: True when the tasks have been moved to the archive, they keep the tombstones and the seconds
+    :return: the same as QuerySet.delete
+    """
+    collector = Collector(using=using)
+    collector.collect(objs)
+    with transaction.atomic(using=using, savepoint=False):
+        if not archived:
+            tasks = collector.data.get(Task, ())
+            archived_tasks = collector.data.get(ArchivedTask, ())
+            TimeRollup.remove_tasks_closed_seconds([(task, task.closed_seconds) for task in tasks] +
+                                                   [(task, task.seconds) for task in archived_tasks])
+            deleted = list(tasks) + list(archived_tasks)
+            users = dict(Project.objects.filter(id__in={task.project_id for task in deleted}).values_list(
+                'id', 'user_id'))
+            user_tasks = defaultdict(list)
+            for task in deleted:
+                user_tasks[users.get(task.project_id)].append(task.id)
+            for user_id, task_ids in user_tasks.items():
+                track_changes(user_id, tasks=task_ids, deleted=True)
+        return collector.delete()
+
+
+def closed_seconds(**lookups):
+    """
+    :return: subquery with the closed seconds stored in the TimeRollup matching the given lookups
+    """
+    rollups = TimeRollup.objects.filter(**lookups).values('closed_seconds')[:1]
+    return Subquery(rollups, output_field=IntegerField())
+
+
+class ProjectQuerySet(models.QuerySet):
+
+    def with_time_totals(self, include_running=True):
+        """
+        annotate total_seconds, the time spend in all the tasks of each project,
+        read from the project TimeRollup plus the live seconds of its open tasks
+        :param include_running: False to leave out the seconds of the running tasks
+        """
+        project_closed_seconds = closed_seconds(project=OuterRef('pk'), chain_root__isnull=True)
+        open_lookups = {} if include_running else {'paused_at__isnull': False}
+        return self.annotate(total_seconds=Coalesce(project_closed_seconds, 0) +
+                             Coalesce(open_tasks_seconds(project=OuterRef('pk'), **open_lookups), 0))
+
+    def with_task_summaries(self, include_running=True):
+        """
+        prefetch the root tasks of each project with the seconds of its continued tasks, and the archived root tasks,
+        used by project_tasks
+        :param include_running: False to leave out the seconds of the running tasks
+        """
+        root_tasks = Task.objects.filter(chain_root__isnull=True).with_chain_seconds(include_running).order_by('id')
+        archived_roots = ArchivedTask.objects.filter(chain_root_id__isnull=True).with_chain_seconds().order_by('id')
+        return self.prefetch_related(Prefetch('task_set', queryset=root_tasks, to_attr='root_tasks'),
+                                     Prefetch('archived_tasks', queryset=archived_roots, to_attr='archived_roots'))
+
+    def watermark(self):
+        """
+        :return: dict with the last updated_at and the count of the projects, it changes with every project change
+        """
+        return self.order_by().aggregate(updated_at=Max('updated_at'), count=Count('id'))
+
+
+class TaskQuerySet(models.QuerySet):
+
+    def with_elapsed_seconds(self):
+        """
+        annotate elapsed_seconds, the same value returned by Task.get_total_task_seconds
+        """
+        return self.annotate(elapsed_seconds=elapsed_seconds())
+
+    def with_chain_seconds(self, include_running=True):
+        """
+        annotate chain_seconds, the seconds of each root task plus the seconds of every task in its continuation chain,
+        read from the chain TimeRollup plus the live seconds of the open tasks of the chain
+        :param include_running: False to leave out the seconds of the running tasks
+        """
+        open_lookups = {} if include_running else {'paused_at__isnull': False}
+        open_chain_seconds = open_tasks_seconds(Q(pk=OuterRef('pk')) | Q(chain_root=OuterRef('pk')), **open_lookups)
+        return self.annotate(chain_seconds=Coalesce(closed_seconds(chain_root=OuterRef('pk')), 0) +
+                             Coalesce(open_chain_seconds, 0))
+
+    def total_seconds(self):
+        """
+        :return: sum of the seconds spend in the tasks of the queryset
+        """
+        return self.aggregate(total=Coalesce(Sum(elapsed_seconds()), 0))['total']
+
+    def watermark(self):
+        """
+        :return: dict with the last updated_at and the count of the tasks, it changes with every task change,
+         and the id and started_at of the running task, if any
+        """
+        running = Q(ended_at__isnull=True, paused_at__isnull=True)
+        return self.order_by().aggregate(updated_at=Max('updated_at'), count=Count('id'),
+                                         running_task=Max('id', filter=running),
+                                         running_since=Max('started_at', filter=running))
+
+    def update_returning(self, **kwargs):
+        """
+        update the tasks of the queryset and return them with the new values,
+        in a single UPDATE ... RETURNING statement when the database supports it
+        the updates do not go through Task.save, the caller must call track_changes for the tasks owner
+        """
+        self._for_write = True
+        kwargs.setdefault('updated_at', Now())
+        connection = connections[self.db]
+        if not can_return_rows_from_update(connection):
+            with transaction.atomic(using=self.db, savepoint=False):
+                ids = list(self.select_for_update().values_list('id', flat=True))
+                self.model.objects.filter(id__in=ids).update(**kwargs)
+                return list(self.model.objects.filter(id__in=ids))
+
+        query = self.query.chain(sql.UpdateQuery)
+        query.add_update_values(kwargs)
+        query._annotations = None
+        compiler = query.get_compiler(self.db)
+        compiler.pre_sql_setup()
+        update_sql, params = compiler.as_sql()
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.model._meta.concrete_fields)
+        with transaction.mark_for_rollback_on_error(using=self.db):
+            return list(self.model.objects.db_manager(self.db).raw(
+                '{0} RETURNING {1}'.format(update_sql, columns), params))
+
+    def pause(self):
+        """
+        pause the running tasks of the queryset
+        :return: list of paused tasks
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            tasks = self.filter(ended_at__isnull=True, paused_at__isnull=True).update_returning(paused_at=Now())
+            ActiveTask.objects.filter(task__in=tasks).update(task=None)
+        return tasks
+
+    def resume(self):
+        """
+        resume the paused tasks of the queryset, the caller must claim the ActiveTask of the user
+        :return: list of resumed tasks
+        """
+        return self.filter(ended_at__isnull=True, paused_at__isnull=False).update_returning(
+            seconds_paused=paused_seconds(), paused_at=None)
+
+    def toggle_paused(self):
+        """
+        pause the running tasks and resume the paused tasks of the queryset in a single statement,
+        the caller must claim the ActiveTask of the user for the resumed tasks
+        :return: list of updated tasks
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            tasks = self.filter(ended_at__isnull=True).update_returning(
+                seconds_paused=paused_seconds(),
+                paused_at=Case(When(paused_at__isnull=True, then=Now()), default=None))
+            ActiveTask.objects.filter(task__in=[task for task in tasks if task.is_paused]).update(task=None)
+        return tasks
+
+    def close(self):
+        """
+        close the open tasks of the queryset and add their seconds to the TimeRollup
+        :return: list of closed tasks
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            tasks = self.filter(ended_at__isnull=True).update_returning(
+                seconds_paused=paused_seconds(), paused_at=None, ended_at=Now())
+            TimeRollup.add_tasks_closed_seconds([(task, task.closed_seconds) for task in tasks])
+            ActiveTask.objects.filter(task__in=tasks).update(task=None)
+        return tasks
+
+    def restart(self):
+        """
+        restore the defaults of the open tasks of the queryset, the caller must claim the ActiveTask of the user
+        :return: list of restarted tasks
+        """
+        return self.filter(ended_at__isnull=True).update_returning(
+            started_at=Now(), ended_at=None, seconds_paused=0, paused_at=None)
+
+    def delete(self, archived=False):
+        """
+        delete the tasks with the tasks of their continuation chains, see delete_tasks
+        """
+        self._for_write = True
+        deleted = delete_tasks(list(self), self.db, archived=archived)
+        self._result_cache = None
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def closed_seconds_by_project(self):
+        """
+        :return: dict of project id and seconds of the closed tasks, computed from the task rows
+        """
+        closed = self.filter(ended_at__isnull=False, project__isnull=False).order_by()
+        return dict(closed.values_list('project_id').annotate(seconds=Sum(elapsed_seconds())))
+
+    def closed_seconds_by_chain(self):
+        """
+        :return: dict of (project id, chain root id) and seconds of the closed tasks, computed from the task rows
+        """
+        closed = self.filter(ended_at__isnull=False, project__isnull=False).order_by()
+        chains = closed.values_list('project_id', Coalesce('chain_root', 'id'))
+        return {(project_id, root_id): seconds
+                for project_id, root_id, seconds in chains.annotate(seconds=Sum(elapsed_seconds()))}
+
+
+class ArchivedTaskQuerySet(models.QuerySet):
+
+    def with_chain_seconds(self):
+        """
+        annotate chain_seconds, the seconds of each archived root task plus the seconds of its continued tasks
+        """
+        chain = ArchivedTask.objects.filter(Q(pk=OuterRef('pk')) | Q(chain_root_id=OuterRef('pk'))).order_by()
+        chain_seconds = chain.values(root=Coalesce('chain_root_id', 'id')).annotate(seconds_sum=Sum('seconds'))
+        return self.annotate(chain_seconds=Coalesce(Subquery(chain_seconds.values('seconds_sum'),
+                                                             output_field=IntegerField()), 0))
+
+    def delete(self):
+        """
+        delete the archived tasks, see delete_tasks
+        """
+        self._for_write = True
+        deleted = delete_tasks(list(self), self.db)
+        self._result_cache = None
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def closed_seconds_by_project(self):
+        """
+        :return: dict of project id and seconds of the archived tasks
+        """
+        return dict(self.order_by().values_list('project_id').annotate(seconds=Sum('seconds')))
 
 
 class Project(models.Model):
     name = models.CharField(max_length=200)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProjectQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='project_user_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            track_changes(self.user_id, projects=[self.id])
+
     @property
     def total_spend_time(self):
         """
         :return: calculated time spend in all tasks for the current project
         """
-        total_seconds = 0
-        for task in self.task_set.all():
-            total_seconds += task.get_total_task_seconds()
-
-        hours, remainder = divmod(total_seconds, 60 * 60)
-        minutes, seconds = divmod(remainder, 60)
-        return '{} hrs {} mins {} secs'.format(hours, minutes, seconds)
+        return format_seconds(Project.objects.with_time_totals().get(pk=self.pk).total_seconds)
 
     @property
     def project_tasks(self):
         """
         :return: list of tasks related to the project having count of tasks that have been continued
         """
-        data = []
-        for task in self.task_set.exclude(cloned_from__isnull=False):
-            task_seconds = 0
-            task_seconds += task.get_total_task_seconds()
-            for sub_task in task.task_set.all():
-                task_seconds += sub_task.get_total_task_seconds()
-
-            hours, remainder = divmod(task_seconds, 60 * 60)
-            minutes, seconds = divmod(remainder, 60)
-            spend_time = '{} hrs {} mins {} secs'.format(hours, minutes, seconds)
-            data.append({"name": task.name, "spend_time": spend_time})
+        return [{"name": task.name, "spend_time": format_seconds(task.chain_seconds)} for task in self.all_root_tasks()]
 
-        return data
+    def all_root_tasks(self):
+        """
+        :return: list of root tasks of the project with their chain_seconds, the archived ones included, ordered by id.
+         the prefetched root_tasks and archived_roots are used when they are there
+        """
+        root_tasks = getattr(self, 'root_tasks', None)
+        if root_tasks is None:
+            root_tasks = self.task_set.filter(chain_root__isnull=True).with_chain_seconds().order_by('id')
+        archived_roots = getattr(self, 'archived_roots', None)
+        if archived_roots is None:
+            archived_roots = self.archived_tasks.filter(chain_root_id__isnull=True).with_chain_seconds().order_by('id')
+        if not archived_roots:
+            return list(root_tasks)
+        return sorted(list(root_tasks) + [task.as_task() for task in archived_roots], key=lambda task: task.id)
 
 
 class Task(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True)
     cloned_from = models.ForeignKey('self', blank=True, null=True, on_delete=models.CASCADE)
+    chain_root = models.ForeignKey('self', blank=True, null=True, on_delete=models.CASCADE,
+                                   related_name='chain_tasks')
     name = models.CharField(default='Unnamed task', max_length=250)
     started_at = models.DateTimeField()
     ended_at = models.DateTimeField(blank=True, null=True)
     seconds_paused = models.PositiveIntegerField(default=0)
     paused_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'started_at', 'id'], name='task_project_started_at_id_idx'),
+            models.Index(fields=['project'], condition=Q(ended_at__isnull=True, paused_at__isnull=True),
+                         name='task_running_idx'),
+            models.Index(fields=['project'], condition=Q(ended_at__isnull=True), name='task_open_idx'),
+            models.Index(fields=['project', 'updated_at'], name='task_project_updated_at_idx'),
+        ]
 
     def __str__(self):
         return '{0}-{1}'.format(self.name, self.project)
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            with transaction.atomic(savepoint=False):
+                # the task may have been changed by hand, e.g. through the api, the rollups get the difference
+                # with the stored row
+                previous = Task.objects.select_for_update().filter(pk=self.pk).first()
+                super().save(*args, **kwargs)
+                if previous is not None:
+                    TimeRollup.add_tasks_closed_seconds([(previous, -previous.closed_seconds),
+                                                         (self, self.closed_seconds)])
+                    # e.g. closed or paused through the admin, the ActiveTask must not keep pointing to it
+                    if previous.is_running != self.is_running:
+                        ActiveTask.track(self)
+                self.track_change()
+            return
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if self.is_closed:
+                TimeRollup.add_closed_seconds(self, self.closed_seconds)
+            elif self.is_running:
+                ActiveTask.track(self)
+            self.track_change()
+
+    def delete(self, using=None, keep_parents=False):
+        return delete_tasks([self], using or router.db_for_write(Task, instance=self))
+
+    def track_change(self):
+        """
+        record the change of the task for the delta sync of the project owner
+        """
+        if self.project_id is not None:
+            track_changes(self.project.user_id, tasks=[self.id])
+
+    @contextmanager
+    def transition(self):
+        """
+        run the changes made inside the block in a single transaction,
+        the ActiveTask of the user and the TimeRollup of the task project and chain are kept in sync by save
+        """
+        with transaction.atomic(savepoint=False):
+            yield
+
     def get_total_task_seconds(self):
         """
         :return: calculated seconds between started_at filed and ended_at field without the seconds_paused
@@ -75,10 +459,14 @@ class Task(models.Model):
         """
         :return: formated time pass
         """
-        total_seconds = self.get_total_task_seconds()
-        hours, remainder = divmod(total_seconds, 60 * 60)
-        minutes, seconds = divmod(remainder, 60)
-        return '{} hrs {} mins {} secs'.format(hours, minutes, seconds)
+        return format_seconds(self.get_total_task_seconds())
+
+    @property
+    def closed_seconds(self):
+        """
+        seconds this task adds to the TimeRollup, only closed tasks are accumulated
+        """
+        return self.get_total_task_seconds() if self.is_closed else 0
 
     @property
     def is_paused(self):
@@ -94,23 +482,32 @@ class Task(models.Model):
         """
         return bool(self.ended_at)
 
+    @property
+    def is_running(self):
+        """
+        Determine whether this entry is neither paused nor closed
+        """
+        return not self.is_closed and not self.is_paused
+
     def pause(self):
         """
         If this entry is not paused, pause it.
         """
         if not self.is_paused:
-            self.paused_at = timezone.now()
-            self.save()
+            with self.transition():
+                self.paused_at = timezone.now()
+                self.save()
 
     def unpause(self):
         """
         reset paused_at field and update senconds_paused field with seconds pass since the last pause
         """
         if self.is_paused:
-            delta = timezone.now() - self.paused_at
-            self.seconds_paused += delta.seconds
-            self.paused_at = None
-            self.save()
+            with self.transition():
+                delta = timezone.now() - self.paused_at
+                self.seconds_paused += delta.seconds
+                self.paused_at = None
+                self.save()
 
     def toggle_paused(self):
         """
@@ -126,17 +523,308 @@ class Task(models.Model):
         """
         add current datetime to the ended_at field to close the task
         """
-        if self.is_paused:
-            self.unpause()
-        self.ended_at = timezone.now()
-        self.save()
+        with self.transition():
+            if self.is_paused:
+                self.unpause()
+            self.ended_at = timezone.now()
+            self.save()
 
     def restart(self):
         """
         restore tasks defaults
         """
-        self.started_at = timezone.now()
-        self.ended_at = None
-        self.seconds_paused = 0
-        self.paused_at = None
-        self.save()
+        with self.transition():
+            self.started_at = timezone.now()
+            self.ended_at = None
+            self.seconds_paused = 0
+            self.paused_at = None
+            self.save()
+
+
+class ArchivedTask(models.Model):
+    """
+    closed task moved out of the task table by archive_tasks, with the id it had there. the continuation chains are
+    archived whole once all their tasks are closed and rolled up, so the chain_root and cloned_from ids always point
+    to other archived tasks. on postgresql the table is partitioned by started_at month
+    """
+    id = models.IntegerField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, db_index=False, related_name='archived_tasks')
+    cloned_from_id = models.IntegerField(blank=True, null=True)
+    chain_root_id = models.IntegerField(blank=True, null=True)
+    name = models.CharField(max_length=250)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    seconds_paused = models.PositiveIntegerField(default=0)
+    seconds = models.BigIntegerField(help_text='seconds the task added to the TimeRollup of its project')
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = ArchivedTaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'started_at'], name='archived_task_project_idx'),
+            models.Index(fields=['chain_root_id'], name='archived_task_chain_root_idx'),
+        ]
+
+    def __str__(self):
+        return '{0}-{1}'.format(self.name, self.project_id)
+
+    def as_task(self):
+        """
+        :return: unsaved closed task with the values of the archived task, read only
+        """
+        task = Task(id=self.id, project_id=self.project_id, cloned_from_id=self.cloned_from_id,
+                    chain_root_id=self.chain_root_id, name=self.name, started_at=self.started_at,
+                    ended_at=self.ended_at, seconds_paused=self.seconds_paused, updated_at=self.updated_at)
+        if hasattr(self, 'chain_seconds'):
+            task.chain_seconds = self.chain_seconds
+        return task
+
+    def delete(self, using=None, keep_parents=False):
+        return delete_tasks([self], using or router.db_for_write(ArchivedTask, instance=self))
+
+
+class TimeRollup(models.Model):
+    """
+    accumulated seconds of the closed tasks of a project (without chain_root) or of a continuation chain
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    chain_root = models.OneToOneField(Task, blank=True, null=True, on_delete=models.CASCADE,
+                                      related_name='time_rollup')
+    closed_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project'], condition=Q(chain_root__isnull=True),
+                                    name='unique_project_time_rollup'),
+        ]
+
+    def __str__(self):
+        return '{0}-{1}'.format(self.project_id, self.chain_root_id or '')
+
+    @classmethod
+    def add_closed_seconds(cls, task, seconds):
+        """
+        add the given seconds to the rollups of the task project and chain, creating the rollups when missing
+        """
+        cls.add_tasks_closed_seconds([(task, seconds)])
+
+    @classmethod
+    def tasks_seconds_update(cls, tasks_seconds):
+        """
+        :return: queryset with the rollups of the projects and chains of the (task, seconds) pairs, CASE expression
+         with the seconds of each rollup, dict of project id and seconds and dict of chain root id and project id
+        """
+        project_seconds = defaultdict(int)
+        chain_seconds = defaultdict(int)
+        chain_projects = {}
+        for task, seconds in tasks_seconds:
+            if not seconds or task.project_id is None:
+                continue
+            root_id = task.chain_root_id or task.id
+            project_seconds[task.project_id] += seconds
+            chain_seconds[root_id] += seconds
+            chain_projects[root_id] = task.project_id
+
+        rollups = cls.objects.filter(Q(project_id__in=project_seconds, chain_root__isnull=True) |
+                                     Q(chain_root_id__in=chain_seconds))
+        seconds = Case(*[When(project_id=project_id, chain_root__isnull=True, then=Value(project_total))
+                         for project_id, project_total in project_seconds.items()],
+                       *[When(chain_root_id=root_id, then=Value(chain_total))
+                         for root_id, chain_total in chain_seconds.items()],
+                       default=Value(0), output_field=models.BigIntegerField())
+        return rollups, seconds, project_seconds, chain_projects
+
+    @classmethod
+    def remove_tasks_closed_seconds(cls, tasks_seconds):
+        """
+        take the seconds of each (task, seconds) pair out of the existing rollups of the task project and chain
+        in a single UPDATE
+        """
+        rollups, seconds, project_seconds, chain_projects = cls.tasks_seconds_update(tasks_seconds)
+        if project_seconds:
+            rollups.update(closed_seconds=F('closed_seconds') - seconds)
+
+    @classmethod
+    def add_tasks_closed_seconds(cls, tasks_seconds):
+        """
+        add the seconds of each (task, seconds) pair to the rollups of the task project and chain
+        in a single UPDATE. when rollups are missing, e.g. for imported tasks, they are created with a single
+        bulk_create before the UPDATE is run again
+        """
+        rollups, seconds, project_seconds, chain_projects = cls.tasks_seconds_update(tasks_seconds)
+        if not project_seconds:
+            return
+
+        expected_rollups = len(project_seconds) + len(chain_projects)
+        try:
+            # the savepoint undoes the UPDATE when rollups are missing
+            with transaction.atomic():
+                if rollups.update(closed_seconds=F('closed_seconds') + seconds) != expected_rollups:
+                    raise cls.DoesNotExist
+        except cls.DoesNotExist:
+            existing = set(rollups.values_list('project_id', 'chain_root_id'))
+            existing_projects = {project_id for project_id, root_id in existing if root_id is None}
+            existing_chains = {root_id for project_id, root_id in existing}
+            missing = [cls(project_id=project_id) for project_id in project_seconds
+                       if project_id not in existing_projects]
+            missing += [cls(project_id=project_id, chain_root_id=root_id) for root_id, project_id in
+                        chain_projects.items() if root_id not in existing_chains]
+            # the rollups created meanwhile by other transactions are left as they are
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            rollups.update(closed_seconds=F('closed_seconds') + seconds)
+
+
+class ActiveTask(models.Model):
+    """
+    running task of each user, the row is locked to start or resume tasks one at a time.
+    Task.save and the api keep it in sync, the tasks changed with plain queryset updates are not seen until the row
+    is rebuilt, which is done when it is missing
+    """
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='active_task')
+    task = models.ForeignKey(Task, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+
+    def __str__(self):
+        return '{0}-{1}'.format(self.user_id, self.task_id)
+
+    @classmethod
+    def lock(cls, user, exclude=None):
+        """
+        :param exclude: task left out when the missing ActiveTask is built from the running tasks
+        :return: the ActiveTask of the user, locked until the end of the current transaction
+        """
+        try:
+            return cls.objects.select_for_update().get(user=user)
+        except cls.DoesNotExist:
+            running_tasks = Task.objects.filter(project__user=user, ended_at__isnull=True, paused_at__isnull=True)
+            if exclude is not None:
+                running_tasks = running_tasks.exclude(id=exclude.id)
+            task_id = running_tasks.order_by('-started_at').values_list('id', flat=True).first()
+            return cls.objects.select_for_update().get_or_create(user=user, defaults={'task_id': task_id})[0]
+
+    @classmethod
+    def claim(cls, user, task):
+        """
+        point the ActiveTask of the user to the given running task
+        :return: False when the user has other task running
+        """
+        active_task = cls.lock(user, exclude=task)
+        if active_task.task_id not in (None, task.id):
+            return False
+        if active_task.task_id != task.id:
+            active_task.task = task
+            active_task.save(update_fields=['task'])
+        return True
+
+    @classmethod
+    def track(cls, task):
+        """
+        point the ActiveTask of the task user to the task when it is running, or clear it otherwise
+        """
+        if task.is_running:
+            cls.objects.filter(user__project=task.project_id).update(task=task)
+        else:
+            cls.objects.filter(task=task).update(task=None)
+
+
+class SyncEntry(models.Model):
+    """
+    last change of each task and project for the delta sync, seq grows with every change of the user.
+    the deleted objects are kept as tombstones. the user is not a database constraint so the entries of
+    the tasks deleted together with their user can be recorded
+    """
+    TASK = 'task'
+    PROJECT = 'project'
+    KIND_CHOICES = ((TASK, 'Task'), (PROJECT, 'Project'))
+
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    seq = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_sync_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='sync_entry_user_seq_idx'),
+        ]
+
+    def __str__(self):
+        return '{0}-{1}-{2}'.format(self.kind, self.object_id, self.seq)
+
+    @classmethod
+    def record(cls, user_id, tasks=(), projects=(), deleted=False):
+        """
+        give the next seq of the user to the entries of the tasks and projects.
+        the SyncCounter of the user stays locked until the end of the transaction, so the changes of the user
+        are committed in seq order and a sync never skips a seq committed later
+        """
+        changes = [(cls.TASK, object_id) for object_id in set(tasks)]
+        changes += [(cls.PROJECT, object_id) for object_id in set(projects)]
+        if not changes:
+            return
+        using = router.db_for_write(cls)
+        connection = connections[using]
+        with transaction.atomic(using=using, savepoint=False):
+            seq = SyncCounter.next_seq(user_id)
+            if can_upsert(connection):
+                # a single INSERT ... ON CONFLICT DO UPDATE for each batch of entries
+                table = connection.ops.quote_name(cls._meta.db_table)
+                batch_size = connection.ops.bulk_batch_size(SYNC_ENTRY_FIELDS, changes)
+                with transaction.mark_for_rollback_on_error(using=using), connection.cursor() as cursor:
+                    for start in range(0, len(changes), batch_size):
+                        batch = changes[start:start + batch_size]
+                        values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                        params = [value for kind, object_id in batch
+                                  for value in (user_id, kind, object_id, seq, deleted)]
+                        cursor.execute(SYNC_ENTRY_SQL.format(table=table, values=values), params)
+                return
+
+            for kind in (cls.TASK, cls.PROJECT):
+                object_ids = {object_id for change_kind, object_id in changes if change_kind == kind}
+                if not object_ids:
+                    continue
+                entries = cls.objects.filter(kind=kind, object_id__in=object_ids)
+                existing = set(entries.values_list('object_id', flat=True))
+                if existing:
+                    entries.update(user_id=user_id, seq=seq, deleted=deleted)
+                cls.objects.bulk_create([
+                    cls(user_id=user_id, kind=kind, object_id=object_id, seq=seq, deleted=deleted)
+                    for object_id in object_ids - existing
+                ])
+
+
+class SyncCounter(models.Model):
+    """
+    last seq given to the SyncEntry rows of each user
+    """
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                related_name='+')
+    seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '{0}-{1}'.format(self.user_id, self.seq)
+
+    @classmethod
+    def next_seq(cls, user_id):
+        """
+        increment the counter of the user, creating it when missing. the row stays locked until the end of the
+        transaction
+        :return: the new seq of the user
+        """
+        using = router.db_for_write(cls)
+        connection = connections[using]
+        if can_upsert(connection) and can_return_rows_from_update(connection):
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with transaction.mark_for_rollback_on_error(using=using), connection.cursor() as cursor:
+                cursor.execute(SYNC_COUNTER_SQL.format(table=table), [user_id])
+                return cursor.fetchone()[0]
+
+        counters = cls.objects.filter(user_id=user_id)
+        if not counters.update(seq=F('seq') + 1):
+            cls.objects.bulk_create([cls(user_id=user_id)], ignore_conflicts=True)
+            counters.update(seq=F('seq') + 1)
+        return counters.values_list('seq', flat=True).get()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from rest_framework.pagination import CursorPagination
+
+
+class TaskCursorPagination(CursorPagination):
+    """
+    keyset pagination for the task list, newest tasks first. the id breaks the ties between tasks
+    started at the same time, all the fields are covered by the task_project_started_at_id_idx index.
+    the clients opt in with the cursor or page_size query params, without them the list is the bare array
+    """
+    ordering = ('-started_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        :return: None, to list every task, when the request asks for no page
+        """
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view=view)
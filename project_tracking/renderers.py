@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode_default(obj):
+    """
+    encode the values unknown to orjson and msgpack (datetimes, decimals, uuids, lazy strings...) the same way as
+    the JSONEncoder of rest framework, so the output does not depend on the renderer
+    """
+    return JSONEncoder().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    application/json renderer with orjson, the output is the same as JSONRenderer with compact separators.
+    falls back to JSONRenderer when orjson is not installed or when an indent is requested
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        content = orjson.dumps(data, default=encode_default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        # JSONRenderer escapes the line and paragraph separators, which are not valid in javascript strings
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    """
+    application/json parser with orjson, falls back to JSONParser when orjson is not installed
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    application/msgpack renderer for the internal clients, only offered when msgpack is installed
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """
+    application/msgpack parser, only offered when msgpack is installed
+    """
+    media_type = 'application/msgpack'
+    available = msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read() if stream is not None else b'', raw=False)
+        except ValueError as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
+
+class AvailableContentNegotiation(DefaultContentNegotiation):
+    """
+    content negotiation that leaves out the renderers and parsers whose library is not installed, the clients that
+    ask only for those get a 406 or a 415 instead of a server error
+    """
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(request, [parser for parser in parsers if getattr(parser, 'available', True)])
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'project_tracking:primary_pin:{}'
+DEFAULT_READ_REPLICAS = {
+    'DATABASES': [],
+    'PIN_SECONDS': 10,
+}
+
+state = threading.local()
+
+
+def get_replica_settings():
+    """
+    :return: READ_REPLICAS of the settings with the missing options taken from DEFAULT_READ_REPLICAS
+    """
+    return dict(DEFAULT_READ_REPLICAS, **getattr(settings, 'READ_REPLICAS', {}))
+
+
+def replica_reads_enabled():
+    """
+    :return: True when the reads of the current thread are sent to the replicas
+    """
+    return getattr(state, 'replica_reads', False) and bool(get_replica_settings()['DATABASES'])
+
+
+def set_replica_reads(enabled):
+    state.replica_reads = enabled
+
+
+def pin_primary(user_id):
+    """
+    send the reads of the user to the primary for PIN_SECONDS, so the user sees its own writes while the replicas
+    catch up. the window starts again when the current transaction is committed
+    """
+    if user_id is None:
+        return
+    key = PRIMARY_PIN_KEY.format(user_id)
+    timeout = get_replica_settings()['PIN_SECONDS']
+    cache.set(key, True, timeout)
+    transaction.on_commit(lambda: cache.set(key, True, timeout))
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(PRIMARY_PIN_KEY.format(user_id)) is not None
+
+
+def pinned_users(user_ids):
+    """
+    :return: set of the given user ids whose reads are pinned to the primary
+    """
+    keys = {PRIMARY_PIN_KEY.format(user_id): user_id for user_id in user_ids}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+class ReadReplicaRouter(object):
+    """
+    send the reads to a random database of READ_REPLICAS['DATABASES'] while set_replica_reads is enabled in the
+    thread, everything else goes to the default database. the replicas are never migrated
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads_enabled():
+            return random.choice(get_replica_settings()['DATABASES'])
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replica_settings()['DATABASES']:
+            return False
+        return None
+
+
+class ReplicaReadMixin(object):
+    """
+    read the data of the safe requests (GET, HEAD, OPTIONS) from the replicas, unless the user has changed its data
+    in the last READ_REPLICAS['PIN_SECONDS']. the users are authenticated with the default database
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        set_replica_reads(request.method in SAFE_METHODS and not is_pinned(request.user.pk))
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            set_replica_reads(False)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from django.db import connection
+from django.utils import timezone
+
+GRANULARITIES = ('day', 'week', 'month')
+MAX_BUCKETS = 1000
+
+POSTGRESQL_REPORT_SQL = """
+WITH buckets AS (
+    SELECT bucket,
+           bucket AT TIME ZONE %(time_zone)s AS starts_at,
+           (bucket + %(step)s::interval) AT TIME ZONE %(time_zone)s AS ends_at
+    FROM generate_series(date_trunc(%(granularity)s, %(start)s::timestamp), %(end)s::timestamp,
+                         %(step)s::interval) AS bucket
+), tasks AS (
+    SELECT task.project_id, task.started_at, COALESCE(task.ended_at, task.paused_at, %(now)s) AS ended_at
+    FROM project_tracking_task task
+    INNER JOIN project_tracking_project project ON project.id = task.project_id
+    WHERE project.user_id = %(user_id)s {project_filter}
+    UNION ALL
+    SELECT task.project_id, task.started_at, task.ended_at
+    FROM project_tracking_archivedtask task
+    INNER JOIN project_tracking_project project ON project.id = task.project_id
+    WHERE project.user_id = %(user_id)s {project_filter}
+)
+SELECT tasks.project_id, to_char(buckets.bucket, 'YYYY-MM-DD'),
+       CAST(TRUNC(SUM(EXTRACT(EPOCH FROM LEAST(tasks.ended_at, buckets.ends_at) -
+                                         GREATEST(tasks.started_at, buckets.starts_at)))) AS BIGINT)
+FROM tasks
+INNER JOIN buckets ON tasks.started_at < buckets.ends_at AND tasks.ended_at > buckets.starts_at
+GROUP BY tasks.project_id, buckets.bucket
+ORDER BY tasks.project_id, buckets.bucket
+"""
+
+SQLITE_REPORT_SQL = """
+WITH buckets (bucket, starts_at, ends_at) AS (VALUES {buckets}),
+tasks AS (
+    SELECT task.project_id, task.started_at, COALESCE(task.ended_at, task.paused_at, %s) AS ended_at
+    FROM project_tracking_task task
+    INNER JOIN project_tracking_project project ON project.id = task.project_id
+    WHERE project.user_id = %s {project_filter}
+    UNION ALL
+    SELECT task.project_id, task.started_at, task.ended_at
+    FROM project_tracking_archivedtask task
+    INNER JOIN project_tracking_project project ON project.id = task.project_id
+    WHERE project.user_id = %s {project_filter}
+)
+SELECT tasks.project_id, buckets.bucket,
+       CAST(SUM(ROUND((JULIANDAY(MIN(tasks.ended_at, buckets.ends_at)) -
+                       JULIANDAY(MAX(tasks.started_at, buckets.starts_at))) * 86400, 3)) AS INTEGER)
+FROM tasks
+INNER JOIN buckets ON tasks.started_at < buckets.ends_at AND tasks.ended_at > buckets.starts_at
+GROUP BY tasks.project_id, buckets.bucket
+ORDER BY tasks.project_id, buckets.bucket
+"""
+
+
+def truncate_date(value, granularity):
+    """
+    :return: first day of the bucket that contains the date, weeks start on monday like date_trunc
+    """
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value, granularity):
+    """
+    :return: first day of the bucket that follows the one starting at value
+    """
+    if granularity == 'week':
+        return value + timedelta(days=7)
+    if granularity == 'month':
+        return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def bucket_dates(start, end, granularity):
+    """
+    :return: list with the first day of every bucket between the start and end dates, both included
+    """
+    dates = []
+    value = truncate_date(start, granularity)
+    while value <= end:
+        dates.append(value)
+        value = next_bucket(value, granularity)
+    return dates
+
+
+def local_midnight(value, time_zone):
+    """
+    :return: aware datetime for the start of the date in the given time zone
+    """
+    return timezone.make_aware(datetime(value.year, value.month, value.day), time_zone)
+
+
+def time_report(user, start, end, granularity='day', project_id=None, now=None):
+    """
+    spend time of the user tasks, archived or not, split by bucket in the current time zone. every task counts from
+    started_at to ended_at, paused_at or now, like Task.get_total_task_seconds, and the part of the task that falls
+    in each bucket is added to that bucket, so the tasks that cross midnight are split between the days.
+    :param start: first date of the report, the report starts at the beginning of its bucket
+    :param end: last date of the report, the report ends at the end of its bucket
+    :return: list of (project id, bucket first day in iso format, seconds) ordered by project and bucket,
+     the empty buckets are left out
+    """
+    if now is None:
+        now = timezone.now()
+    time_zone = timezone.get_current_timezone()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            params = {
+                'user_id': user.pk,
+                'project_id': project_id,
+                'time_zone': str(time_zone),
+                'granularity': granularity,
+                'step': '1 {}'.format(granularity),
+                'start': datetime(start.year, start.month, start.day),
+                'end': datetime(end.year, end.month, end.day),
+                'now': now,
+            }
+            project_filter = 'AND task.project_id = %(project_id)s' if project_id is not None else ''
+            cursor.execute(POSTGRESQL_REPORT_SQL.format(project_filter=project_filter), params)
+        else:
+            # the bucket boundaries are computed here because sqlite has no time zone support
+            dates = bucket_dates(start, end, granularity)
+            bucket_params = []
+            for bucket in dates:
+                bucket_params.extend([
+                    bucket.isoformat(),
+                    connection.ops.adapt_datetimefield_value(local_midnight(bucket, time_zone)),
+                    connection.ops.adapt_datetimefield_value(
+                        local_midnight(next_bucket(bucket, granularity), time_zone)),
+                ])
+            task_params = [user.pk]
+            project_filter = ''
+            if project_id is not None:
+                project_filter = 'AND task.project_id = %s'
+                task_params.append(project_id)
+            # the archived tasks are filtered with the same params
+            params = bucket_params + [connection.ops.adapt_datetimefield_value(now)] + task_params * 2
+            sql = SQLITE_REPORT_SQL.format(buckets=', '.join(['(%s, %s, %s)'] * len(dates)),
+                                           project_filter=project_filter)
+            cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
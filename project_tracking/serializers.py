@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.models import User
-from .models import Project, Task
+from .models import Project, Task, format_seconds
 
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -12,14 +13,39 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'started_at', 'ended_at', 'spend_time', 'is_paused', 'seconds_paused', 'is_closed')
 
 
+class SyncTaskSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Task
+        fields = ('id', 'project', 'cloned_from', 'chain_root', 'name', 'started_at', 'ended_at', 'paused_at',
+                  'seconds_paused', 'spend_time', 'is_paused', 'is_closed', 'updated_at')
+
+
+class SyncProjectSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Project
+        fields = ('id', 'name', 'updated_at')
+
+
 class ProjectSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=True,  max_length=200,
                                  validators=[UniqueValidator(queryset=Project.objects.all())])
+    total_spend_time = serializers.SerializerMethodField()
 
     class Meta:
         model = Project
         fields = ('id', 'name', 'total_spend_time', 'project_tasks')
 
+    def get_total_spend_time(self, obj):
+        """
+        use the total_seconds annotated by ProjectQuerySet.with_time_totals when is available
+        """
+        total_seconds = getattr(obj, 'total_seconds', None)
+        if total_seconds is None:
+            return obj.total_spend_time
+        return format_seconds(total_seconds)
+
 
 class UserProjectSerializer(serializers.ModelSerializer):
     username = serializers.CharField(max_length=32)
@@ -29,3 +55,36 @@ class UserProjectSerializer(serializers.ModelSerializer):
         model = User
         fields = ('username', 'project_set')
 
+
+TASK_ROW_FIELDS = ('id', 'name', 'started_at', 'ended_at', 'paused_at', 'seconds_paused', 'elapsed_seconds')
+
+
+def task_rows_data(rows):
+    """
+    same output as TaskSerializer(many=True).data, built from the .values(*TASK_ROW_FIELDS) rows of a queryset
+    annotated with_elapsed_seconds, without model instances nor the per field dispatch of the serializer
+    """
+    datetime_to_representation = serializers.DateTimeField().to_representation
+    return [OrderedDict((
+        ('id', row['id']),
+        ('name', row['name']),
+        ('started_at', datetime_to_representation(row['started_at'])),
+        ('ended_at', datetime_to_representation(row['ended_at'])),
+        ('spend_time', format_seconds(row['elapsed_seconds'])),
+        ('is_paused', bool(row['paused_at'])),
+        ('seconds_paused', row['seconds_paused']),
+        ('is_closed', bool(row['ended_at'])),
+    )) for row in rows]
+
+
+def projects_data(projects):
+    """
+    same output as ProjectSerializer(many=True).data for projects with the total_seconds annotation
+    and the prefetched root_tasks
+    """
+    return [OrderedDict((
+        ('id', project.id),
+        ('name', project.name),
+        ('total_spend_time', format_seconds(project.total_seconds)),
+        ('project_tasks', project.project_tasks),
+    )) for project in projects]
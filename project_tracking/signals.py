@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .authentication import bump_auth_stamp
+from .models import ArchivedTask, Project, Task, track_changes
+
+
+@receiver(pre_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    """
+    keep the tombstones of the deleted project and of its tasks, archived or not, for the delta sync. the tasks are
+    deleted by the cascade without going through delete_tasks, their rollups are deleted with the project
+    """
+    task_ids = list(Task.objects.filter(project=instance).values_list('id', flat=True))
+    task_ids += ArchivedTask.objects.filter(project=instance).values_list('id', flat=True)
+    track_changes(instance.user_id, tasks=task_ids, projects=[instance.id], deleted=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    drop the cached authentication of the user, e.g. after a password change or a deactivation
+    """
+    bump_auth_stamp(instance.pk)
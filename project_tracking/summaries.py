@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from django.core.cache import cache
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .cache import get_data_versions, is_shared_cache, summaries_key
+from .models import Project, Task
+from .replicas import get_replica_settings, pinned_users, replica_reads_enabled
+
+# seconds the summaries are cached when the cache is local to each process, the data version bumped by a process is
+# not seen by the others, so they serve the summaries they have cached until they expire
+LOCAL_CACHE_TIMEOUT = 5
+
+
+def summary_projects_query(user_ids):
+    """
+    :return: queryset with the projects of the users, their totals and root tasks without the running tasks
+    """
+    projects = Project.objects.filter(user_id__in=user_ids).with_time_totals(include_running=False)
+    return projects.with_task_summaries(include_running=False).order_by('id')
+
+
+def running_tasks_query(user_ids):
+    """
+    :return: queryset with the user id, project id, chain root id and started_at of the running tasks of the users
+    """
+    running_tasks = Task.objects.filter(project__user_id__in=user_ids, ended_at__isnull=True, paused_at__isnull=True)
+    return running_tasks.values_list('project__user_id', 'project_id', Coalesce('chain_root', 'id'), 'started_at')
+
+
+def compute_summaries(user_ids):
+    """
+    :return: dict of user id and the summary of the user projects, the seconds of the running tasks are left out
+     because they change on every request, the running tasks are kept apart to add their seconds when the summary
+     is used
+    """
+    summaries = {user_id: {'projects': [], 'running': []} for user_id in user_ids}
+    for project in summary_projects_query(user_ids):
+        summaries[project.user_id]['projects'].append((
+            project.id, project.name, project.total_seconds,
+            [(task.id, task.name, task.chain_seconds) for task in project.all_root_tasks()],
+        ))
+    for user_id, project_id, root_id, started_at in running_tasks_query(user_ids):
+        summaries[user_id]['running'].append((project_id, root_id, started_at))
+    return summaries
+
+
+def get_summaries(user_ids):
+    """
+    :return: dict of user id and summary of the user projects, read from the cache entry of the current data version
+     of each user, the missing entries are computed together and cached without timeout, or for LOCAL_CACHE_TIMEOUT
+     when the cache is not shared by the processes. the summaries computed from a replica may miss the last changes,
+     they are cached only for READ_REPLICAS['PIN_SECONDS'], and not at all for the users pinned to the primary, whose
+     own requests would read them
+    """
+    versions = get_data_versions(user_ids)
+    keys = {summaries_key(user_id, version): user_id for user_id, version in versions.items()}
+    summaries = {keys[key]: summary for key, summary in cache.get_many(list(keys)).items()}
+    missing = [user_id for user_id in user_ids if user_id not in summaries]
+    if missing:
+        computed = compute_summaries(missing)
+        timeout = None if is_shared_cache() else LOCAL_CACHE_TIMEOUT
+        cached = missing
+        if replica_reads_enabled():
+            timeout = get_replica_settings()['PIN_SECONDS']
+            pinned = pinned_users(missing)
+            cached = [user_id for user_id in missing if user_id not in pinned]
+        cache.set_many({summaries_key(user_id, versions[user_id]): computed[user_id] for user_id in cached}, timeout)
+        summaries.update(computed)
+    return summaries
+
+
+def summary_projects(summary, now=None):
+    """
+    :return: list of unsaved projects with the total_seconds and root_tasks used by ProjectSerializer,
+     the seconds of the running tasks are added up to now and the archived root tasks are already in root_tasks
+    """
+    now = now or timezone.now()
+    project_seconds = {}
+    chain_seconds = {}
+    for project_id, root_id, started_at in summary['running']:
+        seconds = int((now - started_at).total_seconds())
+        project_seconds[project_id] = project_seconds.get(project_id, 0) + seconds
+        chain_seconds[root_id] = chain_seconds.get(root_id, 0) + seconds
+
+    projects = []
+    for project_id, name, total_seconds, root_tasks in summary['projects']:
+        project = Project(id=project_id, name=name)
+        project.total_seconds = total_seconds + project_seconds.get(project_id, 0)
+        project.root_tasks = []
+        project.archived_roots = []
+        for task_id, task_name, seconds in root_tasks:
+            task = Task(id=task_id, name=task_name, project_id=project_id)
+            task.chain_seconds = seconds + chain_seconds.get(task_id, 0)
+            project.root_tasks.append(task)
+        projects.append(project)
+    return projects
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import base64
+from .models import ArchivedTask, Project, SyncEntry, Task
+
+SYNC_PAGE_SIZE = 500
+
+
+def encode_token(seq):
+    """
+    :return: opaque sync token for the given seq
+    """
+    return base64.urlsafe_b64encode('seq:{}'.format(seq).encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    :return: seq of the sync token, 0 when there is no token
+    :raise ValueError: when the token is not valid
+    """
+    if not token:
+        return 0
+    try:
+        value = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sync token')
+    prefix, _, seq = value.partition(':')
+    if prefix != 'seq' or not seq.isdigit():
+        raise ValueError('Invalid sync token')
+    return int(seq)
+
+
+def changes_since(user, seq, page_size=SYNC_PAGE_SIZE):
+    """
+    read the entries of the user after the seq through the (user, seq) index, the entries with the same seq
+    are never split between pages
+    :return: changed projects, changed tasks (the archived ones included), deleted project ids, deleted task ids,
+     last seq and whether there are more changes after the last seq
+    """
+    entries = SyncEntry.objects.filter(user=user, seq__gt=seq).order_by('seq', 'id')
+    page = list(entries.values_list('kind', 'object_id', 'seq', 'deleted')[:page_size + 1])
+    more = len(page) > page_size
+    if more and page[page_size][2] == page[page_size - 1][2]:
+        # the last seq continues in the next page, it is left for the next sync or read whole when it fills the page
+        last_seq = page[page_size - 1][2]
+        complete = [entry for entry in page[:page_size] if entry[2] != last_seq]
+        if complete:
+            page = complete
+        else:
+            page = list(entries.filter(seq=last_seq).values_list('kind', 'object_id', 'seq', 'deleted'))
+            more = entries.filter(seq__gt=last_seq).exists()
+    elif more:
+        page = page[:page_size]
+    last_seq = page[-1][2] if page else seq
+
+    changed = {SyncEntry.PROJECT: [], SyncEntry.TASK: []}
+    deleted = {SyncEntry.PROJECT: [], SyncEntry.TASK: []}
+    for kind, object_id, entry_seq, is_deleted in page:
+        (deleted if is_deleted else changed)[kind].append(object_id)
+    projects = Project.objects.filter(user=user, id__in=changed[SyncEntry.PROJECT]).order_by('id')
+    tasks = list(Task.objects.filter(project__user=user, id__in=changed[SyncEntry.TASK]).order_by('id'))
+    if len(tasks) < len(changed[SyncEntry.TASK]):
+        archived = ArchivedTask.objects.filter(project__user=user, id__in=changed[SyncEntry.TASK])
+        tasks = sorted(tasks + [task.as_task() for task in archived], key=lambda task: task.id)
+    return projects, tasks, sorted(deleted[SyncEntry.PROJECT]), sorted(deleted[SyncEntry.TASK]), last_seq, more
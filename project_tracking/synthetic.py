@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import ActiveTask, ArchivedTask, Project, Task, TimeRollup, track_changes
+
+MAX_CHAIN_LENGTH = 4
+TRACK_CHUNK_SIZE = 500
+
+
+def next_ids(model, count, *shared_models):
+    """
+    :param shared_models: other models with ids taken from the same sequence, e.g. ArchivedTask for Task
+    :return: range of ids after the last id of the models, used to link the rows before a bulk insert
+    """
+    first_id = max(shared_model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+                   for shared_model in (model,) + shared_models) + 1
+    return range(first_id, first_id + count)
+
+
+def reset_sequences(models):
+    """
+    move the sequences of the models after the ids given by hand, postgresql does not do it by itself
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def build_user_tasks(rng, projects, tasks_per_project, now, running, paused_fraction):
+    """
+    :return: unsaved tasks of the projects of a user, one after the other back in time from now. the tasks of each
+     project are grouped in continuation chains, only the last task of a project can be paused or running
+    """
+    slots = [project for project in projects for _ in range(tasks_per_project)]
+    rng.shuffle(slots)
+    # the slots go from the newest to the oldest, each one starts some time before the next one ends
+    project_tasks = {project.id: [] for project in projects}
+    ended_at = now
+    for project in slots:
+        started_at = ended_at - timedelta(seconds=rng.randint(600, 3 * 3600))
+        task = Task(project=project, started_at=started_at, ended_at=ended_at,
+                    seconds_paused=rng.choice((0, 0, rng.randint(60, 900))))
+        project_tasks[project.id].insert(0, task)
+        ended_at = started_at - timedelta(seconds=rng.randint(0, 8 * 3600))
+
+    for project in projects:
+        tasks = project_tasks[project.id]
+        if tasks and rng.random() < paused_fraction:
+            last_task = tasks[-1]
+            last_task.paused_at, last_task.ended_at = last_task.ended_at, None
+    if running and slots:
+        newest_task = project_tasks[slots[0].id][-1]
+        newest_task.ended_at = newest_task.paused_at = None
+
+    for project in projects:
+        tasks = project_tasks[project.id]
+        position = 0
+        while position < len(tasks):
+            chain = tasks[position:position + rng.randint(1, MAX_CHAIN_LENGTH)]
+            name = 'task {}'.format(rng.randint(1, 10 ** 6))
+            for previous_task, task in zip([None] + chain, chain):
+                task.name = name
+                task.chain_root = chain[0] if previous_task else None
+                task.cloned_from = previous_task
+            position += len(chain)
+    return [task for project in projects for task in project_tasks[project.id]]
+
+
+@transaction.atomic
+def generate_dataset(users, projects, tasks, seed=0, now=None, password=None, running_fraction=0.5,
+                     paused_fraction=0.2, prefix='bench'):
+    """
+    insert users with their projects and tasks with bulk inserts, keeping the time rollups, the active tasks and
+    the sync entries as the api does
+    :param users: number of users
+    :param projects: projects of each user
+    :param tasks: tasks of each project
+    :param password: password of all the users, unusable when None
+    :param running_fraction: chance of a user to have a running task
+    :param paused_fraction: chance of the last task of a project to be paused
+    :return: list of the created users
+    """
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    hashed_password = make_password(password)
+    user_objects = [User(id=user_id, username='{}-{}-{}'.format(prefix, seed, user_id), password=hashed_password)
+                    for user_id in next_ids(User, users)]
+    User.objects.bulk_create(user_objects)
+    project_objects = [Project(id=project_id, user=user_objects[index // projects],
+                               name='project {}'.format(project_id))
+                       for index, project_id in enumerate(next_ids(Project, users * projects))]
+    Project.objects.bulk_create(project_objects)
+
+    task_objects = []
+    for index, user in enumerate(user_objects):
+        task_objects.extend(build_user_tasks(rng, project_objects[index * projects:(index + 1) * projects], tasks,
+                                             now, rng.random() < running_fraction, paused_fraction))
+    # ids in chronological order, so the chain roots and the cloned tasks are inserted before their continuations
+    task_objects.sort(key=lambda task: task.started_at)
+    task_ids = next_ids(Task, len(task_objects), ArchivedTask)
+    for task, task_id in zip(task_objects, task_ids):
+        task.id = task_id
+    for task in task_objects:
+        task.chain_root_id = task.chain_root.id if task.chain_root else None
+        task.cloned_from_id = task.cloned_from.id if task.cloned_from else None
+    Task.objects.bulk_create(task_objects)
+    reset_sequences([User, Project, Task])
+
+    ActiveTask.objects.bulk_create([ActiveTask(user_id=task.project.user_id, task_id=task.id)
+                                    for task in task_objects if task.is_running])
+    new_tasks = Task.objects.filter(id__gte=task_ids.start)
+    rollups = [TimeRollup(project_id=project_id, chain_root_id=None, closed_seconds=seconds)
+               for project_id, seconds in new_tasks.closed_seconds_by_project().items()]
+    rollups += [TimeRollup(project_id=project_id, chain_root_id=root_id, closed_seconds=seconds)
+                for (project_id, root_id), seconds in new_tasks.closed_seconds_by_chain().items()]
+    TimeRollup.objects.bulk_create(rollups)
+
+    changes = {user.id: {'tasks': [], 'projects': []} for user in user_objects}
+    for project in project_objects:
+        changes[project.user_id]['projects'].append(project.id)
+    for task in task_objects:
+        changes[task.project.user_id]['tasks'].append(task.id)
+    for user_id, user_changes in changes.items():
+        # chunks under the 999 parameters of the older sqlite versions
+        for start in range(0, max(len(user_changes['tasks']), 1), TRACK_CHUNK_SIZE):
+            track_changes(user_id, tasks=user_changes['tasks'][start:start + TRACK_CHUNK_SIZE],
+                          projects=user_changes['projects'] if not start else ())
+    return user_objects
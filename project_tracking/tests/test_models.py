@@ -1,7 +1,23 @@
+import json
+import tempfile
 import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+import numpy as np
+from io import StringIO
+from django.core.management import call_command, CommandError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from mixer.backend.django import mixer
-from project_tracking.models import Task, Project, User
+from project_tracking.archive import archive_tasks
+from project_tracking.heatmap import hour_buckets, interval_heatmap, reference_heatmap, user_heatmap
+from project_tracking.importers import import_batch
+from project_tracking.models import Task, Project, User, TimeRollup, ActiveTask, ArchivedTask, SyncEntry
+from project_tracking.summaries import running_tasks_query, summary_projects_query
+from project_tracking.synthetic import generate_dataset
+from project_tracking.views import TasksViewSet
 
 
 class ProjectTestCase(TestCase):
@@ -23,6 +39,19 @@ class ProjectTestCase(TestCase):
         self.assertIn('spend_time', str(self.project.project_tasks))
         self.assertIn('name', str(self.project.project_tasks))
 
+    def test_project_tasks_property_aggregates_the_whole_continuation_chain(self):
+        now = timezone.now()
+        root = mixer.blend(Task, project=self.project, started_at=now - timedelta(hours=3),
+                           ended_at=now - timedelta(hours=2))
+        child = mixer.blend(Task, project=self.project, cloned_from=root, chain_root=root,
+                            started_at=now - timedelta(hours=2), ended_at=now - timedelta(hours=1))
+        mixer.blend(Task, project=self.project, cloned_from=child, chain_root=root,
+                    started_at=now - timedelta(minutes=30), ended_at=now)
+        # the root tasks and the archived root tasks
+        with self.assertNumQueries(2):
+            project_tasks = self.project.project_tasks
+        self.assertEqual(project_tasks, [{"name": root.name, "spend_time": '2 hrs 30 mins 0 secs'}])
+
     def test_project_total_spend_time_property_when_there_is_no_tasks(self):
         self.assertEqual('0 hrs 0 mins 0 secs', self.project.total_spend_time)
 
@@ -30,6 +59,23 @@ class ProjectTestCase(TestCase):
         task = mixer.blend(Task, project=self.project)
         self.assertNotEqual('0 hrs 0 mins 0 secs', self.project.total_spend_time)
 
+    def test_with_time_totals_matches_task_seconds(self):
+        now = timezone.now()
+        mixer.blend(Task, project=self.project, started_at=now - timedelta(hours=2, microseconds=500),
+                    ended_at=now - timedelta(hours=1))
+        mixer.blend(Task, project=self.project, started_at=now - timedelta(minutes=30, seconds=7),
+                    paused_at=now - timedelta(minutes=10), seconds_paused=20)
+        mixer.blend(Task, project=self.project, started_at=now - timedelta(seconds=95, microseconds=300))
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            expected = sum(task.get_total_task_seconds() for task in self.project.task_set.all())
+            project = Project.objects.with_time_totals().get(id=self.project.id)
+            self.assertEqual(project.total_seconds, expected)
+            self.assertEqual(self.project.task_set.total_seconds(), expected)
+
+    def test_with_time_totals_when_there_is_no_tasks(self):
+        project = Project.objects.with_time_totals().get(id=self.project.id)
+        self.assertEqual(project.total_seconds, 0)
+
 
 class TaskTestCase(TestCase):
     def setUp(self) -> None:
@@ -65,6 +111,40 @@ class TaskTestCase(TestCase):
         self.assertEqual(self.task.is_paused, False)
         self.assertGreater(self.task.seconds_paused, 0)
 
+    def test_task_methods_track_the_active_task(self):
+        active_task = ActiveTask.lock(self.user)
+        self.assertEqual(active_task.task_id, self.task.id)
+        self.task.pause()
+        self.assertIsNone(ActiveTask.objects.get(user=self.user).task_id)
+        self.task.unpause()
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, self.task.id)
+        self.task.close()
+        self.assertIsNone(ActiveTask.objects.get(user=self.user).task_id)
+        self.task.restart()
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, self.task.id)
+
+    def test_queryset_transitions_are_guarded_updates(self):
+        tasks = Task.objects.filter(id=self.task.id)
+        paused = tasks.toggle_paused()
+        self.assertEqual([task.id for task in paused], [self.task.id])
+        self.assertTrue(paused[0].is_paused)
+        self.assertEqual(tasks.pause(), [])
+        resumed = tasks.resume()
+        self.assertFalse(resumed[0].is_paused)
+        self.assertEqual(tasks.resume(), [])
+        closed = tasks.close()
+        self.assertTrue(closed[0].is_closed)
+        self.assertEqual(Task.objects.get(id=self.task.id).ended_at, closed[0].ended_at)
+        self.assertEqual(tasks.close(), [])
+        self.assertEqual(tasks.restart(), [])
+        self.assertEqual(TimeRollup.objects.get(chain_root=self.task).closed_seconds, closed[0].closed_seconds)
+
+    def test_update_returning_without_returning_support(self):
+        with mock.patch('project_tracking.models.can_return_rows_from_update', return_value=False):
+            closed = Task.objects.filter(id=self.task.id).close()
+        self.assertEqual([task.id for task in closed], [self.task.id])
+        self.assertTrue(closed[0].is_closed)
+
     def test_task_close_method(self):
         self.task.close()
         self.assertIsNone(self.task.paused_at)
@@ -76,3 +156,361 @@ class TaskTestCase(TestCase):
         self.assertIsNone(self.task.paused_at)
         self.assertEqual(self.task.seconds_paused, 0)
         self.assertIsNotNone(self.task.started_at)
+
+
+class TimeRollupTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = mixer.blend(User, username='test')
+        self.project = mixer.blend(Project, user=self.user)
+        self.task = mixer.blend(Task, project=self.project, started_at=timezone.now() - timedelta(hours=1))
+
+    def get_closed_seconds(self, **lookups):
+        return TimeRollup.objects.get(**lookups).closed_seconds
+
+    def test_close_method_adds_the_task_seconds_to_project_and_chain(self):
+        self.task.close()
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 3600)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 3600)
+        continued = mixer.blend(Task, project=self.project, cloned_from=self.task, chain_root=self.task,
+                                started_at=timezone.now() - timedelta(minutes=30))
+        continued.close()
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 5400)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 5400)
+        self.assertEqual(TimeRollup.objects.count(), 2)
+
+    def test_closing_several_tasks_updates_the_rollups_in_one_statement(self):
+        other_project = mixer.blend(Project, user=self.user)
+        started_at = timezone.now() - timedelta(hours=1)
+        other_task = mixer.blend(Task, project=other_project, started_at=started_at)
+        continued = mixer.blend(Task, project=self.project, chain_root=self.task, cloned_from=self.task,
+                                started_at=started_at)
+        TimeRollup.add_closed_seconds(self.task, 1)
+        TimeRollup.add_closed_seconds(other_task, 1)
+        with CaptureQueriesContext(connection) as queries:
+            Task.objects.filter(id__in=[self.task.id, other_task.id, continued.id]).close()
+        statements = [query['sql'].split(' ')[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('UPDATE'), 3)
+        self.assertNotIn('SELECT', statements)
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 7201)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 7201)
+        self.assertEqual(self.get_closed_seconds(project=other_project, chain_root=None), 3601)
+
+    def test_restart_method_removes_the_closed_seconds(self):
+        self.task.close()
+        self.task.restart()
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 0)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 0)
+
+    def test_pause_and_unpause_methods_keep_the_closed_seconds(self):
+        self.task.pause()
+        self.task.unpause()
+        self.assertFalse(TimeRollup.objects.exists())
+
+    def test_deleted_tasks_are_taken_out_of_the_rollups(self):
+        self.task.close()
+        continued = mixer.blend(Task, project=self.project, cloned_from=self.task, chain_root=self.task,
+                                started_at=timezone.now() - timedelta(minutes=30))
+        continued.close()
+        continued.delete()
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 3600)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 3600)
+        self.task.delete()
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 0)
+        call_command('rebuild_time_rollups', '--verify', stdout=StringIO())
+
+    def test_project_totals_add_the_open_tasks_to_the_rollup(self):
+        self.task.close()
+        mixer.blend(Task, project=self.project, started_at=timezone.now() - timedelta(minutes=10))
+        project = Project.objects.with_time_totals().get(id=self.project.id)
+        self.assertIn(project.total_seconds, (4200, 4201))
+
+    def test_import_batch_creates_the_rollups_with_constant_queries(self):
+        def import_rows(count):
+            rows = [(line_number, {'project': self.project.name, 'started_at': '2020-01-01T08:00:00Z',
+                                   'ended_at': '2020-01-01T08:10:00Z'}) for line_number in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(import_batch(self.user, rows), (count, []))
+            return len(queries)
+
+        import_rows(1)
+        self.assertEqual(import_rows(50), import_rows(5))
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 56 * 600)
+        self.assertEqual(TimeRollup.objects.count(), 57)
+
+    def test_import_tasks_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write('project,started_at,ended_at\n')
+            for day in range(1, 6):
+                csv_file.write('{0},2020-01-0{1}T08:00:00Z,2020-01-0{1}T08:10:00Z\n'.format(self.project.name, day))
+            csv_file.write('other,2020-01-01T08:00:00Z,2020-01-01T08:10:00Z\n')
+            csv_file.flush()
+            out = StringIO()
+            err = StringIO()
+            call_command('import_tasks', csv_file.name, '--user', self.user.username, '--batch-size', '2',
+                         stdout=out, stderr=err)
+        self.assertIn('5 tasks imported, 1 errors', out.getvalue())
+        self.assertIn('line 7: Invalid Project', err.getvalue())
+        self.assertEqual(self.get_closed_seconds(project=self.project, chain_root=None), 3000)
+        call_command('rebuild_time_rollups', '--verify', stdout=out)
+
+    def test_rebuild_command_verifies_and_rebuilds_the_rollups(self):
+        self.task.close()
+        out = StringIO()
+        call_command('rebuild_time_rollups', '--verify', stdout=out)
+        self.assertIn('2 time rollups verified', out.getvalue())
+        TimeRollup.objects.filter(chain_root=self.task).update(closed_seconds=10)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_time_rollups', '--verify', stdout=StringIO())
+        call_command('rebuild_time_rollups', stdout=out)
+        self.assertEqual(self.get_closed_seconds(chain_root=self.task), 3600)
+        call_command('rebuild_time_rollups', '--verify', stdout=out)
+
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = mixer.blend(User, username='test')
+        self.project = mixer.blend(Project, user=self.user)
+        started_at = timezone.now() - timedelta(days=400)
+        self.root = mixer.blend(Task, project=self.project, started_at=started_at,
+                                ended_at=started_at + timedelta(hours=1))
+        self.continued = mixer.blend(Task, project=self.project, chain_root=self.root, cloned_from=self.root,
+                                     started_at=started_at + timedelta(days=1),
+                                     ended_at=started_at + timedelta(days=1, minutes=30))
+        # the chain of this old task goes on with a recent one, it stays in the task table
+        self.old_root = mixer.blend(Task, project=self.project, started_at=started_at,
+                                    ended_at=started_at + timedelta(minutes=10))
+        self.recent = mixer.blend(Task, project=self.project, chain_root=self.old_root, cloned_from=self.old_root,
+                                  started_at=timezone.now() - timedelta(hours=2),
+                                  ended_at=timezone.now() - timedelta(hours=1))
+        self.paused = mixer.blend(Task, project=self.project, started_at=started_at, ended_at=None,
+                                  paused_at=started_at + timedelta(hours=1))
+        self.cutoff = timezone.now() - timedelta(days=365)
+
+    def test_archive_moves_the_old_closed_chains(self):
+        project_before = Project.objects.with_time_totals().get(id=self.project.id)
+        tasks_before = self.project.project_tasks
+        result = archive_tasks(self.cutoff)
+        self.assertEqual(result, {'chains': 1, 'tasks': 2, 'out_of_sync': []})
+        self.assertEqual(sorted(ArchivedTask.objects.values_list('id', flat=True)),
+                         [self.root.id, self.continued.id])
+        self.assertEqual(sorted(Task.objects.values_list('id', flat=True)),
+                         [self.old_root.id, self.recent.id, self.paused.id])
+        archived = ArchivedTask.objects.get(id=self.continued.id)
+        self.assertEqual((archived.chain_root_id, archived.seconds), (self.root.id, 1800))
+        self.assertEqual(Project.objects.with_time_totals().get(id=self.project.id).total_seconds,
+                         project_before.total_seconds)
+        self.assertEqual(self.project.project_tasks, tasks_before)
+        self.assertFalse(SyncEntry.objects.filter(deleted=True).exists())
+        call_command('rebuild_time_rollups', '--verify', stdout=StringIO())
+        self.assertEqual(archive_tasks(self.cutoff), {'chains': 0, 'tasks': 0, 'out_of_sync': []})
+
+    def test_archive_leaves_out_the_chains_with_rollups_out_of_sync(self):
+        TimeRollup.objects.filter(chain_root=self.root).update(closed_seconds=10)
+        self.assertEqual(archive_tasks(self.cutoff), {'chains': 0, 'tasks': 0, 'out_of_sync': [self.root.id]})
+        call_command('rebuild_time_rollups', stdout=StringIO())
+        self.assertEqual(archive_tasks(self.cutoff)['tasks'], 2)
+
+    def test_archive_tasks_command(self):
+        out = StringIO()
+        call_command('archive_tasks', '--days', '365', '--dry-run', stdout=out)
+        self.assertIn('2 tasks of 1 chains', out.getvalue())
+        self.assertFalse(ArchivedTask.objects.exists())
+        call_command('archive_tasks', '--before', timezone.localdate(self.cutoff).isoformat(), stdout=out)
+        self.assertEqual(ArchivedTask.objects.count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('archive_tasks', '--before', 'yesterday', stdout=out)
+
+    def test_deleting_the_project_keeps_tombstones_of_the_archived_tasks(self):
+        archive_tasks(self.cutoff)
+        self.project.delete()
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertEqual(set(SyncEntry.objects.filter(kind=SyncEntry.TASK, deleted=True).values_list(
+            'object_id', flat=True)), {self.root.id, self.continued.id, self.old_root.id, self.recent.id,
+                                       self.paused.id})
+
+    def test_deleting_archived_tasks_takes_them_out_of_the_rollup(self):
+        archive_tasks(self.cutoff)
+        ArchivedTask.objects.filter(id=self.continued.id).delete()
+        ArchivedTask.objects.get(id=self.root.id).delete()
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertEqual(set(SyncEntry.objects.filter(kind=SyncEntry.TASK, deleted=True).values_list(
+            'object_id', flat=True)), {self.root.id, self.continued.id})
+        call_command('rebuild_time_rollups', '--verify', stdout=StringIO())
+
+
+class WatermarkTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = mixer.blend(User, username='test')
+        self.project = mixer.blend(Project, user=self.user)
+
+    def test_queryset_transitions_update_the_watermark(self):
+        task = mixer.blend(Task, project=self.project)
+        tasks = Task.objects.filter(project=self.project)
+        watermark = tasks.watermark()
+        self.assertEqual(watermark['count'], 1)
+        self.assertEqual(watermark['running_task'], task.id)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=5)):
+            closed_task = tasks.close()[0]
+        self.assertGreater(closed_task.updated_at, task.updated_at)
+        self.assertEqual(tasks.watermark(), {'updated_at': closed_task.updated_at, 'count': 1,
+                                             'running_task': None, 'running_since': None})
+        self.assertEqual(Project.objects.filter(user=self.user).watermark(),
+                         {'updated_at': self.project.updated_at, 'count': 1})
+
+
+class TaskIndexTestCase(TestCase):
+
+    def setUp(self) -> None:
+        """
+        a few users with closed and continued tasks, a paused task per project and a single running task,
+        with the statistics of the tables up to date, so the plans are the ones of a real database
+        """
+        now = timezone.now()
+        for username in ('test', 'other'):
+            user = mixer.blend(User, username=username)
+            for i in range(2):
+                project = mixer.blend(Project, user=user)
+                for hours in range(10):
+                    task = mixer.blend(Task, project=project, started_at=now - timedelta(hours=hours + 1),
+                                       ended_at=now - timedelta(hours=hours))
+                    mixer.blend(Task, project=project, cloned_from=task, chain_root=task,
+                                started_at=now - timedelta(hours=hours + 1), ended_at=now - timedelta(hours=hours))
+                mixer.blend(Task, project=project, started_at=now, paused_at=now)
+        self.user = User.objects.get(username='test')
+        self.project = project
+        self.task = task
+        mixer.blend(Task, project=self.project, started_at=now)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, query_set):
+        """
+        :return: the query plan, the sequential scans are disabled on postgresql because with a few rows
+         they are cheaper than any index
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return query_set.explain()
+
+    def assertUsesIndex(self, query_set, index_name):
+        plan = self.explain(query_set)
+        self.assertNotIn('Seq Scan on project_tracking_task', plan)
+        self.assertNotRegex(plan, r'(?m)SCAN (TABLE )?project_tracking_task\b(?!.*USING)')
+        self.assertIn(index_name, plan)
+
+    def test_task_list_uses_the_composite_index(self):
+        view = TasksViewSet()
+        self.assertUsesIndex(view.task_rows(view.user_tasks(self.user)), 'task_project_started_at_id_idx')
+
+    def test_summary_running_tasks_use_the_running_index(self):
+        self.assertUsesIndex(running_tasks_query([self.user.id]), 'task_running_idx')
+
+    def test_project_open_tasks_seconds_use_the_open_index(self):
+        self.assertUsesIndex(summary_projects_query([self.user.id]), 'task_open_idx')
+        # the one of Project.total_spend_time, with the running tasks
+        self.assertUsesIndex(Project.objects.with_time_totals().filter(pk=self.project.pk), 'task_open_idx')
+
+    def test_chain_lookups_use_an_index(self):
+        self.assertUsesIndex(Task.objects.filter(cloned_from=self.task), 'cloned_from_id')
+        self.assertUsesIndex(Task.objects.filter(chain_root=self.task), 'chain_root_id')
+
+
+class HeatmapTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = mixer.blend(User, username='test')
+        self.project = mixer.blend(Project, user=self.user)
+
+    def local_datetime(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def test_vectorized_engine_matches_the_reference(self):
+        random = np.random.default_rng(1)
+        starts = random.uniform(0, 3 * 86400, 200)
+        ends = starts + random.exponential(5400, 200)
+        bucket_starts, bucket_ends = hour_buckets(np.arange(4) * 86400.0)
+        result = interval_heatmap(starts, ends, bucket_starts, bucket_ends)
+        expected = reference_heatmap(starts, ends, bucket_starts, bucket_ends)
+        for key in ('occupancy', 'busy', 'overlap'):
+            np.testing.assert_allclose(result[key], expected[key], atol=1e-3)
+        empty = interval_heatmap(np.array([]), np.array([]), bucket_starts, bucket_ends)
+        self.assertEqual(empty['occupancy'].sum(), 0)
+
+    def test_user_heatmap(self):
+        mixer.blend(Task, project=self.project, started_at=self.local_datetime(2020, 1, 1, 22, 30),
+                    ended_at=self.local_datetime(2020, 1, 2, 1))
+        mixer.blend(Task, project=self.project, started_at=self.local_datetime(2020, 1, 2, 0, 30),
+                    paused_at=self.local_datetime(2020, 1, 2, 2), seconds_paused=60)
+        mixer.blend(Task, project=self.project, started_at=self.local_datetime(2019, 12, 1, 8),
+                    ended_at=self.local_datetime(2019, 12, 1, 9))
+        heatmap = user_heatmap(self.user, date(2020, 1, 1), date(2020, 1, 2))
+        self.assertEqual(heatmap['days'], ['2020-01-01', '2020-01-02'])
+        self.assertEqual(heatmap['occupancy'][0][22:], [1800, 3600])
+        self.assertEqual(heatmap['occupancy'][1][:3], [5400, 3600, 0])
+        self.assertEqual(heatmap['overlap'][1][:3], [1800, 0, 0])
+        self.assertEqual(heatmap['busy_seconds'], 3.5 * 3600)
+        self.assertEqual(heatmap['overlap_seconds'], 1800)
+        self.assertEqual(heatmap['seconds_paused'], 60)
+        self.assertEqual(heatmap['daily_utilization'], [round(5400 / 86400, 4), round(7200 / 86400, 4)])
+
+    def test_bench_heatmap_command(self):
+        out = StringIO()
+        call_command('bench_heatmap', '--intervals', '50', '--days', '3', '--repeat', '1', stdout=out)
+        self.assertIn('speedup', out.getvalue())
+
+
+class RendererBenchmarkTestCase(TestCase):
+
+    def test_bench_renderers_command(self):
+        out = StringIO()
+        call_command('bench_renderers', tasks=50, repeat=1, stdout=out)
+        self.assertIn('50 tasks', out.getvalue())
+        self.assertIn('ORJSONRenderer', out.getvalue())
+        self.assertIn('MessagePackRenderer', out.getvalue())
+        self.assertFalse(Task.objects.exists())
+
+
+class SyntheticDatasetTestCase(TestCase):
+
+    def test_generate_dataset(self):
+        users = generate_dataset(3, 2, 6, seed=1, running_fraction=1, paused_fraction=0.5)
+        self.assertEqual(len(users), 3)
+        self.assertEqual(Project.objects.filter(user__in=users).count(), 6)
+        tasks = list(Task.objects.filter(project__user__in=users).order_by('started_at'))
+        self.assertEqual(len(tasks), 36)
+        for task in tasks:
+            if task.chain_root_id:
+                self.assertIsNone(task.chain_root.chain_root_id)
+                self.assertEqual(task.chain_root.project_id, task.project_id)
+                self.assertIn(task.cloned_from.chain_root_id, (None, task.chain_root_id))
+                self.assertIsNotNone(task.cloned_from.ended_at)
+            if not task.is_closed:
+                # only the last task of a project is open
+                self.assertFalse(Task.objects.filter(project=task.project, started_at__gt=task.started_at).exists())
+        for user in users:
+            running = Task.objects.filter(project__user=user, ended_at__isnull=True, paused_at__isnull=True)
+            self.assertEqual(running.count(), 1)
+            self.assertEqual(ActiveTask.objects.get(user=user).task, running.get())
+        call_command('rebuild_time_rollups', verify=True, stdout=StringIO())
+        # the sequences keep going after the given ids
+        self.assertGreater(mixer.blend(Task, project=tasks[0].project).id, tasks[-1].id)
+
+    def test_bench_endpoints_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('bench_endpoints', users=2, projects=2, tasks=3, requests=1, warmup=0,
+                         output=output.name, stdout=StringIO())
+            results = json.load(output)
+            out = StringIO()
+            call_command('bench_endpoints', users=2, projects=2, tasks=3, requests=1, warmup=0,
+                         compare=output.name, stdout=out)
+        self.assertEqual(results['dataset'], {'users': 2, 'projects': 2, 'tasks': 3, 'seed': 0})
+        self.assertEqual(len(results['routes']), 18)
+        for route in ('GET /users/', 'POST /tasks/', 'PUT /tasks/pause_resume/{id}/', 'PUT /tasks/close/{id}/',
+                      'PUT /tasks/restart/{id}/', 'POST /tasks/continue/'):
+            self.assertEqual(results['routes'][route]['errors'], 0)
+        self.assertEqual(sum(route['errors'] for route in results['routes'].values()), 0)
+        self.assertIn('compared with', out.getvalue())
+        self.assertFalse(Task.objects.exists())
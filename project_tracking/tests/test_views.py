@@ -1,9 +1,43 @@
+import base64
 import json
+import os
+import shutil
+import tempfile
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from io import StringIO
+import msgpack
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import LiveServerTestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
 from mixer.backend.django import mixer
-from project_tracking.models import Task, Project, User
-from rest_framework.test import APITestCase
+from project_tracking.archive import archive_tasks
+from project_tracking.authentication import CachedJWTAuthentication, UserLRUCache
+from project_tracking.cache import get_data_versions, summaries_key
+from project_tracking.checks import check_read_replicas_cache
+from project_tracking.loadtest import FLOW, VirtualUser, build_flow, collection_requests, histogram
+from project_tracking.models import Task, Project, User, ActiveTask, SyncCounter, SyncEntry, TimeRollup, \
+    can_return_rows_from_update, track_changes
+from project_tracking.renderers import MessagePackParser, MessagePackRenderer, ORJSONRenderer
+from project_tracking.replicas import PRIMARY_PIN_KEY, ReadReplicaRouter, pin_primary, set_replica_reads
+from project_tracking.serializers import ProjectSerializer, TaskSerializer, TASK_ROW_FIELDS, projects_data, \
+    task_rows_data
+from project_tracking.summaries import LOCAL_CACHE_TIMEOUT, get_summaries
+from project_tracking.sync import changes_since
+from project_tracking.views import MAX_BULK_TRANSITION_IDS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 
 class JWTAuthViewsTesCase(APITestCase):
@@ -33,9 +67,95 @@ class JWTAuthViewsTesCase(APITestCase):
         self.assertIn('access', json_data2.keys())
         self.assertNotIn('refresh', json_data2.keys())
 
+    def shared_cache(self):
+        """
+        :return: context manager with a file based cache, shared by the processes like memcached or redis
+        """
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        return override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}})
+
+    def test_cached_authentication_reads_the_user_once(self):
+        response = self.client.post('/api/v1/access_token/', {"username": "test", "password": "super_secret"})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + json.loads(response.content).get('access'))
+        with self.shared_cache():
+            self.assertEqual(200, self.client.get('/api/v1/sync/').status_code)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(200, self.client.get('/api/v1/sync/').status_code)
+        self.assertFalse([query for query in queries if 'auth_user' in query['sql']])
+
+    def test_cached_authentication_across_processes(self):
+        """
+        every process has its own user_cache, a deactivation done by one process is seen by the others through the
+        shared cache. with a cache local to each process the users are read on every request
+        """
+        processes = [CachedJWTAuthentication(), CachedJWTAuthentication()]
+        for process in processes:
+            process.user_cache = UserLRUCache(max_size=10, timeout=60)
+        token = processes[0].get_validated_token(str(AccessToken.for_user(self.user)))
+        with self.shared_cache():
+            for process in processes:
+                self.assertEqual(process.get_user(token).id, self.user.id)
+            self.user.is_active = False
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                processes[1].get_user(token)
+
+        self.user.is_active = True
+        self.user.save()
+        processes[1].get_user(token)
+        with CaptureQueriesContext(connection) as queries:
+            processes[1].get_user(token)
+        self.assertTrue([query for query in queries if 'auth_user' in query['sql']])
+
+    def test_cached_authentication_is_dropped_on_user_changes(self):
+        response = self.client.post('/api/v1/access_token/', {"username": "test", "password": "super_secret"})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + json.loads(response.content).get('access'))
+        with self.shared_cache():
+            self.assertEqual(200, self.client.get('/api/v1/sync/').status_code)
+            self.user.set_password('new_secret')
+            self.user.save()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(200, self.client.get('/api/v1/sync/').status_code)
+            self.assertTrue([query for query in queries if 'auth_user' in query['sql']])
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(401, self.client.get('/api/v1/sync/').status_code)
+
+    def test_user_lru_cache(self):
+        user_cache = UserLRUCache(max_size=2, timeout=60)
+        user_cache.set(1, 'first', 'a')
+        user_cache.set(2, 'second', 'a')
+        self.assertEqual(user_cache.get(1, 'a'), 'first')
+        user_cache.set(3, 'third', 'a')
+        self.assertIsNone(user_cache.get(2, 'a'))
+        self.assertIsNone(user_cache.get(1, 'b'))
+        self.assertIsNone(user_cache.get(1, 'a'))
+        with mock.patch('project_tracking.authentication.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(user_cache.get(3, 'a'))
+
+    def test_bench_auth_command(self):
+        out = StringIO()
+        call_command('bench_auth', '--requests', '5', stdout=out)
+        self.assertIn('JWTAuthentication: ', out.getvalue())
+        self.assertIn('CachedJWTAuthentication: ', out.getvalue())
+
+    def test_bench_auth_command_with_a_shared_cache(self):
+        """
+        with a shared cache the cached class does not read the users, the other one reads them on every request
+        """
+        out = StringIO()
+        with self.shared_cache():
+            call_command('bench_auth', '--requests', '5', stdout=out)
+        self.assertNotIn('does not cache the users', out.getvalue())
+        self.assertRegex(out.getvalue(), r'(?m)^JWTAuthentication: .* and 1\.00 queries per request$')
+        self.assertRegex(out.getvalue(), r'(?m)^CachedJWTAuthentication: .* and 0\.00 queries per request$')
+
 
 class UserReviewViewTestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user("test", "test@mailinator.com", "super_secret")
         response = self.client.post('/api/v1/access_token/', {"username": "test", "password": "super_secret"})
         json_data = json.loads(response.content)
@@ -94,10 +214,81 @@ class UserReviewViewTestCase(APITestCase):
         self.assertContains(response, "{0}".format(task2.name))
         self.assertContains(response, "total_spend_time")
 
+    def test_list_users_query_count_does_not_grow_with_data(self):
+        """
+        the user -> project -> task summary tree is loaded with a constant number of queries:
+        user authentication, users, projects with totals, root tasks with continued time, archived root tasks
+        and running tasks.
+        once cached only the authenticated user and the users are read, the authenticated user is not cached
+        with the local memory cache of the tests
+        """
+        self.set_api_authentication()
+        for username in ('test1', 'test2'):
+            user = User.objects.create_user(username, "test@earth.com", "super_secret")
+            for i in range(3):
+                project = mixer.blend(Project, user=user)
+                for j in range(4):
+                    task = mixer.blend(Task, project=project, ended_at=timezone.now())
+                    mixer.blend(Task, project=project, cloned_from=task, chain_root=task)
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/v1/users/')
+        self.assertEqual(200, response.status_code)
+        json_data = json.loads(response.content)
+        self.assertEqual(len(json_data), 3)
+        self.assertEqual(len(json_data[1].get('project_set')[0].get('project_tasks')), 4)
+        with self.assertNumQueries(2):
+            cached_response = self.client.get('/api/v1/users/')
+        self.assertEqual(json.loads(cached_response.content), json_data)
+
+    def test_cached_summaries_add_the_running_task_time(self):
+        self.set_api_authentication()
+        now = timezone.now()
+        task = mixer.blend(Task, project=self.project, name='running', started_at=now - timedelta(minutes=5))
+        mixer.blend(Task, project=self.project, cloned_from=task, chain_root=task, started_at=now - timedelta(hours=1),
+                    ended_at=now - timedelta(minutes=30))
+        response = self.client.get('/api/v1/users/{}/'.format(self.user.id))
+        self.assertEqual(json.loads(response.content)['project_set'][0]['total_spend_time'], '0 hrs 35 mins 0 secs')
+
+        # the authenticated user and the user of the url
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(minutes=10)), \
+                self.assertNumQueries(2):
+            response = self.client.get('/api/v1/users/{}/'.format(self.user.id))
+        project_data = json.loads(response.content)['project_set'][0]
+        self.assertEqual(project_data['total_spend_time'], '0 hrs 45 mins 0 secs')
+        self.assertEqual(project_data['project_tasks'], [{'name': 'running', 'spend_time': '0 hrs 45 mins 0 secs'}])
+
+    def test_summaries_expire_without_a_shared_cache(self):
+        """
+        the data version bumped by other process is not seen with the local memory cache of the tests, the summaries
+        are only kept for LOCAL_CACHE_TIMEOUT
+        """
+        get_summaries([self.user.id])
+        with self.assertNumQueries(0):
+            get_summaries([self.user.id])
+        expired = time.time() + LOCAL_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=expired), \
+                CaptureQueriesContext(connection) as queries:
+            get_summaries([self.user.id])
+        self.assertTrue(queries)
+
+    def test_task_changes_invalidate_the_cached_summaries(self):
+        self.set_api_authentication()
+        task = mixer.blend(Task, project=self.project, started_at=timezone.now() - timedelta(hours=1))
+        self.client.get('/api/v1/users/')
+        self.client.put('/api/v1/tasks/close/{}/'.format(task.id))
+        response = self.client.get('/api/v1/users/')
+        project_data = json.loads(response.content)[0]['project_set'][0]
+        self.assertEqual(project_data['total_spend_time'], '1 hrs 0 mins 0 secs')
+        new_project = mixer.blend(Project, user=self.user)
+        response = self.client.get('/api/v1/users/')
+        self.assertEqual([project['id'] for project in json.loads(response.content)[0]['project_set']],
+                         [self.project.id, new_project.id])
+
 
 class ProjectViewTestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user("test1", "test@mailinator.com", "super_secret")
         response = self.client.post('/api/v1/access_token/', {"username": "test1", "password": "super_secret"})
         json_data = json.loads(response.content)
@@ -135,6 +326,21 @@ class ProjectViewTestCase(APITestCase):
         json_data = json.loads(response.content)
         self.assertEqual(201, response.status_code)
 
+    def test_list_projects_conditional_get(self):
+        self.set_api_authentication()
+        project = mixer.blend(Project, user=self.user)
+        task = mixer.blend(Task, project=project)
+        response = self.client.get('/api/v1/projects/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(304, self.client.get('/api/v1/projects/', HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+        task.close()
+        self.assertEqual(200, self.client.get('/api/v1/projects/', HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+        response = self.client.get('/api/v1/projects/{}/'.format(project.id))
+        self.assertEqual(json.loads(response.content)['id'], project.id)
+        self.assertEqual(304, self.client.get('/api/v1/projects/{}/'.format(project.id),
+                                              HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
     def test_list_projects_for_user(self):
         project1 = mixer.blend(Project, user=self.user)
         self.set_api_authentication()
@@ -171,7 +377,7 @@ class TaskViewTestCase(APITestCase):
         task_response = self.client.get('/api/v1/tasks/')
         json_data = json.loads(task_response.content)
         self.assertEqual(200, task_response.status_code)
-        self.assertEqual(len(json_data), 0)
+        self.assertEqual(json_data, [])
 
     def test_list_user_tasks(self):
         self.set_api_authentication()
@@ -188,6 +394,123 @@ class TaskViewTestCase(APITestCase):
         self.assertIn("is_closed", json_data[0])
         self.assertEquals(json_data[0].get('is_closed'), False)
 
+    def test_fast_task_rows_match_the_task_serializer(self):
+        now = timezone.now().replace(microsecond=0)
+        other_project = mixer.blend(Project, user=self.user)
+        mixer.blend(Task, project=self.project, name='closed', started_at=now - timedelta(hours=3),
+                    ended_at=now - timedelta(hours=1, microseconds=1))
+        mixer.blend(Task, project=self.project, name='paused', started_at=now - timedelta(hours=2),
+                    paused_at=now - timedelta(minutes=30), seconds_paused=120)
+        mixer.blend(Task, project=other_project, name=u'ru\u00efdo "running"', started_at=now - timedelta(days=2))
+        query_set = Task.objects.filter(project__user=self.user).order_by('-started_at', '-id')
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            expected = JSONRenderer().render(TaskSerializer(query_set, many=True).data)
+            rows = task_rows_data(query_set.with_elapsed_seconds().values(*TASK_ROW_FIELDS))
+        self.assertEqual(JSONRenderer().render(rows), expected)
+
+    def test_fast_project_rows_match_the_project_serializer(self):
+        task = mixer.blend(Task, project=self.project, started_at=timezone.now() - timedelta(hours=1))
+        task.close()
+        mixer.blend(Task, project=self.project, chain_root=task, started_at=timezone.now())
+        mixer.blend(Project, user=self.user)
+        projects = list(Project.objects.filter(user=self.user).with_time_totals().with_task_summaries().order_by('id'))
+        self.assertEqual(JSONRenderer().render(projects_data(projects)),
+                         JSONRenderer().render(ProjectSerializer(projects, many=True).data))
+
+    def test_orjson_renderer_matches_the_json_renderer(self):
+        data = {'name': u'ru\u00efdo "1"\u2028\u2029', 'started_at': timezone.now(), 'day': timezone.now().date(),
+                'total': Decimal('1.50'), 'results': [OrderedDict([('id', 1), ('is_closed', False)])], 'next': None}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch('project_tracking.renderers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_user_tasks_as_msgpack(self):
+        self.set_api_authentication()
+        # a closed task, the spend time of a running one could change between the two responses
+        task = mixer.blend(Task, project=self.project, ended_at=timezone.now())
+        response = self.client.get('/api/v1/tasks/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        json_data = json.loads(self.client.get('/api/v1/tasks/').content)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), json_data)
+        self.assertEqual(json_data[0]['id'], task.id)
+
+    def test_create_task_from_msgpack(self):
+        self.set_api_authentication()
+        response = self.client.post('/api/v1/tasks/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(400, response.status_code)
+        data = msgpack.packb({"project_id": self.project.id, "name": "msgpack task"})
+        response = self.client.post('/api/v1/tasks/', data, content_type='application/msgpack')
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(Task.objects.filter(project=self.project, name='msgpack task').exists())
+
+    def test_msgpack_is_not_offered_without_the_library(self):
+        self.set_api_authentication()
+        with mock.patch.object(MessagePackRenderer, 'available', False), \
+                mock.patch.object(MessagePackParser, 'available', False):
+            response = self.client.get('/api/v1/tasks/', HTTP_ACCEPT='application/msgpack')
+            self.assertEqual(406, response.status_code)
+            response = self.client.post('/api/v1/tasks/', msgpack.packb({"name": "task"}),
+                                        content_type='application/msgpack')
+            self.assertEqual(415, response.status_code)
+
+    def test_list_user_tasks_pages_with_a_cursor(self):
+        self.set_api_authentication()
+        started_at = timezone.now()
+        tasks = [mixer.blend(Task, project=self.project, started_at=started_at - timezone.timedelta(minutes=i // 2))
+                 for i in range(7)]
+        expected_ids = [task.id for task in sorted(tasks, key=lambda task: (task.started_at, task.id), reverse=True)]
+        response = self.client.get('/api/v1/tasks/?page_size=3')
+        json_data = json.loads(response.content)
+        self.assertEqual([task['id'] for task in json_data['results']], expected_ids[:3])
+
+        # tasks created after the first page was read do not shift the next pages
+        late_task = mixer.blend(Task, project=self.project, started_at=started_at + timezone.timedelta(minutes=1))
+        listed_ids = [task['id'] for task in json_data['results']]
+        while json_data['next']:
+            json_data = json.loads(self.client.get(json_data['next']).content)
+            listed_ids.extend(task['id'] for task in json_data['results'])
+        self.assertEqual(listed_ids, expected_ids)
+        # the clients that ask for no page keep getting the bare array
+        response = self.client.get('/api/v1/tasks/')
+        self.assertEqual([task['id'] for task in json.loads(response.content)], [late_task.id] + expected_ids)
+
+    def test_list_user_tasks_conditional_get(self):
+        self.set_api_authentication()
+        task = mixer.blend(Task, project=self.project)
+        response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(response['X-Running-Task'], str(task.id))
+        self.assertEqual(response['Last-Modified'], http_date(int(task.updated_at.timestamp())))
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(304, self.client.get('/api/v1/tasks/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                         .status_code)
+        # the ETag wins over the date when both are sent
+        self.assertEqual(200, self.client.get('/api/v1/tasks/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+                                              HTTP_IF_NONE_MATCH='"other"').status_code)
+        # the msgpack representation of the same url has its own ETag
+        msgpack_response = self.client.get('/api/v1/tasks/', HTTP_ACCEPT='application/msgpack',
+                                           HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(200, msgpack_response.status_code)
+        self.assertNotEqual(response['ETag'], msgpack_response['ETag'])
+        self.assertIn('Accept', msgpack_response['Vary'])
+        # the authenticated user and the watermark
+        with self.assertNumQueries(2):
+            not_modified = self.client.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(b'', not_modified.content)
+        self.assertEqual(not_modified['X-Running-Since'], response['X-Running-Since'])
+
+        self.client.put('/api/v1/tasks/pause_resume/{}/'.format(task.id))
+        response_after_pause = self.client.get('/api/v1/tasks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(200, response_after_pause.status_code)
+        self.assertNotIn('X-Running-Task', response_after_pause)
+        self.assertNotEqual(response['ETag'], response_after_pause['ETag'])
+
+        response = self.client.get('/api/v1/tasks/{}/'.format(task.id))
+        self.assertEqual(200, response.status_code)
+        not_modified = self.client.get('/api/v1/tasks/{}/'.format(task.id), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, not_modified.status_code)
+
     def test_create_new_task(self):
         data = {
             "project_id": self.project.id,
@@ -226,6 +549,32 @@ class TaskViewTestCase(APITestCase):
         self.assertIn("error", json_data)
         self.assertIn("there are tasks running,", json_data.get('error'))
 
+    def test_create_new_task_after_closing_the_running_one_with_save(self):
+        self.set_api_authentication()
+        data = {"project_id": self.project.id, "name": "test new task"}
+        response = self.client.post('/api/v1/tasks/', json.dumps(data), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        # e.g. closed through the admin
+        task = Task.objects.get(id=json.loads(response.content)['id'])
+        task.ended_at = timezone.now()
+        task.save()
+        self.assertIsNone(ActiveTask.objects.get(user=self.user).task_id)
+        response = self.client.post('/api/v1/tasks/', json.dumps(data), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, json.loads(response.content)['id'])
+
+    def test_resume_task_when_other_task_is_running(self):
+        self.set_api_authentication()
+        paused_task = mixer.blend(Task, project=self.project, paused_at=timezone.now())
+        running_task = mixer.blend(Task, project=self.project)
+        response = self.client.put('/api/v1/tasks/pause_resume/{0}/'.format(paused_task.id))
+        self.assertEqual(403, response.status_code)
+        self.assertIn("there are tasks running,", json.loads(response.content).get('error'))
+        self.client.put('/api/v1/tasks/pause_resume/{0}/'.format(running_task.id))
+        response = self.client.put('/api/v1/tasks/pause_resume/{0}/'.format(paused_task.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, paused_task.id)
+
     def test_pause_resume_task(self):
         data_task = { "project_id": self.project.id, "name": "test new task" }
         self.set_api_authentication()
@@ -258,6 +607,20 @@ class TaskViewTestCase(APITestCase):
         self.assertIn("error", updated_task_data2)
         self.assertEquals("Task already closed", updated_task_data2.get('error'))
 
+    def test_edit_closed_task_updates_the_project_total(self):
+        self.set_api_authentication()
+        started_at = timezone.now() - timedelta(hours=6)
+        task = mixer.blend(Task, project=self.project, name='edited', started_at=started_at,
+                           ended_at=started_at + timedelta(hours=1))
+        response = self.client.put('/api/v1/tasks/{}/'.format(task.id), {
+            'name': 'edited', 'started_at': started_at.isoformat(),
+            'ended_at': (started_at + timedelta(hours=6)).isoformat()}, format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(json.loads(response.content)['spend_time'], '6 hrs 0 mins 0 secs')
+        project = json.loads(self.client.get('/api/v1/projects/{}/'.format(self.project.id)).content)
+        self.assertEqual(project['total_spend_time'], '6 hrs 0 mins 0 secs')
+        self.assertEqual(project['project_tasks'], [{'name': 'edited', 'spend_time': '6 hrs 0 mins 0 secs'}])
+
     def test_restart_task(self):
         data_task = {"project_id": self.project.id, "name": "test new task"}
         self.set_api_authentication()
@@ -296,6 +659,19 @@ class TaskViewTestCase(APITestCase):
         task_continue_data = json.loads(response3.content)
         continue_task_id = task_continue_data.get('id')
         self.assertNotEqual(new_task_id, continue_task_id)
+        self.assertEqual(Task.objects.get(id=continue_task_id).chain_root_id, new_task_id)
+
+    def test_continue_a_continued_task_keeps_the_chain_root(self):
+        root = mixer.blend(Task, project=self.project, ended_at=timezone.now())
+        child = mixer.blend(Task, project=self.project, cloned_from=root, chain_root=root, ended_at=timezone.now())
+        self.set_api_authentication()
+        response = self.client.post('/api/v1/tasks/continue/', json.dumps({"id": child.id}),
+                                    content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        task = Task.objects.get(id=json.loads(response.content).get('id'))
+        self.assertEqual(task.cloned_from_id, child.id)
+        self.assertEqual(task.chain_root_id, root.id)
+        self.assertEqual(len(self.project.project_tasks), 1)
 
     def test_continue_task_with_no_id_or_incorrect_id(self):
         self.set_api_authentication()
@@ -303,4 +679,584 @@ class TaskViewTestCase(APITestCase):
                                      content_type='application/json')
         self.assertNotEqual(201, response.status_code)
         json_data = json.loads(response.content)
-        self.assertIn("error", json_data)
\ No newline at end of file
+        self.assertIn("error", json_data)
+
+    def bulk_transition(self, operation, task_ids):
+        response = self.client.post('/api/v1/tasks/bulk_transition/',
+                                    json.dumps({"operation": operation, "ids": task_ids}),
+                                    content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        return {result.get('id'): result for result in json.loads(response.content).get('results')}
+
+    def test_bulk_transition_with_invalid_data(self):
+        self.set_api_authentication()
+        response = self.client.post('/api/v1/tasks/bulk_transition/', json.dumps({"operation": "stop", "ids": [1]}),
+                                    content_type='application/json')
+        self.assertEqual(400, response.status_code)
+        task = mixer.blend(Task, project=self.project)
+        for ids in ("a", str(task.id), {str(task.id): 1}, task.id, ["a"], [None]):
+            response = self.client.post('/api/v1/tasks/bulk_transition/', {"operation": "close", "ids": ids},
+                                        format='json')
+            self.assertEqual(400, response.status_code, ids)
+            self.assertEqual(json.loads(response.content), {'error': 'You must provide a list of task ids'})
+        response = self.client.post('/api/v1/tasks/bulk_transition/', {
+            "operation": "close", "ids": [task.id] * (MAX_BULK_TRANSITION_IDS + 1)}, format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(json.loads(response.content),
+                         {'error': 'The list can not have more than {} task ids'.format(MAX_BULK_TRANSITION_IDS)})
+        task.refresh_from_db()
+        self.assertFalse(task.is_closed)
+
+    def test_bulk_pause_and_close_tasks(self):
+        self.set_api_authentication()
+        tasks = [mixer.blend(Task, project=self.project, started_at=timezone.now()) for i in range(3)]
+        closed_task = mixer.blend(Task, project=self.project, ended_at=timezone.now())
+        other_task = mixer.blend(Task, project=mixer.blend(Project))
+        task_ids = [task.id for task in tasks] + [closed_task.id, other_task.id]
+        results = self.bulk_transition('pause', task_ids)
+        self.assertEqual([results[task.id].get('task').get('is_paused') for task in tasks], [True, True, True])
+        self.assertEqual(results[closed_task.id].get('status'), 400)
+        self.assertEqual(results[other_task.id].get('status'), 404)
+        results = self.bulk_transition('pause', task_ids)
+        self.assertEqual(results[tasks[0].id].get('error'), 'the task is already paused')
+        results = self.bulk_transition('close', task_ids)
+        self.assertEqual([results[task.id].get('task').get('is_closed') for task in tasks], [True, True, True])
+        self.assertEqual(results[closed_task.id].get('error'), 'Task already closed')
+        self.assertIsNone(Task.objects.get(id=other_task.id).ended_at)
+        self.assertEqual(Task.objects.filter(project=self.project, ended_at__isnull=True).count(), 0)
+
+    def test_bulk_resume_tasks_resumes_a_single_task(self):
+        self.set_api_authentication()
+        tasks = [mixer.blend(Task, project=self.project, paused_at=timezone.now()) for i in range(2)]
+        results = self.bulk_transition('resume', [task.id for task in tasks])
+        self.assertEqual(results[tasks[0].id].get('status'), 200)
+        self.assertEqual(results[tasks[1].id].get('status'), 403)
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, tasks[0].id)
+        results = self.bulk_transition('resume', [tasks[0].id])
+        self.assertEqual(results[tasks[0].id].get('error'), 'the task is not paused')
+
+    def test_import_tasks_from_ndjson(self):
+        self.set_api_authentication()
+        lines = [
+            {"project": self.project.name, "name": "imported", "started_at": "2020-01-01T08:00:00",
+             "ended_at": "2020-01-01T09:30:00", "seconds_paused": 60},
+            {"project": self.project.name, "started_at": "2020-01-02T08:00:00Z", "ended_at": "2020-01-02T08:30:00Z"},
+            {"project": "unknown", "started_at": "2020-01-02T08:00:00Z", "ended_at": "2020-01-02T08:30:00Z"},
+            {"project": self.project.name, "started_at": "yesterday", "ended_at": "2020-01-02T08:30:00Z"},
+        ]
+        body = ('\n'.join(json.dumps(line) for line in lines) + '\nnot json\n').encode() + b'{"project": "\xff"}\n'
+        response = self.client.post('/api/v1/tasks/import/?batch_size=2', body, content_type='application/x-ndjson')
+        json_data = json.loads(response.content)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(json_data.get('created'), 2)
+        self.assertEqual(json_data.get('errors'), [{'line': 3, 'error': 'Invalid Project'},
+                                                   {'line': 4, 'error': 'Invalid started_at'},
+                                                   {'line': 5, 'error': 'Invalid row'},
+                                                   {'line': 6, 'error': 'Invalid row'}])
+        self.assertEqual(Task.objects.get(name='imported').seconds_paused, 60)
+        self.assertEqual(self.project.total_spend_time, '2 hrs 0 mins 0 secs')
+        self.assertEqual(len(self.project.project_tasks), 2)
+
+    def test_import_tasks_from_csv(self):
+        self.set_api_authentication()
+        body = ('project,name,started_at,ended_at,seconds_paused\r\n'
+                '{0},first,2020-01-01 08:00:00,2020-01-01 09:00:00,0\r\n'
+                '{0},second,2020-01-01 10:00:00,2020-01-01 09:00:00,0\r\n'
+                '{0},caf\xe9,2020-01-01 11:00:00,2020-01-01 12:00:00,0\r\n'
+                '{0},third,2020-01-01 13:00:00,2020-01-01 14:00:00,0\r\n').format(self.project.name)
+        response = self.client.post('/api/v1/tasks/import/', body.encode('latin-1'), content_type='text/csv')
+        json_data = json.loads(response.content)
+        self.assertEqual(json_data.get('created'), 2)
+        self.assertEqual(json_data.get('errors'), [{'line': 3, 'error': 'ended_at must be after started_at'},
+                                                   {'line': 4, 'error': 'Invalid row'}])
+        self.assertEqual(self.project.total_spend_time, '2 hrs 0 mins 0 secs')
+
+    def test_export_tasks(self):
+        self.set_api_authentication()
+        started_at = timezone.make_aware(datetime(2020, 1, 1, 8, 0, 0))
+        closed_task = mixer.blend(Task, project=self.project, name='closed', started_at=started_at,
+                                  ended_at=started_at + timezone.timedelta(minutes=30))
+        mixer.blend(Task, project=mixer.blend(Project), started_at=started_at)
+        response = self.client.get('/api/v1/tasks/export/')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,project,name,started_at,ended_at,paused_at,seconds_paused,elapsed_seconds')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('{},{},closed,'.format(closed_task.id, self.project.name)))
+        self.assertTrue(lines[1].endswith(',0,1800'))
+
+        response = self.client.get('/api/v1/tasks/export/?export_format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{'id': closed_task.id, 'project': self.project.name, 'name': 'closed',
+                                 'started_at': '2020-01-01T13:00:00+00:00', 'ended_at': '2020-01-01T13:30:00+00:00',
+                                 'paused_at': None, 'seconds_paused': 0, 'elapsed_seconds': 1800}])
+
+        response = self.client.get('/api/v1/tasks/export/?export_format=xml')
+        self.assertEqual(400, response.status_code)
+
+    def test_exported_csv_can_be_imported(self):
+        self.set_api_authentication()
+        started_at = timezone.make_aware(datetime(2020, 1, 1, 8, 0, 0))
+        mixer.blend(Task, project=self.project, started_at=started_at,
+                    ended_at=started_at + timezone.timedelta(minutes=30))
+        exported = b''.join(self.client.get('/api/v1/tasks/export/').streaming_content)
+        response = self.client.post('/api/v1/tasks/import/', exported, content_type='text/csv')
+        self.assertEqual(json.loads(response.content).get('created'), 1)
+        self.assertEqual(self.project.total_spend_time, '1 hrs 0 mins 0 secs')
+
+
+class ReportViewTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("test2", "test@mailinator.com", "super_secret")
+        response = self.client.post('/api/v1/access_token/', {"username": "test2", "password": "super_secret"})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + json.loads(response.content).get('access'))
+        self.project = mixer.blend(Project, user=self.user)
+        self.other_project = mixer.blend(Project, user=self.user)
+        # crosses midnight in the configured time zone
+        mixer.blend(Task, project=self.project, started_at=self.local_datetime(2020, 1, 1, 22),
+                    ended_at=self.local_datetime(2020, 1, 2, 2))
+        mixer.blend(Task, project=self.project, started_at=self.local_datetime(2020, 1, 2, 10),
+                    paused_at=self.local_datetime(2020, 1, 2, 10, 30), seconds_paused=600)
+        mixer.blend(Task, project=self.other_project, started_at=self.local_datetime(2020, 1, 31, 23),
+                    ended_at=self.local_datetime(2020, 2, 1, 1))
+        mixer.blend(Task, project=mixer.blend(Project), started_at=self.local_datetime(2020, 1, 1, 8),
+                    ended_at=self.local_datetime(2020, 1, 1, 9))
+
+    def local_datetime(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def get_report(self, **params):
+        response = self.client.get('/api/v1/reports/', params)
+        self.assertEqual(200, response.status_code)
+        return [(row['project_id'], row['bucket'], row['seconds'])
+                for row in json.loads(response.content)['results']]
+
+    def test_daily_report_splits_the_tasks_at_midnight(self):
+        self.assertEqual(self.get_report(start='2020-01-01', end='2020-01-31'), [
+            (self.project.id, '2020-01-01', 7200),
+            (self.project.id, '2020-01-02', 9000),
+            (self.other_project.id, '2020-01-31', 3600),
+        ])
+        response = self.client.get('/api/v1/reports/', {'start': '2020-01-02', 'end': '2020-01-02'})
+        self.assertEqual(json.loads(response.content)['results'], [
+            {'project_id': self.project.id, 'project': self.project.name, 'bucket': '2020-01-02',
+             'seconds': 9000, 'spend_time': '2 hrs 30 mins 0 secs'}])
+
+    def test_weekly_and_monthly_reports(self):
+        self.assertEqual(self.get_report(start='2020-01-01', end='2020-01-31', granularity='week'), [
+            (self.project.id, '2019-12-30', 16200),
+            (self.other_project.id, '2020-01-27', 7200),
+        ])
+        self.assertEqual(self.get_report(start='2020-01-15', end='2020-02-10', granularity='month',
+                                         project=self.other_project.id), [
+            (self.other_project.id, '2020-01-01', 3600),
+            (self.other_project.id, '2020-02-01', 3600),
+        ])
+
+    def test_heatmap(self):
+        response = self.client.get('/api/v1/reports/heatmap/', {'start': '2020-01-01', 'end': '2020-01-02'})
+        self.assertEqual(200, response.status_code)
+        json_data = json.loads(response.content)
+        self.assertEqual(json_data['occupancy'][0][22:], [3600, 3600])
+        self.assertEqual(json_data['occupancy'][1][:3], [3600, 3600, 0])
+        self.assertEqual(json_data['busy_seconds'], 4 * 3600 + 1800)
+        response = self.client.get('/api/v1/reports/heatmap/', {'start': '2018-01-01', 'end': '2020-01-02'})
+        self.assertEqual(400, response.status_code)
+
+    def test_reports_read_the_archived_tasks(self):
+        report = self.get_report(start='2020-01-01', end='2020-02-10', granularity='week')
+        heatmap = json.loads(self.client.get('/api/v1/reports/heatmap/', {'start': '2020-01-01',
+                                                                          'end': '2020-01-02'}).content)
+        export = b''.join(self.client.get('/api/v1/tasks/export/', {'export_format': 'ndjson'}).streaming_content)
+        sync_ids = [task['id'] for task in json.loads(self.client.get('/api/v1/sync/').content)['tasks']]
+        self.assertEqual(archive_tasks(self.local_datetime(2021, 1, 1))['tasks'], 3)
+
+        self.assertEqual(Task.objects.filter(project__user=self.user).count(), 1)
+        self.assertEqual(self.get_report(start='2020-01-01', end='2020-02-10', granularity='week'), report)
+        self.assertEqual(json.loads(self.client.get('/api/v1/reports/heatmap/', {'start': '2020-01-01',
+                                                                                 'end': '2020-01-02'}).content),
+                         heatmap)
+        self.assertEqual(b''.join(self.client.get('/api/v1/tasks/export/', {'export_format': 'ndjson'})
+                                  .streaming_content), export)
+        self.assertEqual([task['id'] for task in json.loads(self.client.get('/api/v1/sync/').content)['tasks']],
+                         sync_ids)
+
+    def test_report_with_invalid_params(self):
+        for params in ({'start': '2020-02-01', 'end': '2020-01-01'}, {'start': 'yesterday'},
+                       {'start': '2020-13-01'}, {'granularity': 'year'}, {'project': 'x'},
+                       {'project': mixer.blend(Project).id},
+                       {'start': '2000-01-01', 'end': '2020-01-01', 'granularity': 'day'}):
+            response = self.client.get('/api/v1/reports/', params)
+            self.assertEqual(400, response.status_code, params)
+        self.client.credentials()
+        self.assertEqual(401, self.client.get('/api/v1/reports/').status_code)
+
+
+class SyncViewTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("test2", "test@mailinator.com", "super_secret")
+        response = self.client.post('/api/v1/access_token/', {"username": "test2", "password": "super_secret"})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + json.loads(response.content).get('access'))
+        self.project = mixer.blend(Project, user=self.user)
+        self.task = mixer.blend(Task, project=self.project)
+        mixer.blend(Task, project=mixer.blend(Project))
+
+    def sync(self, token=None):
+        response = self.client.get('/api/v1/sync/', {'since': token} if token else {})
+        self.assertEqual(200, response.status_code)
+        return json.loads(response.content)
+
+    def test_sync_returns_the_changes_since_the_token(self):
+        json_data = self.sync()
+        self.assertEqual([project['id'] for project in json_data['projects']], [self.project.id])
+        self.assertEqual([task['id'] for task in json_data['tasks']], [self.task.id])
+        self.assertEqual(json_data['tasks'][0]['project'], self.project.id)
+        self.assertFalse(json_data['more'])
+
+        empty = self.sync(json_data['token'])
+        self.assertEqual((empty['projects'], empty['tasks']), ([], []))
+        self.assertEqual(empty['token'], json_data['token'])
+
+        self.client.put('/api/v1/tasks/close/{}/'.format(self.task.id))
+        other_task = mixer.blend(Task, project=self.project, ended_at=timezone.now())
+        changes = self.sync(json_data['token'])
+        self.assertEqual([task['id'] for task in changes['tasks']], [self.task.id, other_task.id])
+        self.assertTrue(changes['tasks'][0]['is_closed'])
+        self.assertEqual(changes['projects'], [])
+
+        other_task_id = other_task.id
+        other_task.delete()
+        deleted = self.sync(changes['token'])
+        self.assertEqual(deleted['deleted'], {'projects': [], 'tasks': [other_task_id]})
+        self.assertEqual(deleted['tasks'], [])
+
+    def test_sync_keeps_tombstones_of_cascade_deletes(self):
+        token = self.sync()['token']
+        project_id, task_id = self.project.id, self.task.id
+        self.project.delete()
+        json_data = self.sync(token)
+        self.assertEqual(json_data['deleted'], {'projects': [project_id], 'tasks': [task_id]})
+
+    def test_track_changes_runs_without_savepoints(self):
+        for upsert in (True, False):
+            with mock.patch('project_tracking.models.can_upsert', return_value=upsert), transaction.atomic(), \
+                    CaptureQueriesContext(connection) as queries:
+                track_changes(self.user.id, tasks=[self.task.id], projects=[self.project.id])
+                track_changes(self.user.id, tasks=[self.task.id], deleted=True)
+            self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql']])
+            if upsert and can_return_rows_from_update(connection):
+                # the counter and the entries, a single statement each
+                self.assertEqual(len(queries), 4)
+            entries = SyncEntry.objects.filter(user=self.user).order_by('kind')
+            self.assertEqual([(entry.kind, entry.object_id, entry.deleted) for entry in entries],
+                             [(SyncEntry.PROJECT, self.project.id, False), (SyncEntry.TASK, self.task.id, True)])
+            self.assertEqual(entries[1].seq, SyncCounter.objects.get(user=self.user).seq)
+
+    def test_deletes_record_the_tombstones_in_bulk(self):
+        def delete_project(tasks_count):
+            project = mixer.blend(Project, user=self.user)
+            root = mixer.blend(Task, project=project, started_at=timezone.now() - timedelta(hours=1),
+                               ended_at=timezone.now())
+            for i in range(tasks_count):
+                mixer.blend(Task, project=project, chain_root=root, cloned_from=root, ended_at=timezone.now())
+            with CaptureQueriesContext(connection) as queries:
+                project.delete()
+            return len(queries)
+
+        self.assertEqual(delete_project(20), delete_project(2))
+        token = self.sync()['token']
+        root = mixer.blend(Task, project=self.project, started_at=timezone.now() - timedelta(hours=2),
+                           ended_at=timezone.now() - timedelta(hours=1))
+        continued = [mixer.blend(Task, project=self.project, chain_root=root, cloned_from=root,
+                                 started_at=timezone.now() - timedelta(minutes=30), ended_at=timezone.now())
+                     for i in range(2)]
+        deleted_ids = sorted([root.id] + [task.id for task in continued])
+        Task.objects.filter(id=root.id).delete()
+        self.assertEqual(self.sync(token)['deleted'], {'projects': [], 'tasks': deleted_ids})
+        self.assertEqual(TimeRollup.objects.get(project=self.project, chain_root=None).closed_seconds, 0)
+        call_command('rebuild_time_rollups', '--verify', stdout=StringIO())
+
+    def test_sync_pages_do_not_split_a_change(self):
+        token = self.sync()['token']
+        seq = int(base64.urlsafe_b64decode(token + '==').decode().split(':')[1])
+        tasks = [mixer.blend(Task, project=self.project, ended_at=timezone.now()) for i in range(3)]
+        with transaction.atomic():
+            track_changes(self.user.id, tasks=[self.task.id] + [task.id for task in tasks[1:]])
+        pages = []
+        more = True
+        while more:
+            projects, page, deleted_projects, deleted_tasks, seq, more = changes_since(self.user, seq, page_size=2)
+            pages.append([task.id for task in page])
+        # the three tasks changed together are returned in the same page
+        self.assertEqual(pages, [[tasks[0].id], sorted([self.task.id, tasks[1].id, tasks[2].id])])
+
+    def test_sync_with_invalid_token(self):
+        for token in ('not a token', 'c2VxOmE'):
+            response = self.client.get('/api/v1/sync/', {'since': token})
+            self.assertEqual(400, response.status_code)
+
+
+class RequestMetricsTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("metrics", "test@mailinator.com", "super_secret")
+        self.client.force_authenticate(self.user)
+        self.project = mixer.blend(Project, user=self.user)
+        mixer.blend(Task, project=self.project)
+
+    def test_server_timing_header_and_log(self):
+        with self.assertLogs('project_tracking.metrics', 'INFO') as logs, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/tasks/')
+        self.assertEqual(200, response.status_code)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="{} queries", serialize;dur=[\d.]+, total;dur=[\d.]+$'.format(
+                             len(queries)))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(record['endpoint'], 'task-list')
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], len(queries))
+        self.assertEqual(record['flags'], [])
+        self.assertGreater(record['serialize_ms'], 0)
+        self.assertGreaterEqual(record['total_ms'], record['serialize_ms'])
+
+    def test_thresholds_flag_the_request(self):
+        with self.settings(REQUEST_METRICS={'QUERY_THRESHOLD': 0, 'DUPLICATE_QUERY_THRESHOLD': 0}), \
+                self.assertLogs('project_tracking.metrics', 'INFO') as logs:
+            self.client.get('/api/v1/tasks/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertEqual(record['flags'], ['queries', 'duplicate_queries'])
+
+    def test_request_metrics_summary_command(self):
+        with self.assertLogs('project_tracking.metrics', 'INFO') as logs:
+            for _ in range(3):
+                self.client.get('/api/v1/tasks/')
+            self.client.get('/api/v1/projects/')
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as log_file:
+            log_file.write('\n'.join('INFO {}'.format(line) for line in logs.output) + '\nnot a record\n')
+            log_file.flush()
+            out = StringIO()
+            call_command('request_metrics_summary', log_file.name, sort='requests', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertRegex(lines[1], r'^GET task-list\s+3 ')
+        self.assertRegex(lines[2], r'^GET project-list\s+1 ')
+
+
+class ProfilingTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.user = User.objects.create_user("profiled", "test@mailinator.com", "super_secret")
+        self.staff = User.objects.create_user("staff", "staff@mailinator.com", "super_secret", is_staff=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_users(self, user, sample_rate=0, **headers):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(AccessToken.for_user(user)))
+        with self.settings(REQUEST_PROFILING={'DIRECTORY': self.directory.name, 'SAMPLE_RATE': sample_rate}):
+            return self.client.get('/api/v1/users/', **headers)
+
+    def test_staff_requests_with_the_header_are_profiled(self):
+        response = self.get_users(self.staff, HTTP_X_PROFILE='1')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response['X-Profile-Id'].startswith('user-list.'))
+        self.assertEqual(os.listdir(self.directory.name), [response['X-Profile-Id']])
+
+        self.get_users(self.staff, HTTP_X_PROFILE='1')
+        out = StringIO()
+        call_command('profile_report', directory=self.directory.name, limit=5, stdout=out)
+        self.assertIn('user-list: 2 requests', out.getvalue())
+        self.assertIn('cumulative', out.getvalue())
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.get_users(self.user, HTTP_X_PROFILE='1'))
+        self.assertNotIn('X-Profile-Id', self.get_users(self.staff))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid', HTTP_X_PROFILE='1')
+        with self.settings(REQUEST_PROFILING={'DIRECTORY': self.directory.name}):
+            self.assertEqual(401, self.client.get('/api/v1/users/').status_code)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_sampled_requests_are_profiled(self):
+        response = self.get_users(self.user, sample_rate=1)
+        self.assertIn('X-Profile-Id', response)
+
+
+class LoadTestTestCase(LiveServerTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_collection_flow(self):
+        flow = build_flow(collection_requests(os.path.join(settings.BASE_DIR,
+                                                           'project_tracker.postman_collection.json')))
+        self.assertEqual([(method, route) for method, route, body in flow], list(FLOW))
+        self.assertEqual(flow[2][2], {'project_id': 1})
+        self.assertEqual(histogram([1, 5, 6, 10000]), [2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1])
+
+    def test_virtual_user_refreshes_the_access_token(self):
+        User.objects.create_user("load", "test@mailinator.com", "super_secret")
+        flow = build_flow(collection_requests(os.path.join(settings.BASE_DIR,
+                                                           'project_tracker.postman_collection.json')))
+        virtual_user = VirtualUser(self.live_server_url, 'load', 'super_secret', flow)
+        virtual_user.login()
+        virtual_user.expires_at = 0
+        virtual_user.run_flow(0)
+        self.assertEqual(virtual_user.iterations, 1)
+        steps = [step for step, status, milliseconds in virtual_user.samples]
+        self.assertEqual(steps[:3], ['POST /api/v1/access_token/', 'POST /api/v1/refresh_token/', 'GET /api/v1/tasks/'])
+        self.assertEqual([status for step, status, milliseconds in virtual_user.samples if status >= 400], [])
+        self.assertFalse(Task.objects.filter(ended_at__isnull=True).exists())
+
+    def test_loadtest_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('loadtest', url=self.live_server_url, concurrency='1', duration=0.5, projects=1, tasks=2,
+                         output=output.name, stdout=StringIO())
+            results = json.load(output)
+        stage = results['stages'][0]
+        self.assertEqual(stage['concurrency'], 1)
+        self.assertGreater(stage['requests'], len(FLOW))
+        self.assertEqual(stage['error_rate'], 0)
+        self.assertEqual(set(stage['steps']), {'POST /api/v1/access_token/'} | {' '.join(step) for step in FLOW})
+        self.assertEqual(sum(stage['histogram']), stage['requests'])
+        self.assertFalse(User.objects.exists())
+
+
+@override_settings(READ_REPLICAS={'DATABASES': ['replica'], 'PIN_SECONDS': 10})
+class ReadReplicaTestCase(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("replica", "test@mailinator.com", "super_secret")
+        self.project = mixer.blend(Project, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache.delete(PRIMARY_PIN_KEY.format(self.user.id))
+
+    def get_queries(self, method, path, data=None):
+        """
+        :return: response and queries sent to the default database and to the replica
+        """
+        with CaptureQueriesContext(connections['default']) as default_queries, \
+                CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = getattr(self.client, method)(path, data, format='json')
+        return response, len(default_queries), len(replica_queries)
+
+    def test_safe_requests_read_from_the_replicas(self):
+        for path in ('/api/v1/tasks/', '/api/v1/projects/', '/api/v1/users/',
+                     '/api/v1/projects/{}/'.format(self.project.id)):
+            response, default_queries, replica_queries = self.get_queries('get', path)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(default_queries, 0, path)
+            self.assertGreater(replica_queries, 0, path)
+
+    def test_users_read_their_writes_from_the_primary(self):
+        response, default_queries, replica_queries = self.get_queries(
+            'post', '/api/v1/tasks/', {'project_id': self.project.id, 'name': 'task'})
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(replica_queries, 0)
+        response, default_queries, replica_queries = self.get_queries('get', '/api/v1/tasks/')
+        self.assertEqual(response.json()[0]['name'], 'task')
+        self.assertEqual(replica_queries, 0)
+
+        # the other users keep reading from the replicas
+        self.client.force_authenticate(mixer.blend(User))
+        self.assertGreater(self.get_queries('get', '/api/v1/tasks/')[2], 0)
+        # and so does the user when the pin expires
+        self.client.force_authenticate(self.user)
+        cache.delete(PRIMARY_PIN_KEY.format(self.user.id))
+        self.assertGreater(self.get_queries('get', '/api/v1/tasks/')[2], 0)
+
+    def test_replica_summaries_are_not_cached_for_pinned_users(self):
+        pin_primary(self.user.id)
+        other_user = mixer.blend(User)
+        self.client.force_authenticate(other_user)
+        response, default_queries, replica_queries = self.get_queries('get', '/api/v1/users/')
+        self.assertEqual(200, response.status_code)
+        self.assertGreater(replica_queries, 0)
+        versions = get_data_versions([self.user.id, other_user.id])
+        self.assertIsNone(cache.get(summaries_key(self.user.id, versions[self.user.id])))
+        self.assertIsNotNone(cache.get(summaries_key(other_user.id, versions[other_user.id])))
+
+    def test_replicas_need_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_read_replicas_cache(None)], ['project_tracking.E001'])
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+            self.assertEqual(check_read_replicas_cache(None), [])
+        with override_settings(READ_REPLICAS={'DATABASES': []}):
+            self.assertEqual(check_read_replicas_cache(None), [])
+
+    def test_router(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Task), 'default')
+        set_replica_reads(True)
+        try:
+            self.assertEqual(router.db_for_read(Task), 'replica')
+            self.assertEqual(router.db_for_write(Task), 'default')
+        finally:
+            set_replica_reads(False)
+        self.assertFalse(router.allow_migrate('replica', 'project_tracking'))
+        self.assertIsNone(router.allow_migrate('default', 'project_tracking'))
+
+
+class ConcurrentTaskStartTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("test3", "test@mailinator.com", "super_secret")
+        self.projects = [mixer.blend(Project, user=self.user) for i in range(8)]
+        response = self.client.post('/api/v1/access_token/', {"username": "test3", "password": "super_secret"})
+        self.access_token = json.loads(response.content).get('access')
+
+    def start_task(self, project):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+        try:
+            return client.post('/api/v1/tasks/', json.dumps({"project_id": project.id}),
+                               content_type='application/json').status_code
+        finally:
+            connection.close()
+
+    def test_start_while_other_start_holds_the_active_task(self):
+        """
+        the race of test_parallel_starts_run_a_single_task on any database, sqlite has no SELECT ... FOR UPDATE:
+        a second start comes while the transaction of the first one holds the ActiveTask pointed to its new task
+        """
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+        status_codes = []
+        track = ActiveTask.track
+
+        def track_and_start(task):
+            track(task)
+            if not status_codes:
+                status_codes.append(client.post('/api/v1/tasks/', json.dumps({"project_id": self.projects[1].id}),
+                                                content_type='application/json').status_code)
+
+        with mock.patch.object(ActiveTask, 'track', side_effect=track_and_start):
+            response = client.post('/api/v1/tasks/', json.dumps({"project_id": self.projects[0].id}),
+                                   content_type='application/json')
+        self.assertEqual(status_codes, [403])
+        self.assertEqual(201, response.status_code)
+        running_tasks = Task.objects.filter(project__user=self.user, ended_at__isnull=True, paused_at__isnull=True)
+        self.assertEqual(list(running_tasks.values_list('id', flat=True)), [json.loads(response.content)['id']])
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, json.loads(response.content)['id'])
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_starts_run_a_single_task(self):
+        with ThreadPoolExecutor(max_workers=len(self.projects)) as executor:
+            status_codes = list(executor.map(self.start_task, self.projects))
+        self.assertEqual(status_codes.count(201), 1)
+        self.assertEqual(status_codes.count(403), len(self.projects) - 1)
+        running_tasks = Task.objects.filter(project__user=self.user, ended_at__isnull=True, paused_at__isnull=True)
+        self.assertEqual(running_tasks.count(), 1)
+        self.assertEqual(ActiveTask.objects.get(user=self.user).task_id, running_tasks.get().id)
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 from django.conf.urls import url, include
-from .views import UserProjectViewset, TasksViewSet, ProjectViewSet
+from .views import UserProjectViewset, TasksViewSet, ProjectViewSet, ReportViewSet, SyncViewSet
 from rest_framework import routers
 
 router = routers.SimpleRouter()
 router.register(r'users', UserProjectViewset)
 router.register(r'tasks', TasksViewSet)
 router.register(r'projects', ProjectViewSet)
+router.register(r'reports', ReportViewSet, basename='reports')
+router.register(r'sync', SyncViewSet, basename='sync')
 
 urlpatterns = [
     url(r'^', include(router.urls)),
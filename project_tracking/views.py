@@ -1,17 +1,34 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import UserProjectSerializer, TaskSerializer, ProjectSerializer
+from .serializers import UserProjectSerializer, TaskSerializer, ProjectSerializer, SyncProjectSerializer, \
+    SyncTaskSerializer, TASK_ROW_FIELDS, projects_data, task_rows_data
 from django.contrib.auth.models import User
-from .models import Task, Project
+from .models import Task, Project, ActiveTask, format_seconds, track_changes
+from .conditional import ConditionalGetMixin
+from .replicas import ReplicaReadMixin
+from .exporters import export_rows, write_csv_rows, write_ndjson_rows
+from .pagination import TaskCursorPagination
+from .heatmap import MAX_HEATMAP_DAYS, user_heatmap
+from .reports import GRANULARITIES, MAX_BUCKETS, bucket_dates, time_report
+from .summaries import get_summaries, summary_projects
+from .sync import changes_since, decode_token, encode_token
+from .importers import DEFAULT_BATCH_SIZE, import_tasks, read_csv_rows, read_ndjson_rows
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
 from django.utils import timezone
 
+MAX_REPORTED_ERRORS = 100
+MAX_BULK_TRANSITION_IDS = 100
 
-class UserProjectViewset(ModelViewSet):
+
+class UserProjectViewset(ReplicaReadMixin, ModelViewSet):
     """
        list:
        Return a list of all the existing users and the related information about projects, tasks, spend time.
@@ -24,13 +41,31 @@ class UserProjectViewset(ModelViewSet):
     http_method_names = ['get', ]
     permission_classes = [IsAuthenticated, ]
 
+    def get_user_data(self, users):
+        """
+        :return: UserProjectSerializer data of the users, built from the cached project summaries
+        """
+        summaries = get_summaries([user.id for user in users])
+        now = timezone.now()
+        return [OrderedDict([('username', user.username),
+                             ('project_set', projects_data(summary_projects(summaries[user.id], now=now)))])
+                for user in users]
+
+    def list(self, request, *args, **kwargs):
+        users = list(self.get_queryset().only('id', 'username'))
+        return Response(data=self.get_user_data(users), status=status.HTTP_200_OK)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(data=self.get_user_data([self.get_object()])[0], status=status.HTTP_200_OK)
+
 
-class ProjectViewSet(ModelViewSet):
+class ProjectViewSet(ReplicaReadMixin, ConditionalGetMixin, ModelViewSet):
     """
        list:
        Return a list of all the existing projects for the authenticated user
        and the related information about projects, tasks, spend time.
        for the tasks that has been continue, the spend time will be added to the original.
+       send the ETag in If-None-Match to get 304 when nothing has changed.
 
        create:
        given a project name, this endpoint will create a new project instance for the authenticated user
@@ -45,24 +80,35 @@ class ProjectViewSet(ModelViewSet):
         validator = ProjectSerializer(data=self.request.data)
         if not validator.is_valid():
             return Response(validator.errors, status=status.HTTP_400_BAD_REQUEST)
-        project = Project.objects.create(user=self.request.user, **validator.data)
+        project = Project.objects.create(user=self.request.user, **validator.validated_data)
         return Response(ProjectSerializer(instance=project).data, status=status.HTTP_201_CREATED)
 
     def list(self, request, *args, **kwargs):
-        query_set = self.get_queryset().filter(user=request.user)
-        page = self.paginate_queryset(query_set)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        def get_response():
+            projects = summary_projects(get_summaries([request.user.id])[request.user.id])
+            page = self.paginate_queryset(projects)
+            if page is not None:
+                return self.get_paginated_response(projects_data(page))
+            return Response(data=projects_data(projects), status=status.HTTP_200_OK)
+
+        watermarks = [Project.objects.filter(user=request.user).watermark(),
+                      Task.objects.filter(project__user=request.user).watermark()]
+        return self.conditional_get(request, watermarks, get_response)
 
-        serializer = self.get_serializer(query_set, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+    def retrieve(self, request, *args, **kwargs):
+        project = self.get_object()
+        watermarks = [{'updated_at': project.updated_at, 'count': 1},
+                      Task.objects.filter(project=project).watermark()]
+        return self.conditional_get(request, watermarks,
+                                    lambda: Response(self.get_serializer(project).data, status=status.HTTP_200_OK))
 
 
-class TasksViewSet(ModelViewSet):
+class TasksViewSet(ReplicaReadMixin, ConditionalGetMixin, ModelViewSet):
     """
        list:
-       Return a list of all the existing tasks for the authenticated user.
+       Return the tasks of the authenticated user, newest first. with the page_size query param the tasks are
+       paginated with a cursor in a next/previous/results envelope (use the next and previous links).
+       send the ETag in If-None-Match to get 304 when nothing has changed.
 
        create:
        Given a projet_id this enpoint will create a new task. some parameters are
@@ -75,20 +121,43 @@ class TasksViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'put']
     serializer_class = TaskSerializer
     queryset = Task.objects.all()
+    pagination_class = TaskCursorPagination
+
+    def user_tasks(self, user):
+        """
+        :return: queryset with the tasks of the user listed by list, newest first
+        """
+        return self.get_queryset().filter(project__user=user).order_by('-started_at', '-id')
+
+    def task_rows(self, query_set):
+        """
+        :return: the rows of the tasks, task_rows_data gives the same output as TaskSerializer from them
+        """
+        return query_set.with_elapsed_seconds().values(*TASK_ROW_FIELDS)
 
     def list(self, request, *args, **kwargs):
-        query_set = self.get_queryset().filter(project__user=request.user).order_by('-started_at')
-        page = self.paginate_queryset(query_set)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        query_set = self.user_tasks(request.user)
+
+        def get_response():
+            rows = self.task_rows(query_set)
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(task_rows_data(page))
+            return Response(data=task_rows_data(rows), status=status.HTTP_200_OK)
 
-        serializer = self.get_serializer(query_set, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return self.conditional_get(request, [query_set.watermark()], get_response)
 
+    def retrieve(self, request, *args, **kwargs):
+        task = self.get_object()
+        watermark = {'updated_at': task.updated_at, 'count': 1,
+                     'running_task': task.id if task.is_running else None,
+                     'running_since': task.started_at if task.is_running else None}
+        return self.conditional_get(request, [watermark],
+                                    lambda: Response(self.get_serializer(task).data, status=status.HTTP_200_OK))
+
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        running_tasks = Task.objects.filter(project__user=request.user, ended_at__isnull=True, paused_at__isnull=True)
-        if running_tasks.exists():
+        if ActiveTask.lock(request.user).task_id:
             return Response({'error': 'there are tasks running, '
                                       'you must pause or close'
                                       ' them in order to create new tasks'}, status=status.HTTP_403_FORBIDDEN)
@@ -133,16 +202,20 @@ class TasksViewSet(ModelViewSet):
         given a task id, this endpoint will pause or unpause a task
         (update the paused_at and seconds_paused fields in the model)
         """
-        try:
-            task = Task.objects.get(id=int(pk), project__user=request.user)
-        except Task.DoesNotExist:
-            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        if not task.is_closed:
-            task.toggle_paused()
-            return Response(TaskSerializer(instance=task).data, status=status.HTTP_200_OK)
-        else:
+        with transaction.atomic():
+            tasks = Task.objects.filter(id=int(pk), project__user=request.user).toggle_paused()
+            if tasks and tasks[0].is_running and not ActiveTask.claim(request.user, tasks[0]):
+                transaction.set_rollback(True)
+                return Response({'error': 'there are tasks running, '
+                                          'you must pause or close'
+                                          ' them in order to resume this task'}, status=status.HTTP_403_FORBIDDEN)
+            track_changes(request.user.id, tasks=[task.id for task in tasks])
+        if tasks:
+            return Response(TaskSerializer(instance=tasks[0]).data, status=status.HTTP_200_OK)
+        elif Task.objects.filter(id=int(pk), project__user=request.user).exists():
             return Response({'error': 'the task is already closed'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
     @action(methods=['put', ], detail=False, url_path='close/(?P<pk>\d+)')
     def close_task(self, request, pk):
@@ -150,15 +223,15 @@ class TasksViewSet(ModelViewSet):
        put:
        given a task id, this endpoint will close task (update ended_at field with the current date and time).
        """
-        try:
-            task = Task.objects.get(id=int(pk), project__user=request.user)
-        except Task.DoesNotExist:
-            return Response({'detail': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
-        if not task.is_closed:
-            task.close()
-            return Response(TaskSerializer(instance=task).data, status=status.HTTP_200_OK)
-        else:
+        with transaction.atomic():
+            tasks = Task.objects.filter(id=int(pk), project__user=request.user).close()
+            track_changes(request.user.id, tasks=[task.id for task in tasks])
+        if tasks:
+            return Response(TaskSerializer(instance=tasks[0]).data, status=status.HTTP_200_OK)
+        elif Task.objects.filter(id=int(pk), project__user=request.user).exists():
             return Response({'error': 'Task already closed'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({'detail': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
     @action(methods=['put', ], detail=False, url_path='restart/(?P<pk>\d+)')
     def restart_task(self, request, pk):
@@ -167,25 +240,29 @@ class TasksViewSet(ModelViewSet):
             given a task id, this endpoint will update the fileds started_at, ended_at,
              seconds_paused and paused_at, to the default values
        """
-        try:
-            task = Task.objects.get(id=int(pk), project__user=request.user)
-        except Task.DoesNotExist:
-            return Response({'detail': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        if not task.is_closed:
-            task.restart()
-            return Response(TaskSerializer(instance=task).data, status=status.HTTP_200_OK)
-        else:
+        with transaction.atomic():
+            tasks = Task.objects.filter(id=int(pk), project__user=request.user).restart()
+            if tasks and not ActiveTask.claim(request.user, tasks[0]):
+                transaction.set_rollback(True)
+                return Response({'error': 'there are tasks running, '
+                                          'you must pause or close'
+                                          ' them in order to restart this task'}, status=status.HTTP_403_FORBIDDEN)
+            track_changes(request.user.id, tasks=[task.id for task in tasks])
+        if tasks:
+            return Response(TaskSerializer(instance=tasks[0]).data, status=status.HTTP_200_OK)
+        elif Task.objects.filter(id=int(pk), project__user=request.user).exists():
             return Response({'error': 'Task already closed'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({'detail': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
     @action(methods=['post', ], detail=False, url_path='continue')
+    @transaction.atomic
     def continue_task(self, request):
         """
             post:
             given a task id, this endpoint will take a closed task and start a new one associated to the closed one
        """
-        running_tasks = Task.objects.filter(project__user=request.user, ended_at__isnull=True, paused_at__isnull=True)
-        if running_tasks.exists():
+        if ActiveTask.lock(request.user).task_id:
             return Response({'error': 'there are tasks running, '
                                       'you must pause or close'
                                       ' them in order to create new tasks'}, status=status.HTTP_403_FORBIDDEN)
@@ -203,11 +280,233 @@ class TasksViewSet(ModelViewSet):
                 'name': task.name,
                 'project': task.project,
                 'cloned_from': task,
+                'chain_root_id': task.chain_root_id or task.id,
                 'started_at': timezone.now()
             }
             new_task = Task.objects.create(**kwargs)
             return Response(TaskSerializer(instance=new_task).data, status=status.HTTP_201_CREATED)
 
+    @action(methods=['post', ], detail=False, url_path='import')
+    def import_tasks(self, request):
+        """
+            post:
+            import closed tasks from the request body, read as csv when the content type is text/csv
+            or as one json object per line otherwise. each row has project (the project name), name (optional),
+            started_at, ended_at and seconds_paused (optional). the rows are inserted in batches of
+            batch_size (query param) and the invalid ones are reported by line number.
+       """
+        try:
+            batch_size = int(request.query_params.get('batch_size', DEFAULT_BATCH_SIZE))
+            if batch_size < 1:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'Invalid batch_size'}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = request.stream or []
+        if request.content_type.startswith('text/csv'):
+            rows = read_csv_rows(lines)
+        else:
+            rows = read_ndjson_rows(lines)
+        created = 0
+        errors = []
+        error_count = 0
+        for batch_created, batch_errors in import_tasks(request.user, rows, batch_size=batch_size):
+            created += batch_created
+            error_count += len(batch_errors)
+            errors.extend({'line': line_number, 'error': error}
+                          for line_number, error in batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        return Response({'created': created, 'error_count': error_count, 'errors': errors},
+                        status=status.HTTP_200_OK)
 
+    @action(methods=['get', ], detail=False, url_path='export')
+    def export_tasks(self, request):
+        """
+            get:
+            stream all the tasks of the authenticated user ordered by id, as csv (default)
+            or as one json object per line with export_format=ndjson.
+       """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format == 'csv':
+            lines = write_csv_rows(export_rows(request.user))
+            content_type = 'text/csv'
+        elif export_format == 'ndjson':
+            lines = write_ndjson_rows(export_rows(request.user))
+            content_type = 'application/x-ndjson'
+        else:
+            return Response({'error': 'The export_format must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="tasks.{}"'.format(export_format)
+        return response
 
+    @action(methods=['post', ], detail=False, url_path='bulk_transition')
+    def bulk_transition(self, request):
+        """
+            post:
+            given a list of task ids and an operation (pause, resume or close), this endpoint will apply the
+            operation to all the tasks and return the result for each id. only one task can be resumed,
+            and at most MAX_BULK_TRANSITION_IDS ids are accepted.
+       """
+        operation = request.data.get('operation')
+        if operation not in ('pause', 'resume', 'close'):
+            return Response({'error': 'The operation must be pause, resume or close'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ids = request.data.get('ids')
+        if isinstance(ids, (list, tuple)) and len(ids) > MAX_BULK_TRANSITION_IDS:
+            return Response({'error': 'The list can not have more than {} task ids'.format(MAX_BULK_TRANSITION_IDS)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        task_ids = []
+        if isinstance(ids, (list, tuple)):
+            try:
+                task_ids = list(OrderedDict.fromkeys(int(task_id) for task_id in ids))
+            except (TypeError, ValueError):
+                pass
+        if not task_ids:
+            return Response({'error': 'You must provide a list of task ids'}, status=status.HTTP_400_BAD_REQUEST)
 
+        tasks = Task.objects.filter(id__in=task_ids, project__user=request.user)
+        with transaction.atomic():
+            if operation == 'pause':
+                updated_tasks = tasks.pause()
+            elif operation == 'close':
+                updated_tasks = tasks.close()
+            else:
+                updated_tasks = []
+                active_task = ActiveTask.lock(request.user)
+                if not active_task.task_id:
+                    paused_tasks = tasks.filter(ended_at__isnull=True, paused_at__isnull=False)
+                    updated_tasks = tasks.filter(id__in=paused_tasks.order_by('id').values('id')[:1]).resume()
+                    if updated_tasks:
+                        active_task.task = updated_tasks[0]
+                        active_task.save(update_fields=['task'])
+            track_changes(request.user.id, tasks=[task.id for task in updated_tasks])
+
+        updated_tasks = {task.id: task for task in updated_tasks}
+        remaining_ids = [task_id for task_id in task_ids if task_id not in updated_tasks]
+        task_states = {}
+        if remaining_ids:
+            task_states = {task_id: (ended_at, paused_at) for task_id, ended_at, paused_at
+                           in tasks.filter(id__in=remaining_ids).values_list('id', 'ended_at', 'paused_at')}
+
+        results = []
+        for task_id in task_ids:
+            if task_id in updated_tasks:
+                results.append({'id': task_id, 'status': status.HTTP_200_OK,
+                                'task': TaskSerializer(instance=updated_tasks[task_id]).data})
+            elif task_id not in task_states:
+                results.append({'id': task_id, 'status': status.HTTP_404_NOT_FOUND, 'error': 'Task not found'})
+            elif task_states[task_id][0]:
+                results.append({'id': task_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                'error': 'Task already closed' if operation == 'close' else 'the task is already closed'})
+            elif operation == 'pause':
+                results.append({'id': task_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                'error': 'the task is already paused'})
+            elif not task_states[task_id][1]:
+                results.append({'id': task_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                'error': 'the task is not paused'})
+            else:
+                results.append({'id': task_id, 'status': status.HTTP_403_FORBIDDEN,
+                                'error': 'there are tasks running, you must pause or close'
+                                         ' them in order to resume this task'})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class ReportViewSet(ViewSet):
+    """
+       list:
+       Return the spend time of the authenticated user per project and per day, week or month,
+       computed in the configured time zone. the query params are
+       *start (optional) first date of the report in format YYYY-MM-DD, by default the first day of the current month
+       *end (optional) last date of the report in format YYYY-MM-DD, by default today
+       *granularity (optional) day (default), week or month
+       *project (optional) id of the project to report
+
+       heatmap:
+       Return the occupancy and overlap seconds of every hour of every day for the authenticated user,
+       with the utilization per day. start and end default to the last 365 days.
+    """
+    permission_classes = [IsAuthenticated, ]
+
+    def list(self, request):
+        today = timezone.localdate()
+        try:
+            start = parse_date(request.query_params.get('start') or today.replace(day=1).isoformat())
+            end = parse_date(request.query_params.get('end') or today.isoformat())
+        except ValueError:
+            start = end = None
+        if start is None or end is None or start > end:
+            return Response({'error': 'Invalid date range, start and end must be dates in format YYYY-MM-DD'
+                                      ' and start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response({'error': 'The granularity must be day, week or month'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(bucket_dates(start, end, granularity)) > MAX_BUCKETS:
+            return Response({'error': 'The date range is too long for the granularity'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        projects = Project.objects.filter(user=request.user)
+        project_id = request.query_params.get('project')
+        if project_id is not None:
+            try:
+                projects = projects.filter(id=int(project_id))
+            except ValueError:
+                projects = projects.none()
+            if not projects.exists():
+                return Response({'error': 'Invalid Project'}, status=status.HTTP_400_BAD_REQUEST)
+            project_id = int(project_id)
+
+        project_names = dict(projects.values_list('id', 'name'))
+        results = [{'project_id': row_project_id,
+                    'project': project_names.get(row_project_id),
+                    'bucket': bucket,
+                    'seconds': seconds,
+                    'spend_time': format_seconds(seconds)}
+                   for row_project_id, bucket, seconds
+                   in time_report(request.user, start, end, granularity=granularity, project_id=project_id)]
+        return Response({'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity,
+                         'results': results}, status=status.HTTP_200_OK)
+
+    @action(methods=['get', ], detail=False, url_path='heatmap')
+    def heatmap(self, request):
+        """
+            get:
+            occupancy and overlap seconds per day and hour of the authenticated user tasks between the dates
+            start and end (format YYYY-MM-DD), with the daily and total utilization.
+       """
+        today = timezone.localdate()
+        try:
+            start = parse_date(request.query_params.get('start') or (today - timedelta(days=364)).isoformat())
+            end = parse_date(request.query_params.get('end') or today.isoformat())
+        except ValueError:
+            start = end = None
+        if start is None or end is None or start > end:
+            return Response({'error': 'Invalid date range, start and end must be dates in format YYYY-MM-DD'
+                                      ' and start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= MAX_HEATMAP_DAYS:
+            return Response({'error': 'The date range is too long for the heatmap'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(user_heatmap(request.user, start, end), status=status.HTTP_200_OK)
+
+
+class SyncViewSet(ViewSet):
+    """
+       list:
+       Return the projects and tasks of the authenticated user created, modified or deleted after the since token
+       (all of them without token) and the token to use in the next sync. when more is true there are more changes
+       and the sync must be repeated with the new token.
+    """
+    permission_classes = [IsAuthenticated, ]
+
+    def list(self, request):
+        try:
+            seq = decode_token(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        projects, tasks, deleted_projects, deleted_tasks, last_seq, more = changes_since(request.user, seq)
+        return Response({
+            'token': encode_token(last_seq),
+            'more': more,
+            'projects': SyncProjectSerializer(projects, many=True).data,
+            'tasks': SyncTaskSerializer(tasks, many=True).data,
+            'deleted': {'projects': deleted_projects, 'tasks': deleted_tasks},
+        }, status=status.HTTP_200_OK)